@@ -5,7 +5,6 @@ from typing import Optional
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from agno.storage.agent.postgres import PostgresAgentStorage
-from agno.tools.mcp import MCPTools
 
 from agents.settings import agent_settings
 from db.session import db_url
@@ -37,6 +36,9 @@ class ImageGeneratorAgent(Agent):
             
         try:
             print("🔗 正在初始化图像生成服务...")
+            # The MCP client stack is only loaded once image generation is actually used
+            from agno.tools.mcp import MCPTools
+
             self._mcp_tools = MCPTools(
                 command="wavespeed-mcp",
                 timeout_seconds=30,
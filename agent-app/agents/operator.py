@@ -1,9 +1,13 @@
 from enum import Enum
 from typing import List, Optional
 
+from agno.agent import Agent
+
+from agents.image_generator import get_image_generator
 from agents.sage import get_sage
 from agents.scholar import get_scholar
-from agents.image_generator import get_image_generator
+from agents.settings import agent_settings
+from utils.pool import InstancePool
 
 
 class AgentType(Enum):
@@ -47,3 +51,73 @@ def get_agent(
         )
     else:
         return get_scholar(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
+
+
+# Per-session state that must not leak from one lease of a pooled agent to the next
+AGENT_SESSION_ATTRIBUTES = (
+    "agent_session",
+    "session_name",
+    "session_state",
+    "team_session_state",
+    "session_metrics",
+    "memory",
+    "images",
+    "videos",
+    "audio",
+    "extra_data",
+    "run_id",
+    "run_input",
+    "run_messages",
+    "run_response",
+    "stream",
+    "stream_intermediate_steps",
+)
+
+agent_pool: InstancePool[Agent] = InstancePool(
+    name="agents",
+    reset_attributes=AGENT_SESSION_ATTRIBUTES,
+    max_idle_per_key=agent_settings.pool_max_idle_per_key,
+)
+
+
+def get_user_context(user_id: Optional[str] = None) -> str:
+    """Returns the additional context the agents add for a user."""
+    if not user_id:
+        return ""
+    return f"<context>You are interacting with the user: {user_id}</context>"
+
+
+def acquire_agent(
+    model_id: str = "gpt-4o",
+    agent_id: Optional[AgentType] = None,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> Agent:
+    """
+    Lend a pooled agent bound to the given user and session.
+
+    The agent is built with `get_agent` on a pool miss and must be handed back with `release_agent`
+    once the run is finished.
+    """
+    return agent_pool.acquire(
+        (agent_id, model_id),
+        lambda: get_agent(model_id=model_id, agent_id=agent_id),
+        user_id=user_id,
+        session_id=session_id,
+        additional_context=get_user_context(user_id),
+    )
+
+
+def rebind_agent(agent: Agent, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Agent:
+    """Bind an agent obtained from `acquire_agent` to another user and session, keeping the lease."""
+    return agent_pool.rebind(
+        agent,
+        user_id=user_id,
+        session_id=session_id,
+        additional_context=get_user_context(user_id),
+    )
+
+
+def release_agent(agent: Agent) -> None:
+    """Return an agent obtained from `acquire_agent` to the pool."""
+    agent_pool.release(agent)
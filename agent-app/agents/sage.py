@@ -5,8 +5,6 @@ import os
 from agno.agent import Agent, AgentKnowledge
 from agno.models.openai import OpenAIChat
 from agno.storage.agent.postgres import PostgresAgentStorage
-from agno.tools.duckduckgo import DuckDuckGoTools
-from agno.vectordb.pgvector import PgVector, SearchType
 
 from agents.settings import agent_settings
 from db.session import db_url
@@ -18,6 +16,10 @@ def get_sage(
     session_id: Optional[str] = None,
     debug_mode: bool = True,
 ) -> Agent:
+    # Imported here rather than at module level, so that importing the API doesn't load them
+    from agno.tools.duckduckgo import DuckDuckGoTools
+    from agno.vectordb.pgvector import PgVector, SearchType
+
     additional_context = ""
     if user_id:
         additional_context += "<context>"
@@ -4,7 +4,6 @@ from typing import Optional
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from agno.storage.agent.postgres import PostgresAgentStorage
-from agno.tools.duckduckgo import DuckDuckGoTools
 
 from agents.settings import agent_settings
 from db.session import db_url
@@ -16,6 +15,8 @@ def get_scholar(
     session_id: Optional[str] = None,
     debug_mode: bool = True,
 ) -> Agent:
+    from agno.tools.duckduckgo import DuckDuckGoTools
+
     additional_context = ""
     if user_id:
         additional_context += "<context>"
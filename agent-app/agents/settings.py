@@ -16,7 +16,10 @@ class AgentSettings(BaseSettings):
     qwen_turbo: str = "qwen-turbo"
     qwen_plus: str = "qwen-plus"
     qwen_max: str = "qwen-max"
-    
+
+    # Maximum number of idle agent instances kept per (agent type, model id)
+    pool_max_idle_per_key: int = 4
+
 
 # Create an TeamSettings object
 agent_settings = AgentSettings()
@@ -0,0 +1,219 @@
+import asyncio
+from collections import deque
+from math import ceil
+from time import monotonic
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from api.settings import api_settings
+from utils.deadline import budget, current_deadline
+
+######################################################
+## Admission control for agent and team runs
+######################################################
+
+
+class AdmissionRejected(Exception):
+    """Raised when a run can't be admitted because the wait queue is full or the wait timed out"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A slot held by an admitted run. `release` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self.controller = controller
+        self.key = key
+        self.admitted_at = monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Limits the number of runs executing at the same time, per key (agent or team id) and overall.
+
+    Runs over the limits wait in a bounded queue. A run is rejected right away when the queue is full,
+    or after waiting `queue_timeout` seconds, with a Retry-After estimate derived from recent run durations.
+
+    Args:
+        max_in_flight: Maximum number of runs executing at the same time
+        max_in_flight_per_key: Default maximum number of runs per key executing at the same time
+        key_limits: Per-key overrides of `max_in_flight_per_key`
+        max_queue: Maximum number of runs waiting for a slot
+        queue_timeout: Maximum number of seconds a run waits for a slot
+        held_window: Seconds of recently finished runs whose durations make up the p95 run duration
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_in_flight_per_key: int,
+        key_limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 64,
+        queue_timeout: float = 30,
+        held_window: float = 300,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_key = max_in_flight_per_key
+        self.key_limits = key_limits or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.held_window = held_window
+
+        self._global = asyncio.Semaphore(max_in_flight)
+        self._per_key: Dict[str, asyncio.Semaphore] = {}
+
+        self.queued = 0
+        self.in_flight = 0
+        self.in_flight_per_key: Dict[str, int] = {}
+        self.admitted = 0
+        self.rejected = 0
+        self._waits: Deque[float] = deque(maxlen=1024)
+        # When recent runs released their slot and how long they held it
+        self._held: Deque[Tuple[float, float]] = deque(maxlen=1024)
+        # Exponentially weighted average of how long runs hold their slot
+        self._avg_run_seconds = 0.0
+
+    def limit(self, key: str) -> int:
+        return self.key_limits.get(key, self.max_in_flight_per_key)
+
+    def _semaphore(self, key: str) -> asyncio.Semaphore:
+        if key not in self._per_key:
+            self._per_key[key] = asyncio.Semaphore(self.limit(key))
+        return self._per_key[key]
+
+    def retry_after(self) -> int:
+        """Estimate in seconds of when a slot frees up for a new run"""
+        if self._avg_run_seconds == 0:
+            return 1
+        estimate = self._avg_run_seconds * (self.queued + 1) / self.max_in_flight
+        return min(60, max(1, ceil(estimate)))
+
+    def run_seconds_p95(self) -> float:
+        """p95 of how long the runs finished in the last `held_window` seconds held their slot, 0 when there are none"""
+        since = monotonic() - self.held_window
+        held = sorted(seconds for at, seconds in self._held if at >= since)
+        return held[int(len(held) * 0.95)] if held else 0.0
+
+    async def _acquire(self, per_key: asyncio.Semaphore) -> None:
+        await per_key.acquire()
+        try:
+            await self._global.acquire()
+        except BaseException:
+            per_key.release()
+            raise
+
+    async def admit(self, key: str) -> Ticket:
+        """
+        Wait for a slot for a run of the given key, at most `queue_timeout` seconds or the remaining budget of the
+        deadline of the request, if shorter.
+
+        Args:
+            key: The agent or team id of the run
+
+        Returns:
+            Ticket: The slot held by the run, to be released when the run is done
+
+        Raises:
+            AdmissionRejected: If the wait queue is full or the wait timed out
+        """
+        per_key = self._semaphore(key)
+        start = monotonic()
+        if per_key.locked() or self._global.locked():
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("Too many runs waiting", self.retry_after())
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._acquire(per_key), timeout=budget(self.queue_timeout))
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise AdmissionRejected("Timed out waiting for a run slot", self.retry_after())
+            finally:
+                self.queued -= 1
+        else:
+            await self._acquire(per_key)
+
+        self._waits.append(monotonic() - start)
+        self.admitted += 1
+        self.in_flight += 1
+        self.in_flight_per_key[key] = self.in_flight_per_key.get(key, 0) + 1
+        return Ticket(self, key)
+
+    def _release(self, ticket: Ticket) -> None:
+        now = monotonic()
+        held = now - ticket.admitted_at
+        self._held.append((now, held))
+        self._avg_run_seconds = held if self._avg_run_seconds == 0 else 0.9 * self._avg_run_seconds + 0.1 * held
+        self.in_flight -= 1
+        self.in_flight_per_key[ticket.key] -= 1
+        self._global.release()
+        self._per_key[ticket.key].release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns queue depth, in-flight runs and wait times"""
+        waits = sorted(self._waits)
+        return {
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "in_flight_per_key": {
+                k: {"in_flight": v, "limit": self.limit(k)} for k, v in self.in_flight_per_key.items()
+            },
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_ms_avg": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "wait_ms_p95": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+            "run_seconds_avg": self._avg_run_seconds,
+            "run_seconds_p95": self.run_seconds_p95(),
+        }
+
+
+admission_controller = AdmissionController(
+    max_in_flight=api_settings.admission_max_in_flight,
+    max_in_flight_per_key=api_settings.admission_max_in_flight_per_agent,
+    key_limits=api_settings.admission_agent_limits,
+    max_queue=api_settings.admission_max_queue,
+    queue_timeout=api_settings.admission_queue_timeout_seconds,
+    held_window=api_settings.degrade_p95_window_seconds,
+)
+
+
+async def admit_run(key: str) -> Ticket:
+    """
+    Wait for a run slot, or reject the request with 429 and a Retry-After header, or with 504 when the deadline of
+    the request passed before the run could start.
+
+    Args:
+        key: The agent or team id of the run
+
+    Returns:
+        Ticket: The slot held by the run
+    """
+    deadline = current_deadline.get()
+    try:
+        ticket = await admission_controller.admit(key)
+    except AdmissionRejected as e:
+        if deadline is not None and deadline.expired:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Deadline exceeded")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if deadline is not None and deadline.expired:
+        # Building the agent and calling the model can't produce anything the client still waits for
+        ticket.release()
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Deadline exceeded")
+    return ticket
@@ -0,0 +1,241 @@
+import hashlib
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import httpx
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from api.settings import api_settings
+from utils.hashring import HashRing
+from utils.log import logger
+
+######################################################
+## Session affinity across nodes and workers
+######################################################
+
+# Header marking a request forwarded to the owner of its session, "node" or "worker", so it's never forwarded twice
+# at the same level
+AFFINITY_HEADER = "X-Session-Affinity"
+
+# Headers describing the connection to the forwarding member, not the request or response itself
+_HOP_HEADERS = {"host", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+def _token(member: Optional[str]) -> str:
+    """Short id of a node or worker in the stream ids of its runs"""
+    return hashlib.sha1(member.encode()).hexdigest()[:8] if member else ""
+
+
+class SessionAffinity:
+    """
+    Routes the requests of a session to the same node and worker, so their in-process state stays warm.
+
+    The owner of a session is found by consistent hashing of its id, first among the nodes, then among the
+    workers of the owning node. A request that arrives elsewhere is forwarded to its owner. Affinity is an
+    optimization only: a member that can't be reached is skipped for `down_seconds` and the request is served
+    where it arrived, and a session that moves to another member after a membership change reloads from storage.
+
+    Streamed runs are kept by the worker running them, so their stream ids name that node and worker, and requests
+    resuming or subscribing to a stream are forwarded there with `route_stream`.
+
+    Args:
+        nodes: Base URLs of the nodes, including this one
+        node: Base URL of this node
+        virtual_nodes: Points per member on the hash rings
+        down_seconds: Seconds an unreachable member is skipped
+        warm_sessions: Number of recently served sessions remembered, to measure the hit rate
+        client: HTTP client used to forward requests
+    """
+
+    def __init__(
+        self,
+        nodes: List[str],
+        node: Optional[str],
+        virtual_nodes: int = 64,
+        down_seconds: float = 30.0,
+        warm_sessions: int = 10000,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.node = node
+        self.nodes = HashRing(nodes, virtual_nodes)
+        self.worker: Optional[str] = None
+        self.workers = HashRing(virtual_nodes=virtual_nodes)
+        self.virtual_nodes = virtual_nodes
+        self.down_seconds = down_seconds
+        self.warm_sessions = warm_sessions
+        self._client = client
+        self._down: Dict[str, float] = {}
+        self._warm: "OrderedDict[str, None]" = OrderedDict()
+        self.local = 0
+        self.forwarded = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+
+    def configure_workers(self, worker: str, workers: List[str]) -> None:
+        """Set the workers of this node and the URL of this worker, once it's started"""
+        self.worker = worker
+        self.workers = HashRing(workers, self.virtual_nodes)
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.nodes) > 1 or len(self.workers) > 1
+
+    def owner(self, session_id: str) -> Dict[str, Optional[str]]:
+        """The node and worker owning a session"""
+        return {"node": self.nodes.lookup(session_id), "worker": self.workers.lookup(session_id)}
+
+    def _target(self, node: Optional[str], worker: Optional[str], hop: Optional[str]) -> Optional[str]:
+        """The member to forward a request owned by a node and worker to, None to serve it here"""
+        if hop is None and self.node is not None:
+            if node is not None and node != self.node and not self._is_down(node):
+                return node
+        if hop != "worker" and self.worker is not None:
+            if worker is not None and worker != self.worker and not self._is_down(worker):
+                return worker
+        return None
+
+    def new_stream_id(self) -> str:
+        """
+        A new stream id, `<node>.<worker>.<uuid>` with the short ids of this node and worker when requests are
+        routed between nodes or workers, a plain uuid otherwise
+        """
+        stream_id = uuid4().hex
+        if not self.enabled:
+            return stream_id
+        return f"{_token(self.node)}.{_token(self.worker)}.{stream_id}"
+
+    def stream_owner(self, stream_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The node and worker running a stream, from its id.
+
+        The worker is only known on the node running the stream, since other nodes don't know its workers.
+        """
+        parts = stream_id.split(".")
+        if len(parts) != 3:
+            return None, None
+        node = next((m for m in self.nodes.members if parts[0] and _token(m) == parts[0]), None)
+        worker = next((m for m in self.workers.members if parts[1] and _token(m) == parts[1]), None)
+        return node, worker
+
+    def _is_down(self, member: str) -> bool:
+        until = self._down.get(member)
+        if until is None:
+            return False
+        if monotonic() >= until:
+            del self._down[member]
+            return False
+        return True
+
+    def touch(self, session_id: str) -> bool:
+        """Record a session served here, returns whether it was served here recently"""
+        warm = session_id in self._warm
+        if warm:
+            self._warm.move_to_end(session_id)
+            self.hits += 1
+        else:
+            self._warm[session_id] = None
+            if len(self._warm) > self.warm_sessions:
+                self._warm.popitem(last=False)
+            self.misses += 1
+        return warm
+
+    async def route(self, request: Request, session_id: Optional[str]) -> Optional[StreamingResponse]:
+        """
+        Forward a request to the owner of its session.
+
+        Returns:
+            The response of the owner, or None when the request is served here. A request served here has whether
+            its session was served here recently in `request.state.session_warm`.
+        """
+        if session_id is None:
+            return None
+        target = None
+        if self.enabled:
+            owner = self.owner(session_id)
+            target = self._target(owner["node"], owner["worker"], request.headers.get(AFFINITY_HEADER))
+        response = await self._forward_or_serve(request, target, f"session {session_id}")
+        if response is None:
+            self.local += 1
+            request.state.session_warm = self.touch(session_id)
+        return response
+
+    async def route_stream(self, request: Request, stream_id: str) -> Optional[StreamingResponse]:
+        """
+        Forward a request resuming or subscribing to a stream to the node and worker running it.
+
+        Returns:
+            The response of the owner, or None when the request is served here
+        """
+        if not self.enabled:
+            return None
+        node, worker = self.stream_owner(stream_id)
+        target = self._target(node, worker, request.headers.get(AFFINITY_HEADER))
+        return await self._forward_or_serve(request, target, f"stream {stream_id}")
+
+    async def _forward_or_serve(
+        self, request: Request, target: Optional[str], what: str
+    ) -> Optional[StreamingResponse]:
+        if target is None:
+            return None
+        try:
+            response = await self._forward(request, target, "node" if target in self.nodes.members else "worker")
+        except httpx.TransportError as e:
+            logger.warning(f"Session affinity: {target} unreachable, serving {what} here: {e}")
+            self._down[target] = monotonic() + self.down_seconds
+            self.failed += 1
+            return None
+        self.forwarded += 1
+        return response
+
+    async def _forward(self, request: Request, target: str, hop: str) -> StreamingResponse:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=api_settings.affinity_connect_timeout))
+        headers = [
+            (k, v) for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS | {AFFINITY_HEADER.lower()}
+        ]
+        headers.append((AFFINITY_HEADER, hop))
+        upstream = await self._client.send(
+            self._client.build_request(
+                request.method,
+                target.rstrip("/") + request.url.path,
+                params=request.query_params.multi_items(),
+                headers=headers,
+                content=await request.body(),
+            ),
+            stream=True,
+        )
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_HEADERS}
+        response_headers[AFFINITY_HEADER] = f"forwarded-{hop}"
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=response_headers,
+            background=BackgroundTask(upstream.aclose),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "node": self.node,
+            "nodes": self.nodes.members,
+            "worker": self.worker,
+            "workers": self.workers.members,
+            "down": [member for member in list(self._down) if self._is_down(member)],
+            "local": self.local,
+            "forwarded": self.forwarded,
+            "failed": self.failed,
+            "warm_hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+session_affinity = SessionAffinity(
+    nodes=api_settings.affinity_nodes,
+    node=api_settings.affinity_node,
+    virtual_nodes=api_settings.affinity_virtual_nodes,
+    down_seconds=api_settings.affinity_member_down_seconds,
+)
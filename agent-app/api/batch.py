@@ -0,0 +1,139 @@
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+
+from api.fair_scheduling import current_tenant
+from utils.log import logger
+from utils.metrics import RunTracker
+
+######################################################
+## Batch execution of run requests
+######################################################
+
+# Marks the end of the output of one worker
+_WORKER_DONE = object()
+
+
+def _result(
+    index: int,
+    runner: Any,
+    response: Any = None,
+    error: Optional[Exception] = None,
+    degradations: Optional[List[str]] = None,
+) -> bytes:
+    result: Dict[str, Any] = {
+        "index": index,
+        "status": "error" if error is not None else "success",
+        "run_id": getattr(response, "run_id", None),
+        "session_id": getattr(response, "session_id", None) or getattr(runner, "session_id", None),
+    }
+    if error is not None:
+        result["error"] = str(error)
+    else:
+        result["content"] = response.content
+    if degradations:
+        result["degraded"] = degradations
+    return orjson.dumps(result, default=str) + b"\n"
+
+
+async def run_batch(
+    runs: Sequence[Any],
+    acquire: Callable[[Any, Any], Any],
+    rebind: Callable[[Any, Any], Any],
+    release: Callable[[Any], None],
+    concurrency: int,
+    kind: Optional[str] = None,
+    target_id: Optional[str] = None,
+    tenant: Optional[Callable[[Any], str]] = None,
+    admit: Optional[Callable[[], Awaitable[Any]]] = None,
+    plan: Optional[Callable[[Any], Tuple[Any, List[str]]]] = None,
+    degrade: Optional[Callable[[Any, List[str]], Callable[[], None]]] = None,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Execute run requests concurrently and yield their results as NDJSON lines, in completion order.
+
+    Each of the `concurrency` workers leases one agent/team per model the first time it needs it and
+    rebinds it to the user and session of every following item, so agent instances and their model
+    clients are reused across the whole batch. Results carry the `index` of their request.
+
+    Every item waits for its own admission slot like a single run, so a batch doesn't take more of the worker than
+    its concurrency, and is degraded under load like a single run. An item that isn't admitted fails on its own.
+
+    Args:
+        runs: Run requests with `message`, `model`, `user_id` and `session_id`
+        acquire: Leases an agent/team bound to a run request, built with the given model
+        rebind: Binds a leased agent/team to another run request
+        release: Returns a leased agent/team to its pool
+        concurrency: Maximum number of runs executing at the same time
+        kind: "agent" or "team", with `target_id` labels the metrics of the runs
+        target_id: The agent or team id
+        tenant: The tenant the model calls of a run request are scheduled for
+        admit: Waits for an admission slot for a run, returns the ticket to release when it's done
+        plan: Chooses the model and the degradations of a run request, its own model and none by default
+        degrade: Applies degradations to a leased agent/team, returns the function restoring it
+    """
+    queue: asyncio.Queue[Tuple[int, Any]] = asyncio.Queue()
+    for item in enumerate(runs):
+        queue.put_nowait(item)
+    # Bounded, so workers wait for slow clients instead of buffering every result
+    results: asyncio.Queue[Any] = asyncio.Queue(maxsize=concurrency)
+
+    async def worker() -> None:
+        leased: Dict[Any, Any] = {}
+        try:
+            while not queue.empty():
+                index, run = queue.get_nowait()
+                runner = ticket = None
+                restore: Optional[Callable[[], None]] = None
+                degradations: List[str] = []
+                if tenant is not None:
+                    current_tenant.set(tenant(run))
+                try:
+                    if admit is not None:
+                        ticket = await admit()
+                except Exception as e:
+                    logger.warning(f"Batch run {index} not admitted: {e}")
+                    await results.put(_result(index, None, error=e))
+                    continue
+                tracker = RunTracker(kind, target_id) if kind is not None and target_id is not None else None
+                try:
+                    model_id, degradations = plan(run) if plan is not None else (run.model, [])
+                    runner = leased.get(model_id)
+                    if runner is None:
+                        runner = leased[model_id] = acquire(run, model_id)
+                    else:
+                        rebind(runner, run)
+                    if degradations and degrade is not None:
+                        restore = degrade(runner, degradations)
+                    response = await runner.arun(run.message, stream=False)
+                    line = _result(index, runner, response=response, degradations=degradations)
+                except Exception as e:
+                    logger.warning(f"Batch run {index} failed: {e}")
+                    line = _result(index, runner, error=e)
+                finally:
+                    if restore is not None:
+                        restore()
+                    if ticket is not None:
+                        ticket.release()
+                if tracker is not None:
+                    tracker.finish(runner)
+                await results.put(line)
+        finally:
+            for runner in leased.values():
+                release(runner)
+        await results.put(_WORKER_DONE)
+
+    workers: List[asyncio.Task] = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(runs))))]
+    try:
+        remaining = len(workers)
+        while remaining:
+            line = await results.get()
+            if line is _WORKER_DONE:
+                remaining -= 1
+                continue
+            yield line
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,295 @@
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Optional, Tuple, Union
+from uuid import uuid4
+
+import orjson
+from agno.agent import Agent
+from agno.run.response import RunEvent
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.settings import api_settings
+from api.streaming import StreamEvent, StreamEventType, coalesced
+
+######################################################
+## Exact-match cache of agent responses
+######################################################
+
+# Size of the content chunks a cached answer is replayed in
+REPLAY_CHUNK_CHARS = 64
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class CachedResponse:
+    """A cached answer of an agent"""
+
+    content: str
+    model: Optional[str]
+    expires_at: float
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a message for cache lookups: case and whitespace are ignored"""
+    return _WHITESPACE.sub(" ", message).strip().casefold()
+
+
+def agent_fingerprint(agent: Agent) -> str:
+    """
+    Hash of the prompt and config of an agent that determine its answers.
+
+    Args:
+        agent: The agent instance
+
+    Returns:
+        str: Hex digest that changes whenever the description, instructions, model settings or tools change
+    """
+    instructions = agent.instructions
+    if callable(instructions):
+        # Instructions built at run time are identified by their function
+        instructions = f"{instructions.__module__}.{instructions.__qualname__}"
+    config = {
+        "description": agent.description,
+        "instructions": instructions,
+        "additional_instructions": getattr(agent, "additional_instructions", None),
+        "expected_output": agent.expected_output,
+        "model": getattr(agent.model, "id", None),
+        "temperature": getattr(agent.model, "temperature", None),
+        "max_tokens": getattr(agent.model, "max_completion_tokens", None),
+        "tools": [getattr(t, "name", type(t).__name__) for t in agent.tools or []],
+    }
+    return hashlib.sha256(orjson.dumps(config, default=str, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def pooled_agent_fingerprint(agent_id: str, model_id: str) -> Optional[str]:
+    """
+    Fingerprint of the config of an agent, from an instance leased from the agent pool.
+
+    Returns:
+        Optional[str]: The fingerprint, or None when the id is not an agent
+    """
+    from agents.operator import AgentType, acquire_agent, release_agent
+
+    try:
+        agent_type = AgentType(agent_id)
+    except ValueError:
+        return None
+    # The instance goes back to the pool, where the run following the lookup picks it up
+    agent = acquire_agent(model_id=model_id, agent_id=agent_type)
+    try:
+        return agent_fingerprint(agent)
+    finally:
+        release_agent(agent)
+
+
+class ResponseCache:
+    """
+    In-process cache of agent answers, keyed by agent id, model, normalized message and agent fingerprint.
+
+    Only agents with a TTL are cached. Entries expire after the TTL of their agent, and the least recently
+    used entries are evicted once `max_entries` is reached.
+
+    Answers are shared by all users asking the same question. The tradeoff: cacheable runs without a session are
+    run anonymously, without the user context and anything the agent would remember about the user, so that no
+    answer addressed to one user is served to another. Agents whose answers should be personal are not cached.
+
+    Args:
+        ttls: TTL in seconds per agent id. Agents without a TTL are not cached.
+        max_entries: Maximum number of cached answers
+        config_fingerprint: Computes the fingerprint of an agent id and model before this process stored an answer
+            of them, so lookups don't wait for the first answer. Without it the fingerprint is learnt from that answer.
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, int],
+        max_entries: int,
+        config_fingerprint: Optional[Callable[[str, str], Optional[str]]] = None,
+    ):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.config_fingerprint = config_fingerprint
+
+        self._lock = Lock()
+        self._entries: "OrderedDict[Tuple[str, str, str, str], CachedResponse]" = OrderedDict()
+        # Fingerprint of the agent config per (agent id, model), computed on first use
+        self._fingerprints: Dict[Tuple[str, str], str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def enabled(self, agent_id: str) -> bool:
+        return self.ttls.get(agent_id, 0) > 0
+
+    def ttl(self, agent_id: str) -> int:
+        return self.ttls.get(agent_id, 0)
+
+    def fingerprint(self, agent_id: str, model_id: str, agent: Optional[Agent] = None) -> Optional[str]:
+        """
+        Returns the fingerprint of an agent config, computed from `agent` when given and remembered otherwise.
+
+        Args:
+            agent_id: The agent id
+            model_id: The model id
+            agent: An instance of the agent, to (re)compute the fingerprint from
+        """
+        if agent is None:
+            fingerprint = self._fingerprints.get((agent_id, model_id))
+            if fingerprint is None and self.config_fingerprint is not None and self.enabled(agent_id):
+                fingerprint = self.config_fingerprint(agent_id, model_id)
+                if fingerprint is not None:
+                    self._fingerprints.setdefault((agent_id, model_id), fingerprint)
+            return fingerprint
+        fingerprint = agent_fingerprint(agent)
+        self._fingerprints[(agent_id, model_id)] = fingerprint
+        return fingerprint
+
+    def get(self, agent_id: str, model_id: str, message: str) -> Optional[CachedResponse]:
+        """
+        Look up the cached answer to a message.
+
+        Args:
+            agent_id: The agent id
+            model_id: The model id of the run
+            message: The user message
+
+        Returns:
+            Optional[CachedResponse]: The cached answer, or None on a miss
+        """
+        fingerprint = self.fingerprint(agent_id, model_id)
+        with self._lock:
+            entry = None
+            if fingerprint is not None:
+                key = (agent_id, model_id, fingerprint, normalize_message(message))
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at <= monotonic():
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                elif entry is not None:
+                    self._entries.move_to_end(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, agent_id: str, model_id: str, message: str, agent: Agent, content: Any) -> None:
+        """
+        Store the answer of a completed run.
+
+        Args:
+            agent_id: The agent id
+            model_id: The model id of the run
+            message: The user message
+            agent: The agent that produced the answer, used to fingerprint its config
+            content: The answer. Only non-empty text answers are cached.
+        """
+        if not self.enabled(agent_id) or not isinstance(content, str) or not content:
+            return
+        fingerprint = self.fingerprint(agent_id, model_id, agent)
+        entry = CachedResponse(
+            content=content,
+            model=getattr(agent.model, "id", model_id),
+            expires_at=monotonic() + self.ttls[agent_id],
+        )
+        key = (agent_id, model_id, fingerprint, normalize_message(message))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all cached answers."""
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the cache counters as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+response_cache = ResponseCache(
+    ttls=api_settings.response_cache_ttls,
+    max_entries=api_settings.response_cache_max_entries,
+    config_fingerprint=pooled_agent_fingerprint,
+)
+
+
+async def store_on_completion(
+    source: AsyncIterator[Any], agent: Agent, store: Callable[[Any], None]
+) -> AsyncGenerator[Any, None]:
+    """
+    Yield from a run stream and cache the answer once the run completed without errors. The partial answers of runs
+    stopped by their deadline are not cached.
+
+    Args:
+        source: The run stream
+        agent: The agent producing the stream
+        store: Caches the content of the final response
+    """
+    failed = False
+    async for item in source:
+        if isinstance(item, StreamEvent) and item.event in (StreamEventType.ERROR, StreamEventType.DEADLINE_EXCEEDED):
+            failed = True
+        yield item
+    if not failed and agent.run_response is not None and agent.run_response.event != RunEvent.run_cancelled.value:
+        store(agent.run_response.content)
+
+
+async def replay(cached: CachedResponse, events: bool) -> AsyncGenerator[Union[StreamEvent, str], None]:
+    """
+    Replay a cached answer in chunks, in the same shape as a live run stream.
+
+    Args:
+        cached: The cached answer
+        events: Replay typed events instead of plain text chunks
+    """
+    run_id = str(uuid4())
+    if events:
+        yield StreamEvent(StreamEventType.RUN_STARTED, {"run_id": run_id, "session_id": None, "model": cached.model})
+    for start in range(0, len(cached.content), REPLAY_CHUNK_CHARS):
+        chunk = cached.content[start : start + REPLAY_CHUNK_CHARS]
+        yield StreamEvent(StreamEventType.CONTENT, {"delta": chunk}) if events else chunk
+    if events:
+        yield StreamEvent(
+            StreamEventType.RUN_COMPLETED,
+            {"run_id": run_id, "session_id": None, "model": cached.model, "metrics": {}},
+        )
+
+
+def cached_response(cached: CachedResponse, stream: bool, events: bool) -> Union[StreamingResponse, JSONResponse]:
+    """
+    Build the response of a cache hit, marked with an `X-Cache: hit` header.
+
+    Args:
+        cached: The cached answer
+        stream: Whether the client asked for a streaming response
+        events: Whether the client asked for typed events
+    """
+    headers = {"X-Cache": "hit"}
+    if stream:
+        return StreamingResponse(coalesced(replay(cached, events)), media_type="text/event-stream", headers=headers)
+    return JSONResponse(cached.content, headers=headers)
@@ -0,0 +1,142 @@
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, List, Optional, Tuple, Union
+
+from agno.agent import Agent
+from agno.team import Team
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.settings import api_settings
+from api.streaming import StreamEvent, StreamEventType, record_cancelled_run, run_events
+from utils.deadline import Deadline, current_deadline
+
+######################################################
+## Deadlines of agent, team and workflow runs
+######################################################
+
+# Header carrying the number of seconds the client waits for the response, e.g. "X-Request-Timeout: 20"
+DEADLINE_HEADER = "X-Request-Timeout"
+# Header set on a response holding the partial answer of a run that ran out of time
+DEADLINE_EXCEEDED_HEADER = "X-Deadline-Exceeded"
+
+
+def parse_timeout(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the seconds of a timeout header, capped by the run_max_timeout_seconds setting.
+
+    Raises:
+        ValueError: If the value is not a positive number
+    """
+    if value is None:
+        return None
+    seconds = float(value)
+    if not seconds > 0:
+        raise ValueError(f"{DEADLINE_HEADER} must be a positive number of seconds")
+    return min(seconds, api_settings.run_max_timeout_seconds)
+
+
+def request_deadline(seconds: Optional[float]) -> Optional[Deadline]:
+    """
+    Start the deadline of a request in the current context, from the seconds its client waits for it, or the
+    run_default_timeout_seconds setting when the client doesn't say. Both transports start their requests with it.
+    """
+    if seconds is None:
+        seconds = api_settings.run_default_timeout_seconds
+    return Deadline(min(seconds, api_settings.run_max_timeout_seconds)) if seconds is not None else None
+
+
+class DeadlineMiddleware:
+    """
+    Start the deadline of every HTTP request, from its X-Request-Timeout header or the run_default_timeout_seconds
+    setting, so every layer serving the request, including workflows run by the playground, sees the same budget.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = next((v for k, v in scope["headers"] if k == DEADLINE_HEADER.lower().encode()), None)
+        try:
+            seconds = parse_timeout(header.decode() if header is not None else None)
+        except ValueError as e:
+            await JSONResponse({"detail": str(e)}, status_code=400)(scope, receive, send)
+            return
+        token = current_deadline.set(None)
+        request_deadline(seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_deadline.reset(token)
+
+
+def run_deadline(timeout: Optional[float]) -> Optional[Deadline]:
+    """
+    The deadline of a run: the one of its request, shortened to the `timeout` field of the run request, if set.
+
+    Args:
+        timeout: Seconds the client waits for the run, from the request body
+    """
+    deadline = current_deadline.get()
+    if timeout is not None and (deadline is None or timeout < deadline.remaining()):
+        deadline = Deadline(min(timeout, api_settings.run_max_timeout_seconds))
+    return deadline
+
+
+async def until_deadline(
+    source: AsyncIterator[Any], runner: Union[Agent, Team], deadline: Deadline, events: bool = True
+) -> AsyncGenerator[Any, None]:
+    """
+    Yield from a run stream until the deadline, then stop the run instead of keeping the worker busy.
+
+    What was streamed so far is the partial answer of the run: it's recorded in the session like the one of a
+    cancelled run, and event streams end with a `deadline_exceeded` event instead of `run_completed`.
+
+    Args:
+        source: The run stream
+        runner: The agent or team producing the stream
+        deadline: The deadline of the run
+        events: Whether the stream carries typed events, plain text streams just end
+    """
+    iterator = source.__aiter__()
+    try:
+        while True:
+            try:
+                # Cancelling the pending read aborts the model request or tool call in progress
+                item = await asyncio.wait_for(iterator.__anext__(), deadline.remaining())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                break
+            yield item
+        record_cancelled_run(runner, reason="deadline exceeded")
+        if events:
+            yield StreamEvent(StreamEventType.DEADLINE_EXCEEDED, {"timeout": deadline.seconds})
+    finally:
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def run_until_deadline(runner: Union[Agent, Team], message: str, deadline: Deadline) -> Tuple[Any, bool]:
+    """
+    Run an agent or team to completion or until the deadline.
+
+    Args:
+        runner: The agent or team to run
+        message: User message to process
+        deadline: The deadline of the run
+
+    Returns:
+        The content of the answer and whether the deadline was exceeded, in which case the content is the text
+        generated until then
+    """
+    deltas: List[str] = []
+    async for event in until_deadline(run_events(runner, message), runner, deadline):
+        if event.event == StreamEventType.CONTENT:
+            deltas.append(event.data["delta"])
+        elif event.event == StreamEventType.DEADLINE_EXCEEDED:
+            return "".join(deltas), True
+    return runner.run_response.content if runner.run_response is not None else "".join(deltas), False
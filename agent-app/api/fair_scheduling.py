@@ -0,0 +1,396 @@
+import asyncio
+import hashlib
+import heapq
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import wraps
+from itertools import count
+from time import monotonic
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+from api.lanes import Lane, LanePolicy, current_lane, lane_policy
+from api.settings import api_settings
+from db.session import SessionLocal
+from db.tables import FairShareTag
+from utils.log import logger
+from utils.metrics import metrics
+
+######################################################
+## Weighted fair scheduling of model calls between tenants
+######################################################
+
+# Header carrying the API key of a request, a bearer token in the Authorization header works too
+API_KEY_HEADER = "X-API-Key"
+# Tenant of the model calls of requests without a user or API key
+ANONYMOUS = "anonymous"
+# Tenant whose row in fair_share_tags holds the virtual time
+VIRTUAL_TIME = ""
+
+# Tenant the model calls of the current context are scheduled for
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=ANONYMOUS)
+
+metrics.gauge("model_calls_queued", "Model calls waiting for their turn, by tenant")
+metrics.histogram("model_call_wait_seconds", "Time model calls waited for their turn, by tenant")
+
+
+def api_key_of(headers: Mapping[str, str]) -> Optional[str]:
+    """The API key of a request, from its X-API-Key header or its bearer token, also in lowercase gRPC metadata"""
+    api_key = headers.get(API_KEY_HEADER) or headers.get(API_KEY_HEADER.lower())
+    if api_key:
+        return api_key
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    return token.strip() or None if scheme.lower() == "bearer" else None
+
+
+def tenant_of(user_id: Optional[str], api_key: Optional[str] = None) -> str:
+    """
+    The tenant of a request: the hash of its API key when tenants are told apart by API key, otherwise its user.
+
+    Returns:
+        "key:<first 16 hex digits of the sha256 of the key>", "user:<user_id>" or "anonymous"
+    """
+    if api_settings.fair_tenant_by == "api_key" and api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return f"user:{user_id}" if user_id else ANONYMOUS
+
+
+def bind_tenant(user_id: Optional[str], headers: Optional[Mapping[str, str]] = None) -> str:
+    """Schedule the model calls of the current context for the tenant of a request"""
+    tenant = tenant_of(user_id, api_key_of(headers) if headers is not None else None)
+    current_tenant.set(tenant)
+    return tenant
+
+
+class LocalFairShareStore:
+    """Virtual finish times of the tenants kept in this process. Thread safe."""
+
+    # Tenants already served up to the virtual time are forgotten past this many tenants
+    MAX_TENANTS = 4096
+
+    def __init__(self):
+        self.virtual_time = 0.0
+        self.finish: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, tenant: str, cost: float) -> float:
+        with self._lock:
+            start = max(self.virtual_time, self.finish.get(tenant, 0.0))
+            self.finish[tenant] = start + cost
+            return start
+
+    def advance(self, tag: float) -> None:
+        with self._lock:
+            self.virtual_time = max(self.virtual_time, tag)
+            if len(self.finish) > self.MAX_TENANTS:
+                self.finish = {t: f for t, f in self.finish.items() if f > self.virtual_time}
+
+    def merge(self, finish: Dict[str, float], virtual_time: float) -> None:
+        """Catch up with the finish times and virtual time of all workers"""
+        with self._lock:
+            self.virtual_time = max(self.virtual_time, virtual_time)
+            for tenant, tag in finish.items():
+                self.finish[tenant] = max(self.finish.get(tenant, 0.0), tag)
+
+
+class FairShareStore:
+    """Virtual finish times of the tenants in the fair_share_tags table, shared by all workers. All methods are blocking."""
+
+    def sync(self, costs: Dict[str, float], virtual_time: float) -> Tuple[Dict[str, float], float]:
+        """
+        Add the cost of the model calls a worker reserved since its last sync to the finish times of their tenants,
+        and move the shared virtual time forward to the virtual time of the worker.
+
+        Args:
+            costs: Cost reserved by each tenant since the last sync
+            virtual_time: The virtual time of the worker
+
+        Returns:
+            The shared finish times of the tenants with calls ahead of the virtual time, and the shared virtual time
+        """
+        table = FairShareTag.__table__
+        statement = postgresql.insert(table).values(tenant=VIRTUAL_TIME, finish=virtual_time, updated_at=func.now())
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.tenant],
+            set_={"finish": func.greatest(table.c.finish, virtual_time), "updated_at": func.now()},
+        ).returning(table.c.finish)
+        with SessionLocal() as sess:
+            shared_time = sess.execute(statement).scalar_one()
+            if costs:
+                # Sorted, so that concurrent syncs of several workers lock the rows in the same order
+                rows = [
+                    {"tenant": t, "finish": shared_time + cost, "updated_at": func.now()}
+                    for t, cost in sorted(costs.items())
+                ]
+                statement = postgresql.insert(table).values(rows)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.tenant],
+                    set_={
+                        "finish": func.greatest(table.c.finish, shared_time) + statement.excluded.finish - shared_time,
+                        "updated_at": func.now(),
+                    },
+                )
+                sess.execute(statement)
+            ahead = sess.execute(select(table.c.tenant, table.c.finish).where(table.c.finish > shared_time)).all()
+            sess.commit()
+        finish = {tenant: tag for tenant, tag in ahead if tenant != VIRTUAL_TIME}
+        return finish, shared_time
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of model calls between tenants, so that one heavy user can't take all the model capacity
+    of the deployment and starve the others.
+
+    At most `capacity` model calls execute at the same time in this process. Each call is tagged with a start
+    time in virtual time (start-time fair queuing): the later of the virtual time and the finish time of the
+    previous call of its tenant, and the tenant's finish time moves on by 1 / weight. When a slot frees up, the
+    waiting call with the smallest tag starts, and the virtual time moves on to its tag. A tenant with many calls
+    in flight has its tags far ahead of the virtual time, so the calls of a tenant arriving later start first, and
+    tenants share the capacity in proportion to their weights. The scheduler is work conserving: a tenant alone
+    gets all the capacity.
+
+    Calls are also scheduled by priority lane: slots are handed to the waiting calls of the highest lane that may
+    start one, within the reserved slots and the throttling of the lanes, see `LanePolicy`.
+
+    Tags are reserved in this process. With a shared store, every `sync_interval` seconds the costs reserved by each
+    tenant are added to its finish time in the store, and the tags of this process catch up with the finish times
+    and virtual time of all workers, so a tenant spreading its calls over all workers is served its share, not its
+    share on every worker. A worker that can't reach the store keeps its own tags and retries after `backoff` seconds.
+
+    Args:
+        capacity: Maximum number of model calls executing at the same time
+        weights: Weight of each tenant, the share of the capacity of a tenant is its weight relative to the others
+        default_weight: Weight of the tenants without one
+        lanes: Reserved slots and throttling of the priority lanes, by default one lane without reservations
+        store: The finish times shared by all workers, None to schedule this process on its own
+        sync_interval: Seconds between two syncs with the store
+        backoff: Seconds the store isn't used after a failed sync
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+        lanes: Optional[LanePolicy] = None,
+        store: Optional[FairShareStore] = None,
+        sync_interval: float = 1.0,
+        backoff: float = 30.0,
+    ):
+        self.capacity = capacity
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.lanes = lanes or LanePolicy()
+        self.store = store
+        self.sync_interval = sync_interval
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self.in_flight_per_lane: Dict[str, int] = {}
+        self.queued: Dict[str, int] = {}
+        self.served: Dict[str, int] = {}
+        self.waited: Dict[str, float] = {}
+        self._waiting: Dict[str, List[Tuple[float, int, asyncio.Future]]] = {lane: [] for lane in self.lanes.order}
+        self._seq = count()
+        self.tags = LocalFairShareStore()
+        # Costs reserved by each tenant since the last sync
+        self._costs: Dict[str, float] = {}
+        self._skip_store_until = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    def weight(self, tenant: str) -> float:
+        return max(self.weights.get(tenant, self.default_weight), 1e-6)
+
+    async def sync(self) -> None:
+        """Exchange the costs reserved in this process for the finish times and virtual time of all workers"""
+        if self.store is None or monotonic() < self._skip_store_until:
+            return
+        costs, self._costs = self._costs, {}
+        try:
+            finish, virtual_time = await asyncio.to_thread(self.store.sync, costs, self.tags.virtual_time)
+        except Exception as e:
+            logger.warning(f"Could not sync the fair share tags, retrying in {self.backoff:.0f}s: {e}")
+            self._skip_store_until = monotonic() + self.backoff
+            for tenant, cost in costs.items():
+                self._costs[tenant] = self._costs.get(tenant, 0.0) + cost
+            return
+        self.tags.merge(finish, virtual_time)
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    def start(self) -> None:
+        """Start syncing with the shared store, if any"""
+        if self.store is not None and self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _lane(self, lane: str) -> str:
+        """The lane of a call, the lowest one for unknown lanes"""
+        return lane if lane in self._waiting else self.lanes.order[-1]
+
+    def _may_start(self, lane: str) -> bool:
+        """Whether a call of a lane may start, given the slots reserved for the other lanes"""
+        running = self.in_flight_per_lane.get(lane, 0)
+        if running >= self.lanes.limit(lane, self.capacity):
+            return False
+        if running < self.lanes.reserved.get(lane, 0):
+            return True
+        held = sum(
+            max(0, self.lanes.reserved.get(other, 0) - self.in_flight_per_lane.get(other, 0))
+            for other in self.lanes.order
+            if other != lane
+        )
+        return self.in_flight + held < self.capacity
+
+    def _dispatch(self) -> None:
+        """Start the waiting calls with the smallest tags of the highest lanes while slots are free"""
+        while self.in_flight < self.capacity:
+            for lane in self.lanes.order:
+                waiting = self._waiting[lane]
+                # Drop the calls whose caller gave up waiting
+                while waiting and waiting[0][2].done():
+                    heapq.heappop(waiting)
+                if waiting and self._may_start(lane):
+                    _, _, future = heapq.heappop(waiting)
+                    self.in_flight += 1
+                    self.in_flight_per_lane[lane] = self.in_flight_per_lane.get(lane, 0) + 1
+                    future.set_result(None)
+                    break
+            else:
+                return
+
+    async def acquire(self, tenant: str, lane: str = Lane.INTERACTIVE) -> None:
+        """Wait for the turn of a model call of a tenant in a lane"""
+        cost = 1.0 / self.weight(tenant)
+        tag = self.tags.reserve(tenant, cost)
+        if self.store is not None:
+            self._costs[tenant] = self._costs.get(tenant, 0.0) + cost
+        start = monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting[self._lane(lane)], (tag, next(self._seq), future))
+        self._dispatch()
+        if not future.done():
+            self.queued[tenant] = self.queued.get(tenant, 0) + 1
+            metrics.add("model_calls_queued", 1, tenant=tenant)
+            try:
+                await future
+            except asyncio.CancelledError:
+                # The slot was handed over just before the cancellation
+                if future.done() and not future.cancelled():
+                    self.release(lane)
+                raise
+            finally:
+                self.queued[tenant] -= 1
+                metrics.add("model_calls_queued", -1, tenant=tenant)
+
+        waited = monotonic() - start
+        self.served[tenant] = self.served.get(tenant, 0) + 1
+        self.waited[tenant] = self.waited.get(tenant, 0.0) + waited
+        metrics.observe("model_call_wait_seconds", waited, tenant=tenant)
+        self.tags.advance(tag)
+
+    def release(self, lane: str = Lane.INTERACTIVE) -> None:
+        self.in_flight -= 1
+        self.in_flight_per_lane[self._lane(lane)] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant: Optional[str] = None, lane: Optional[str] = None) -> AsyncIterator[None]:
+        """Hold a slot for a model call of a tenant in a lane, by default the tenant and lane of the current context"""
+        lane = lane or current_lane.get()
+        await self.acquire(tenant or current_tenant.get(), lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": sum(self.queued.values()),
+            "in_flight_per_lane": self.in_flight_per_lane,
+            "queued_per_lane": {
+                lane: sum(not future.done() for _, _, future in waiting) for lane, waiting in self._waiting.items()
+            },
+            "lanes": self.lanes.stats(),
+            "tenants": {
+                tenant: {
+                    "weight": self.weight(tenant),
+                    "queued": self.queued.get(tenant, 0),
+                    "served": served,
+                    "wait_seconds_avg": self.waited[tenant] / served,
+                }
+                for tenant, served in self.served.items()
+            },
+        }
+
+
+fair_scheduler = FairScheduler(
+    # Unused unless model calls are capped, see instrument_model_calls
+    capacity=api_settings.fair_max_concurrent_model_calls or 0,
+    weights=api_settings.fair_tenant_weights,
+    default_weight=api_settings.fair_default_weight,
+    lanes=lane_policy,
+    store=FairShareStore() if api_settings.fair_share_store == "postgres" else None,
+    sync_interval=api_settings.fair_share_sync_interval_seconds,
+)
+
+
+_model_calls_instrumented = False
+
+
+def instrument_model_calls() -> None:
+    """
+    Schedule the async OpenAI requests of runs through the fair scheduler, for the tenant and in the lane of the
+    current context, and record their latency against the SLO of the lane.
+
+    A streamed request holds its slot until its last chunk, its latency is the time to its first chunk.
+
+    Only the async requests are scheduled, which are the ones of the runs served by the api. The blocking `invoke`
+    and `invoke_stream`, e.g. of workflows run with `run()` in a thread, aren't: they can't wait for a slot without
+    blocking their thread, so they bypass the scheduler and aren't counted in its capacity.
+    """
+    global _model_calls_instrumented
+    if _model_calls_instrumented:
+        return
+    _model_calls_instrumented = True
+
+    from agno.models.openai import OpenAIChat
+
+    ainvoke = OpenAIChat.ainvoke
+    ainvoke_stream = OpenAIChat.ainvoke_stream
+
+    @wraps(ainvoke)
+    async def scheduled_ainvoke(self: OpenAIChat, *args: Any, **kwargs: Any) -> Any:
+        start, lane = monotonic(), current_lane.get()
+        async with fair_scheduler.slot(lane=lane):
+            response = await ainvoke(self, *args, **kwargs)
+        fair_scheduler.lanes.observe(lane, monotonic() - start)
+        return response
+
+    @wraps(ainvoke_stream)
+    async def scheduled_ainvoke_stream(self: OpenAIChat, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        start, lane = monotonic(), current_lane.get()
+        first = True
+        async with fair_scheduler.slot(lane=lane):
+            async for chunk in ainvoke_stream(self, *args, **kwargs):
+                if first:
+                    fair_scheduler.lanes.observe(lane, monotonic() - start)
+                    first = False
+                yield chunk
+
+    OpenAIChat.ainvoke = scheduled_ainvoke  # type: ignore
+    OpenAIChat.ainvoke_stream = scheduled_ainvoke_stream  # type: ignore
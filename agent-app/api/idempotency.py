@@ -0,0 +1,360 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from uuid import uuid4
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.dialects import postgresql
+
+from api.cache import CachedResponse, replay
+from api.settings import api_settings
+from api.run_streams import RunChannel, channel_response
+from api.streaming import StreamEventType, coalesced
+from db.session import SessionLocal
+from db.tables import IdempotencyKey
+from utils.log import logger
+from utils.timing import PhaseTimeline
+
+######################################################
+## Idempotency keys of run requests
+######################################################
+
+# Header carrying the idempotency key of a run request
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class KeyStatus:
+    RUNNING = "running"
+    COMPLETED = "completed"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def request_hash(**fields: Any) -> str:
+    """Hash of the fields of a request that determine its result"""
+    return hashlib.sha256(orjson.dumps(fields, default=str, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class IdempotencyStore:
+    """Persistence of idempotency keys in the idempotency_keys table. All methods are blocking."""
+
+    def begin(
+        self, scope: str, key: str, request_hash: str, owner: str, ttl: float, stale_after: float
+    ) -> Dict[str, Any]:
+        """
+        Claim a key for a request, unless it is already claimed.
+
+        An expired key, or a running key without a heartbeat for `stale_after` seconds, e.g. because its worker
+        died, is claimed again.
+
+        Returns:
+            The key record. The request owns the key when its `owner` is the given owner.
+        """
+        now = _now()
+        values = {
+            "scope": scope,
+            "key": key,
+            "request_hash": request_hash,
+            "status": KeyStatus.RUNNING,
+            "owner": owner,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + timedelta(seconds=ttl),
+        }
+        table = IdempotencyKey.__table__
+        statement = postgresql.insert(table).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={name: statement.excluded[name] for name in values if name not in ("scope", "key")},
+            where=or_(
+                table.c.expires_at < now,
+                and_(table.c.status == KeyStatus.RUNNING, table.c.updated_at < now - timedelta(seconds=stale_after)),
+            ),
+        )
+        with SessionLocal() as sess:
+            sess.execute(statement)
+            sess.commit()
+            record = self._get(sess, scope, key)
+        return record  # type: ignore
+
+    def _get(self, sess: Any, scope: str, key: str) -> Optional[Dict[str, Any]]:
+        row = sess.get(IdempotencyKey, (scope, key), populate_existing=True)
+        if row is None:
+            return None
+        return {
+            "status": row.status,
+            "owner": row.owner,
+            "request_hash": row.request_hash,
+            "result": row.result,
+        }
+
+    def get(self, scope: str, key: str) -> Optional[Dict[str, Any]]:
+        with SessionLocal() as sess:
+            return self._get(sess, scope, key)
+
+    def heartbeat(self, requests: List[Tuple[str, str, str]]) -> None:
+        """Mark the running keys of (scope, key, owner) alive"""
+        with SessionLocal() as sess:
+            for scope, key, owner in requests:
+                sess.execute(
+                    update(IdempotencyKey)
+                    .where(
+                        IdempotencyKey.scope == scope,
+                        IdempotencyKey.key == key,
+                        IdempotencyKey.owner == owner,
+                        IdempotencyKey.status == KeyStatus.RUNNING,
+                    )
+                    .values(updated_at=_now())
+                )
+            sess.commit()
+
+    def complete(self, scope: str, key: str, owner: str, result: Dict[str, Any]) -> None:
+        with SessionLocal() as sess:
+            sess.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.owner == owner)
+                .values(status=KeyStatus.COMPLETED, result=result, updated_at=_now())
+            )
+            sess.commit()
+
+    def release(self, scope: str, key: str, owner: str) -> None:
+        """Drop the key of a request that failed, so that it can be retried"""
+        with SessionLocal() as sess:
+            sess.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.owner == owner,
+                    IdempotencyKey.status == KeyStatus.RUNNING,
+                )
+            )
+            sess.commit()
+
+    def purge(self) -> None:
+        """Delete the expired keys"""
+        with SessionLocal() as sess:
+            sess.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < _now()))
+            sess.commit()
+
+
+@dataclass
+class IdempotentRequest:
+    """A run request carrying an idempotency key"""
+
+    scope: str
+    key: str
+    owner: str
+    # Whether this request runs the key, otherwise it is a retry of the request that does
+    leader: bool
+    record: Dict[str, Any]
+
+
+class IdempotencyKeys:
+    """
+    Makes retried run requests return the result of their first attempt instead of running again.
+
+    The first request with a key runs and stores its result under the key. A retry that arrives while the run
+    is in flight in this process attaches to its event stream. A retry that arrives while it runs in another
+    process waits for the stored result, and a retry that arrives after it finished replays the stored result.
+    A run that failed releases its key, so it can be retried.
+
+    The keys of the runs in flight in this process get a heartbeat every `heartbeat_interval` seconds, however long
+    the runs take. A key is only considered abandoned, e.g. because its worker died, once it missed its heartbeats
+    for `stale_after` seconds, at least three of them.
+
+    Args:
+        store: Persistence of the keys, shared by all processes
+        ttl: Seconds a key and its result are kept
+        stale_after: Seconds without a heartbeat after which a key still running is considered abandoned and can be
+            run again
+        wait_timeout: Maximum seconds a retry waits for a run in another process before it's rejected with 409
+        poll_interval: Seconds between checks of a run in another process
+        heartbeat_interval: Seconds between the heartbeats of the keys of the runs in flight
+    """
+
+    def __init__(
+        self,
+        store: IdempotencyStore,
+        ttl: float,
+        stale_after: float,
+        wait_timeout: float,
+        poll_interval: float = 0.5,
+        heartbeat_interval: float = 30.0,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.stale_after = max(stale_after, 3 * heartbeat_interval)
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+
+        self._channels: Dict[Tuple[str, str], RunChannel] = {}
+        # Leading requests of the runs in flight in this process, whose keys get a heartbeat
+        self._tracked: Dict[Tuple[str, str], IdempotentRequest] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.begun = 0
+        self.attached = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    async def begin(self, kind: str, target_id: str, key: str, request_hash: str) -> IdempotentRequest:
+        """
+        Claim the key of a run request.
+
+        Raises:
+            HTTPException: 422 when the key was used with a different request
+        """
+        scope = f"{kind}:{target_id}"
+        owner = str(uuid4())
+        record = await asyncio.to_thread(self.store.begin, scope, key, request_hash, owner, self.ttl, self.stale_after)
+        if record["request_hash"] != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{IDEMPOTENCY_HEADER} was already used with a different request",
+            )
+        leader = record["owner"] == owner
+        if leader:
+            self.begun += 1
+            if self.begun % 100 == 0:
+                self._background(asyncio.to_thread(self.store.purge))
+        return IdempotentRequest(scope=scope, key=key, owner=owner, leader=leader, record=record)
+
+    def _background(self, coroutine: Any) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _heartbeat_loop(self) -> None:
+        while self._tracked:
+            await asyncio.sleep(self.heartbeat_interval)
+            requests = [(r.scope, r.key, r.owner) for r in self._tracked.values()]
+            if not requests:
+                continue
+            try:
+                await asyncio.to_thread(self.store.heartbeat, requests)
+            except Exception as e:
+                logger.warning(f"Could not record the heartbeat of {IDEMPOTENCY_HEADER}s: {e}")
+        self._heartbeat = None
+
+    def track(self, request: IdempotentRequest, channel: RunChannel) -> None:
+        """
+        Store the result of the run of a leading request once it's done, and keep its key alive until then.
+
+        The run keeps going when the client of the request disconnects, so that its retry gets the result.
+        """
+        self._channels[(request.scope, request.key)] = channel
+        self._tracked[(request.scope, request.key)] = request
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+
+        async def store() -> None:
+            try:
+                events = [event async for event in channel.subscribe()]
+                failed = any(event.event == StreamEventType.ERROR for event in events)
+                if failed or not any(event.event == StreamEventType.RUN_COMPLETED for event in events):
+                    await asyncio.to_thread(self.store.release, request.scope, request.key, request.owner)
+                    return
+                completed = next(event for event in events if event.event == StreamEventType.RUN_COMPLETED)
+                result = {
+                    "content": "".join(e.data["delta"] for e in events if e.event == StreamEventType.CONTENT),
+                    "model": completed.data.get("model"),
+                    "run_id": completed.data.get("run_id"),
+                    "session_id": completed.data.get("session_id"),
+                }
+                await asyncio.to_thread(self.store.complete, request.scope, request.key, request.owner, result)
+            except Exception as e:
+                logger.warning(f"Could not store the result of {IDEMPOTENCY_HEADER} {request.key}: {e}")
+            finally:
+                self._channels.pop((request.scope, request.key), None)
+                self._tracked.pop((request.scope, request.key), None)
+
+        self._background(store())
+
+    async def follow(self, request: IdempotentRequest, timeline: PhaseTimeline) -> Union[RunChannel, CachedResponse]:
+        """
+        Follow the first request of a retry: the channel of its run in flight, or its stored result.
+
+        Raises:
+            HTTPException: 409 when the first request is still running elsewhere after `wait_timeout` seconds,
+                or failed meanwhile
+        """
+        channel = self._channels.get((request.scope, request.key))
+        if channel is not None:
+            self.attached += 1
+            return channel
+
+        record: Optional[Dict[str, Any]] = request.record
+        with timeline.phase("idempotency_wait"):
+            deadline = asyncio.get_running_loop().time() + self.wait_timeout
+            while record is not None and record["status"] == KeyStatus.RUNNING:
+                if asyncio.get_running_loop().time() >= deadline:
+                    break
+                await asyncio.sleep(self.poll_interval)
+                record = await asyncio.to_thread(self.store.get, request.scope, request.key)
+
+        if record is None or record["status"] != KeyStatus.COMPLETED:
+            self.conflicts += 1
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"The request with this {IDEMPOTENCY_HEADER} is still running or failed, retry later",
+                headers={"Retry-After": str(max(1, round(self.poll_interval * 4)))},
+            )
+
+        self.replayed += 1
+        result = record["result"]
+        return CachedResponse(content=result["content"], model=result.get("model"), expires_at=0)
+
+    async def respond(
+        self, request: IdempotentRequest, stream: bool, events: bool, timeline: PhaseTimeline
+    ) -> Union[StreamingResponse, JSONResponse]:
+        """
+        Build the response of a retry: attached to the run in flight, or replaying its stored result.
+
+        Raises:
+            HTTPException: 409 when the first request is still running elsewhere after `wait_timeout` seconds,
+                or failed meanwhile
+        """
+        followed = await self.follow(request, timeline)
+        if isinstance(followed, RunChannel):
+            return await channel_response(
+                followed,
+                stream,
+                events,
+                timeline,
+                headers={"Idempotent-Replayed": "attached"},
+                wait_phase="idempotency_wait",
+            )
+
+        headers = {"Idempotent-Replayed": "true", "Server-Timing": timeline.finish().server_timing()}
+        if stream:
+            return StreamingResponse(
+                coalesced(replay(followed, events)), media_type="text/event-stream", headers=headers
+            )
+        return JSONResponse(followed.content, headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._channels),
+            "begun": self.begun,
+            "attached": self.attached,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+        }
+
+
+idempotency_keys = IdempotencyKeys(
+    store=IdempotencyStore(),
+    ttl=api_settings.idempotency_ttl_seconds,
+    stale_after=api_settings.idempotency_stale_after_seconds,
+    wait_timeout=api_settings.idempotency_wait_timeout_seconds,
+    heartbeat_interval=api_settings.idempotency_heartbeat_interval_seconds,
+)
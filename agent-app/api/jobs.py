@@ -0,0 +1,378 @@
+import asyncio
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import orjson
+from sqlalchemy import and_, func, or_, select, update
+
+from api.fair_scheduling import current_tenant, tenant_of
+from api.lanes import Lane, bind_lane
+from api.settings import api_settings
+from api.streaming import StreamEventType, run_events
+from db.session import SessionLocal
+from db.tables import RunJob
+from utils.log import logger
+from utils.metrics import RunTracker
+
+######################################################
+## Background jobs for long agent and team runs
+######################################################
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _json_safe(value: Any) -> Any:
+    return orjson.loads(orjson.dumps(value, default=str))
+
+
+def job_dict(job: RunJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "model": job.model,
+        "message": job.message,
+        "user_id": job.user_id,
+        "session_id": job.session_id,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobStore:
+    """Persistence of jobs in the run_jobs table. All methods are blocking."""
+
+    def create(
+        self,
+        kind: str,
+        target_id: str,
+        model: str,
+        message: str,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        job = RunJob(
+            id=str(uuid4()),
+            kind=kind,
+            target_id=target_id,
+            model=model,
+            message=message,
+            user_id=user_id,
+            session_id=session_id,
+            status=JobStatus.QUEUED,
+            progress={},
+            attempts=0,
+        )
+        with SessionLocal() as sess:
+            sess.add(job)
+            sess.commit()
+            sess.refresh(job)
+            return job_dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with SessionLocal() as sess:
+            job = sess.get(RunJob, job_id)
+            return job_dict(job) if job is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        with SessionLocal() as sess:
+            rows = sess.execute(select(RunJob.status, func.count()).group_by(RunJob.status)).all()
+            return {status: count for status, count in rows}
+
+    def claim(self, worker_id: str, stale_after: float, max_attempts: int) -> Optional[Dict[str, Any]]:
+        """
+        Claim the oldest queued job, or a running job whose worker stopped sending heartbeats.
+
+        Jobs that were already claimed `max_attempts` times are failed instead of claimed again.
+        """
+        stale_before = _now() - timedelta(seconds=stale_after)
+        stale = and_(RunJob.status == JobStatus.RUNNING, RunJob.heartbeat_at < stale_before)
+        with SessionLocal() as sess:
+            sess.execute(
+                update(RunJob)
+                .where(stale, RunJob.attempts >= max_attempts)
+                .values(status=JobStatus.FAILED, error="Job was abandoned by its worker too often", finished_at=_now())
+            )
+            job = sess.scalars(
+                select(RunJob)
+                .where(or_(RunJob.status == JobStatus.QUEUED, stale))
+                .order_by(RunJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).first()
+            if job is not None:
+                if job.status == JobStatus.RUNNING:
+                    logger.info(f"Re-claiming job {job.id} abandoned by worker {job.worker_id}")
+                job.status = JobStatus.RUNNING
+                job.worker_id = worker_id
+                job.attempts += 1
+                job.started_at = job.heartbeat_at = _now()
+            sess.commit()
+            return job_dict(job) if job is not None else None
+
+    def heartbeat(self, worker_id: str, progress: Dict[str, Dict[str, Any]]) -> None:
+        """Record the progress of the running jobs of a worker and mark them alive"""
+        with SessionLocal() as sess:
+            for job_id, job_progress in progress.items():
+                sess.execute(
+                    update(RunJob)
+                    .where(RunJob.id == job_id, RunJob.worker_id == worker_id, RunJob.status == JobStatus.RUNNING)
+                    .values(progress=job_progress, heartbeat_at=_now())
+                )
+            sess.commit()
+
+    def finish(
+        self,
+        job_id: str,
+        worker_id: str,
+        progress: Dict[str, Any],
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        with SessionLocal() as sess:
+            sess.execute(
+                update(RunJob)
+                .where(RunJob.id == job_id, RunJob.worker_id == worker_id)
+                .values(
+                    status=JobStatus.FAILED if error is not None else JobStatus.SUCCEEDED,
+                    progress=progress,
+                    result=result,
+                    error=error,
+                    finished_at=_now(),
+                )
+            )
+            sess.commit()
+
+    def requeue(self, job_id: str, worker_id: str) -> None:
+        """Hand a running job back to the queue, e.g. when its worker shuts down"""
+        with SessionLocal() as sess:
+            sess.execute(
+                update(RunJob)
+                .where(RunJob.id == job_id, RunJob.worker_id == worker_id, RunJob.status == JobStatus.RUNNING)
+                .values(status=JobStatus.QUEUED, worker_id=None, attempts=RunJob.attempts - 1)
+            )
+            sess.commit()
+
+
+class JobWorker:
+    """
+    Executes queued jobs in the background of an api process, up to `max_concurrency` at a time.
+
+    The concurrency of jobs is independent of the admission limits of interactive runs. Every
+    `heartbeat_interval` seconds the worker records the progress of its jobs, which also marks them alive:
+    jobs without a heartbeat for `stale_after` seconds are re-claimed by any worker, so a job survives
+    the restart of its worker.
+
+    An idle worker checks the queue less and less often, doubling its wait from `poll_interval` up to
+    `idle_poll_interval`, so idle processes barely touch the database. A job submitted to the process wakes
+    its worker right away, jobs submitted to other processes are picked up within `idle_poll_interval`.
+
+    Args:
+        store: Persistence of the jobs
+        max_concurrency: Maximum number of jobs executing at the same time
+        poll_interval: Seconds between checks for new jobs right after the queue ran empty
+        idle_poll_interval: Maximum seconds between checks for new jobs of an idle worker
+        heartbeat_interval: Seconds between progress updates
+        stale_after: Seconds without heartbeat after which a running job is re-claimed
+        max_attempts: Maximum number of times a job is claimed before it's failed
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        max_concurrency: int,
+        poll_interval: float = 1.0,
+        idle_poll_interval: float = 30.0,
+        heartbeat_interval: float = 5.0,
+        stale_after: float = 60.0,
+        max_attempts: int = 3,
+    ):
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.idle_poll_interval = max(poll_interval, idle_poll_interval)
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}-{uuid4().hex[:8]}"
+
+        self._runners: Dict[str, Tuple[Callable[[Dict[str, Any]], Any], Callable[[Any], None]]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Set by submitted jobs, so an idle worker claims them right away
+        self._wake = asyncio.Event()
+        self.claims = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def register(self, kind: str, acquire: Callable[[Dict[str, Any]], Any], release: Callable[[Any], None]) -> None:
+        """
+        Register how to run jobs of a kind.
+
+        Args:
+            kind: The job kind, e.g. "agent" or "team"
+            acquire: Leases an agent/team bound to a job
+            release: Returns a leased agent/team to its pool
+        """
+        self._runners[kind] = (acquire, release)
+
+    async def submit(
+        self,
+        kind: str,
+        target_id: str,
+        model: str,
+        message: str,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Persist a new job and return it"""
+        job = await asyncio.to_thread(self.store.create, kind, target_id, model, message, user_id, session_id)
+        self._wake.set()
+        return job
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._claim_loop()), asyncio.create_task(self._heartbeat_loop())]
+        logger.info(f"Job worker {self.worker_id} started with concurrency {self.max_concurrency}")
+
+    async def stop(self) -> None:
+        """Stop claiming jobs and hand the running ones back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    async def _claim_loop(self) -> None:
+        wait = self.poll_interval
+        while True:
+            if len(self._running) >= self.max_concurrency:
+                await asyncio.wait(self._running.values(), return_when=asyncio.FIRST_COMPLETED)
+                continue
+            # Cleared before the claim, so a job submitted during the claim still wakes the worker
+            self._wake.clear()
+            self.claims += 1
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.worker_id, self.stale_after, self.max_attempts)
+            except Exception as e:
+                logger.warning(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                    wait = self.poll_interval
+                except asyncio.TimeoutError:
+                    wait = min(wait * 2, self.idle_poll_interval)
+                continue
+            wait = self.poll_interval
+            task = asyncio.create_task(self._execute(job))
+            self._running[job["job_id"]] = task
+            task.add_done_callback(lambda _, job_id=job["job_id"]: self._running.pop(job_id, None))
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if not self._progress:
+                continue
+            try:
+                await asyncio.to_thread(self.store.heartbeat, self.worker_id, dict(self._progress))
+            except Exception as e:
+                logger.warning(f"Could not record the heartbeat of jobs: {e}")
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        job_id = job["job_id"]
+        progress = {"events": 0, "tool_calls": 0, "member_responses": 0, "content_chars": 0}
+        runner, release = None, None
+        result, error = None, None
+        tracker = RunTracker(job["kind"], job["target_id"])
+        tenant = tenant_of(job.get("user_id"))
+        current_tenant.set(tenant)
+        bind_lane(Lane.BACKGROUND, tenant=tenant)
+        try:
+            self._progress[job_id] = progress
+            # e.g. a job queued by an older deploy, failed right away instead of being re-claimed until max_attempts
+            if job["kind"] not in self._runners:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+            acquire, release = self._runners[job["kind"]]
+            runner = acquire(job)
+            async for event in run_events(runner, job["message"]):
+                progress["events"] += 1
+                progress["last_event"] = event.event
+                if event.event == StreamEventType.TOOL_STARTED:
+                    progress["tool_calls"] += 1
+                elif event.event == StreamEventType.MEMBER_RESPONSE:
+                    progress["member_responses"] += 1
+                elif event.event == StreamEventType.CONTENT:
+                    progress["content_chars"] += len(event.data["delta"])
+                    tracker.token()
+            final = runner.run_response
+            result = _json_safe(
+                {
+                    "content": final.content if final is not None else None,
+                    "run_id": final.run_id if final is not None else None,
+                    "session_id": runner.session_id,
+                    "metrics": final.metrics if final is not None else None,
+                }
+            )
+        except asyncio.CancelledError:
+            logger.info(f"Job {job_id} interrupted, returning it to the queue")
+            await asyncio.to_thread(self.store.requeue, job_id, self.worker_id)
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job_id} failed: {e}")
+            error = str(e) or type(e).__name__
+        finally:
+            tracker.finish(runner)
+            self._progress.pop(job_id, None)
+            if runner is not None:
+                release(runner)
+
+        if error is not None:
+            self.failed += 1
+        else:
+            self.succeeded += 1
+        try:
+            await asyncio.to_thread(self.store.finish, job_id, self.worker_id, progress, result, error)
+        except Exception as e:
+            # The job is re-claimed once its heartbeat is stale
+            logger.warning(f"Could not record the result of job {job_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "max_concurrency": self.max_concurrency,
+            "running": len(self._running),
+            "claims": self.claims,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+job_worker = JobWorker(
+    store=JobStore(),
+    max_concurrency=api_settings.job_max_concurrency,
+    poll_interval=api_settings.job_poll_interval_seconds,
+    idle_poll_interval=api_settings.job_idle_poll_interval_seconds,
+    heartbeat_interval=api_settings.job_heartbeat_interval_seconds,
+    stale_after=api_settings.job_stale_after_seconds,
+    max_attempts=api_settings.job_max_attempts,
+)
@@ -0,0 +1,158 @@
+from collections import deque
+from contextvars import ContextVar
+from time import monotonic
+from typing import Any, Deque, Dict, Mapping, Optional, Tuple
+
+from api.settings import api_settings
+from utils.metrics import metrics
+
+######################################################
+## Priority lanes of interactive, background and bulk traffic
+######################################################
+
+# Header lowering the priority of a request, e.g. "X-Priority: bulk" for an evaluation script
+PRIORITY_HEADER = "X-Priority"
+
+metrics.histogram("model_call_latency_seconds", "Time from the start of a model call to its first chunk, by lane")
+metrics.gauge("model_calls_over_slo", "Model calls slower than the latency SLO of their lane, by lane")
+
+
+class Lane:
+    """Names of the priority lanes, from the highest priority to the lowest"""
+
+    # Chat from the UI, someone is waiting for the answer: REST, WebSocket and gRPC runs
+    INTERACTIVE = "interactive"
+    # Background jobs and workflows
+    BACKGROUND = "background"
+    # Batch runs and evaluations
+    BULK = "bulk"
+
+    ALL = (INTERACTIVE, BACKGROUND, BULK)
+
+
+# Lane the model calls of the current context are scheduled in
+current_lane: ContextVar[str] = ContextVar("current_lane", default=Lane.INTERACTIVE)
+
+
+def lane_of(default: str, headers: Optional[Mapping[str, str]] = None, tenant: Optional[str] = None) -> str:
+    """
+    The lane of a request: the lane of its route, lowered by its X-Priority header or by the lane of its tenant.
+
+    A request can only lower its priority, so a batch can't jump ahead of interactive chat.
+    """
+    lanes = [default]
+    if headers is not None:
+        lanes.append(headers.get(PRIORITY_HEADER) or headers.get(PRIORITY_HEADER.lower()) or default)
+    if tenant is not None:
+        lanes.append(api_settings.lane_tenants.get(tenant, default))
+    return max((lane for lane in lanes if lane in Lane.ALL), key=Lane.ALL.index)
+
+
+def bind_lane(default: str, headers: Optional[Mapping[str, str]] = None, tenant: Optional[str] = None) -> str:
+    """Schedule the model calls of the current context in the lane of a request"""
+    lane = lane_of(default, headers, tenant)
+    current_lane.set(lane)
+    return lane
+
+
+class LanePolicy:
+    """
+    Reserved concurrency, latency SLOs and throttling of the priority lanes of model calls.
+
+    Each lane has slots reserved out of the model capacity, which the other lanes never take, so interactive chat
+    always finds a free slot quickly even when a batch keeps all the others busy. The latency of a model call is
+    measured from its start, including its wait for a slot, to its first chunk, and compared to the SLO of its lane.
+
+    When the p95 latency of the recent calls of the first lane rises to `throttle_at` times its SLO, the lanes with
+    that threshold are throttled down to their reserved slots, so they free up the shared ones. Bulk has the lowest
+    threshold and is throttled first, then background. Running calls aren't interrupted, throttled lanes start fewer
+    new calls until the latency is back under the threshold.
+
+    Args:
+        reserved: Slots reserved for each lane
+        slo_seconds: Latency SLO of each lane
+        throttle_at: Latency of the first lane relative to its SLO at which each lane is throttled
+        window: Seconds of recent calls of the first lane whose p95 latency drives the throttling
+        order: The lanes from the highest priority to the lowest
+    """
+
+    def __init__(
+        self,
+        reserved: Optional[Dict[str, int]] = None,
+        slo_seconds: Optional[Dict[str, float]] = None,
+        throttle_at: Optional[Dict[str, float]] = None,
+        window: float = 60.0,
+        order: Tuple[str, ...] = Lane.ALL,
+    ):
+        self.reserved = reserved or {}
+        self.slo_seconds = slo_seconds or {}
+        self.throttle_at = throttle_at or {}
+        self.window = window
+        self.order = order
+
+        self.calls: Dict[str, int] = {}
+        self.over_slo: Dict[str, int] = {}
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {lane: deque(maxlen=1024) for lane in order}
+        self._pressure = 0.0
+        self._pressure_at = float("-inf")
+
+    def p95(self, lane: str) -> float:
+        """p95 latency of the calls of a lane in the window"""
+        since = monotonic() - self.window
+        latencies = sorted(seconds for at, seconds in self._latencies.get(lane, ()) if at >= since)
+        return latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+
+    def pressure(self) -> float:
+        """p95 latency of the first lane relative to its SLO, recomputed at most every second"""
+        now = monotonic()
+        if now - self._pressure_at >= 1.0:
+            slo = self.slo_seconds.get(self.order[0])
+            self._pressure = self.p95(self.order[0]) / slo if slo else 0.0
+            self._pressure_at = now
+        return self._pressure
+
+    def is_throttled(self, lane: str) -> bool:
+        threshold = self.throttle_at.get(lane)
+        return threshold is not None and self.pressure() >= threshold
+
+    def limit(self, lane: str, capacity: int) -> int:
+        """Maximum number of calls of a lane executing at the same time, its reserved slots when throttled"""
+        return max(1, self.reserved.get(lane, 0)) if self.is_throttled(lane) else capacity
+
+    def observe(self, lane: str, seconds: float) -> None:
+        """Record the latency of a model call of a lane"""
+        self.calls[lane] = self.calls.get(lane, 0) + 1
+        metrics.observe("model_call_latency_seconds", seconds, lane=lane)
+        slo = self.slo_seconds.get(lane)
+        if slo is not None and seconds > slo:
+            self.over_slo[lane] = self.over_slo.get(lane, 0) + 1
+            metrics.add("model_calls_over_slo", 1, lane=lane)
+        if lane in self._latencies:
+            self._latencies[lane].append((monotonic(), seconds))
+            if lane == self.order[0]:
+                # The next scheduling decision sees the new latency
+                self._pressure_at = float("-inf")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pressure": self.pressure(),
+            "lanes": {
+                lane: {
+                    "reserved": self.reserved.get(lane, 0),
+                    "slo_seconds": self.slo_seconds.get(lane),
+                    "latency_p95_seconds": self.p95(lane),
+                    "calls": self.calls.get(lane, 0),
+                    "over_slo": self.over_slo.get(lane, 0),
+                    "throttled": self.is_throttled(lane),
+                }
+                for lane in self.order
+            },
+        }
+
+
+lane_policy = LanePolicy(
+    reserved=api_settings.lane_reserved_model_calls,
+    slo_seconds=api_settings.lane_latency_slo_seconds,
+    throttle_at=api_settings.lane_throttle_at,
+    window=api_settings.lane_latency_window_seconds,
+)
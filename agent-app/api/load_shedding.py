@@ -0,0 +1,236 @@
+import asyncio
+from copy import copy
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from agno.tools.function import Function
+from agno.tools.toolkit import Toolkit
+
+from api.admission import AdmissionController, admission_controller
+from api.settings import api_settings
+from utils.log import logger
+from utils.metrics import metrics
+
+######################################################
+## Degradation of runs under load
+######################################################
+
+# Header listing the degradations applied to a run, e.g. "X-Degraded: history,optional_tools"
+DEGRADED_HEADER = "X-Degraded"
+
+metrics.gauge("runs_degraded", "Runs served with a degradation, by degradation")
+
+
+class Degradation:
+    """Names of the degradations, from the one costing the least answer quality to the one costing the most"""
+
+    # Fewer past runs of the session are sent to the model
+    HISTORY = "history"
+    # Tools that only enrich an answer, e.g. web search in Sage, are not offered to the model
+    OPTIONAL_TOOLS = "optional_tools"
+    # The run uses a cheaper, faster model
+    CHEAPER_MODEL = "cheaper_model"
+
+
+def _runners(runner: Any) -> Iterator[Any]:
+    """An agent, or a team and all its members"""
+    yield runner
+    for member in getattr(runner, "members", None) or []:
+        yield from _runners(member)
+
+
+def _without(tools: Sequence[Any], names: Sequence[str]) -> List[Any]:
+    """The tools without the functions of the given names, toolkits left without functions are dropped"""
+    kept: List[Any] = []
+    for tool in tools:
+        if isinstance(tool, Toolkit):
+            functions = {name: f for name, f in tool.functions.items() if name not in names}
+            if not functions:
+                continue
+            if len(functions) < len(tool.functions):
+                # The toolkit is shared by every lease of the runner, the copy only serves this run
+                tool = copy(tool)
+                tool.functions = functions
+        elif isinstance(tool, Function):
+            if tool.name in names:
+                continue
+        elif getattr(tool, "__name__", None) in names:
+            continue
+        kept.append(tool)
+    return kept
+
+
+class LoadShedder:
+    """
+    Degrades runs progressively as the load of this worker rises, so it serves slightly worse answers fast instead
+    of timing out everyone.
+
+    The pressure of the worker is the highest of three signals, each relative to the value at which the worker is
+    considered saturated: the depth of the admission queue, the lag of the event loop and the p95 duration of recent
+    runs. Each degradation starts at its own pressure threshold, so they are applied one after the other as the
+    pressure rises, and lifted in reverse order as it falls.
+
+    Args:
+        controller: The admission controller whose queue depth and run durations are read
+        queue_depth: Admission queue depth at pressure 1
+        loop_lag: Event loop lag in seconds at pressure 1
+        p95_seconds: p95 run duration in seconds at pressure 1
+        thresholds: Pressure at which each degradation starts, by degradation name
+        cheaper_models: Model id each model id is switched to by the cheaper_model degradation
+        optional_tools: Names of the tool functions of each agent or team dropped by the optional_tools degradation
+        history_runs: Number of past runs sent to the model with the history degradation
+        lag_interval: Seconds between two samples of the event loop lag
+    """
+
+    def __init__(
+        self,
+        controller: AdmissionController,
+        queue_depth: float,
+        loop_lag: float,
+        p95_seconds: float,
+        thresholds: Dict[str, float],
+        cheaper_models: Optional[Dict[str, str]] = None,
+        optional_tools: Optional[Dict[str, List[str]]] = None,
+        history_runs: int = 1,
+        lag_interval: float = 0.5,
+    ):
+        self.controller = controller
+        self.queue_depth = queue_depth
+        self.loop_lag = loop_lag
+        self.p95_seconds = p95_seconds
+        self.thresholds = thresholds
+        self.cheaper_models = cheaper_models or {}
+        self.optional_tools = optional_tools or {}
+        self.history_runs = history_runs
+        self.lag_interval = lag_interval
+
+        # Recent lag of the event loop, the peaks decay over a few samples
+        self.lag = 0.0
+        self.planned = 0
+        self.degraded: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def signals(self) -> Dict[str, float]:
+        """Each load signal relative to its saturation value"""
+        return {
+            "queue": self.controller.queued / self.queue_depth if self.queue_depth > 0 else 0.0,
+            "loop_lag": self.lag / self.loop_lag if self.loop_lag > 0 else 0.0,
+            "p95": self.controller.run_seconds_p95() / self.p95_seconds if self.p95_seconds > 0 else 0.0,
+        }
+
+    def pressure(self) -> float:
+        return max(self.signals().values())
+
+    def plan(self, target_id: str, model_id: str) -> Tuple[str, List[str]]:
+        """
+        Choose the degradations of a run about to start.
+
+        Only degradations that change something for the agent or team are chosen, e.g. cheaper_model only when
+        a cheaper model is configured for the requested one.
+
+        Args:
+            target_id: The agent or team id of the run
+            model_id: The requested model id
+
+        Returns:
+            The model id to build the agent or team with, and the names of the degradations to apply to it
+        """
+        self.planned += 1
+        pressure = self.pressure()
+        degradations = []
+        for name, threshold in sorted(self.thresholds.items(), key=lambda item: item[1]):
+            if pressure < threshold:
+                break
+            if name == Degradation.CHEAPER_MODEL:
+                cheaper = self.cheaper_models.get(model_id)
+                if cheaper is None or cheaper == model_id:
+                    continue
+                model_id = cheaper
+            elif name == Degradation.OPTIONAL_TOOLS and not self.optional_tools.get(target_id):
+                continue
+            degradations.append(name)
+        for name in degradations:
+            self.degraded[name] = self.degraded.get(name, 0) + 1
+            metrics.add("runs_degraded", 1, id=target_id, degradation=name)
+        if degradations:
+            logger.info(f"Degrading run of {target_id} at pressure {pressure:.2f}: {', '.join(degradations)}")
+        return model_id, degradations
+
+    def apply(self, runner: Any, target_id: str, degradations: List[str]) -> Callable[[], None]:
+        """
+        Apply the degradations of a run to a leased agent or team and its members.
+
+        Returns:
+            Restores the runner as it was, to be called before it goes back to its pool
+        """
+        undo: List[Tuple[Any, str, Any]] = []
+
+        def set_attr(target: Any, name: str, value: Any) -> None:
+            undo.append((target, name, getattr(target, name)))
+            setattr(target, name, value)
+
+        for member in _runners(runner):
+            if Degradation.HISTORY in degradations:
+                # Agents read num_history_responses over num_history_runs when it's set
+                for name in ("num_history_runs", "num_history_responses"):
+                    value = getattr(member, name, None)
+                    if value is not None and value > self.history_runs:
+                        set_attr(member, name, self.history_runs)
+            if Degradation.OPTIONAL_TOOLS in degradations and getattr(member, "tools", None):
+                tools = _without(member.tools, self.optional_tools.get(target_id, []))
+                if len(tools) != len(member.tools) or any(a is not b for a, b in zip(tools, member.tools)):
+                    set_attr(member, "tools", tools)
+                    # The tools sent to the model are computed once per instance, force them to be recomputed
+                    set_attr(member, "_tools_for_model", None)
+                    set_attr(member, "_functions_for_model", None)
+
+        def restore() -> None:
+            for target, name, value in reversed(undo):
+                setattr(target, name, value)
+
+        return restore
+
+    async def _sample_lag(self) -> None:
+        while True:
+            start = monotonic()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, monotonic() - start - self.lag_interval)
+            self.lag = lag if lag > self.lag else 0.7 * self.lag + 0.3 * lag
+
+    def start(self) -> None:
+        """Start sampling the event loop lag"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_lag())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pressure": self.pressure(),
+            "signals": self.signals(),
+            "loop_lag_ms": self.lag * 1000,
+            "thresholds": self.thresholds,
+            "planned": self.planned,
+            "degraded": self.degraded,
+        }
+
+
+load_shedder = LoadShedder(
+    admission_controller,
+    queue_depth=api_settings.degrade_queue_depth,
+    loop_lag=api_settings.degrade_loop_lag_ms / 1000,
+    p95_seconds=api_settings.degrade_p95_seconds,
+    thresholds=api_settings.degrade_thresholds if api_settings.degrade_enabled else {},
+    cheaper_models=api_settings.degrade_cheaper_models,
+    optional_tools=api_settings.degrade_optional_tools,
+    history_runs=api_settings.degrade_history_runs,
+)
+
+
+def degraded_headers(degradations: List[str]) -> Dict[str, str]:
+    """The response headers recording the degradations of a run"""
+    return {DEGRADED_HEADER: ",".join(degradations)} if degradations else {}
@@ -1,8 +1,51 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from api.deadline import DeadlineMiddleware
+from api.fair_scheduling import fair_scheduler, instrument_model_calls
+from api.jobs import job_worker
+from api.load_shedding import load_shedder
+from api.routes.playground import playground_agents, playground_teams
 from api.routes.v1_router import v1_router
 from api.settings import api_settings
+from db.session import db_engine
+from utils.deadline import instrument_deadlines
+from utils.metrics import instrument_db_pools
+from utils.registry import warm_up
+from utils.timing import instrument_runners
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Start the background job worker, the load sampler, the fair share sync and the gRPC server with the app and stop
+    them on shutdown
+    """
+
+    if api_settings.jobs_enabled:
+        job_worker.start()
+    if api_settings.degrade_enabled:
+        load_shedder.start()
+    if api_settings.fair_max_concurrent_model_calls is not None:
+        fair_scheduler.start()
+    if api_settings.playground_warmup:
+        warm_up(playground_agents + playground_teams)
+    grpc_server = None
+    if api_settings.grpc_enabled:
+        # grpcio is an optional dependency, only imported when the gRPC server is enabled
+        from api.rpc.server import start_grpc_server
+
+        grpc_server = await start_grpc_server(api_settings.grpc_port)
+    yield
+    if grpc_server is not None:
+        await grpc_server.stop(api_settings.grpc_shutdown_grace_seconds)
+    await load_shedder.stop()
+    await fair_scheduler.stop()
+    if api_settings.jobs_enabled:
+        await job_worker.stop()
 
 
 def create_app() -> FastAPI:
@@ -15,12 +58,23 @@ def create_app() -> FastAPI:
         docs_url="/docs" if api_settings.docs_enabled else None,
         redoc_url="/redoc" if api_settings.docs_enabled else None,
         openapi_url="/openapi.json" if api_settings.docs_enabled else None,
+        lifespan=lifespan,
     )
 
+    # Measure the wait for database connections
+    instrument_db_pools()
+    instrument_runners()
+    # Bound tool calls, model requests and database statements by the deadline of the request
+    instrument_deadlines(api_settings.run_min_db_timeout_ms, db_engine)
+    # Share the model capacity fairly between users or API keys and by priority lane, when it is capped
+    if api_settings.fair_max_concurrent_model_calls is not None:
+        instrument_model_calls()
+
     # Add v1 router
     app.include_router(v1_router)
 
     # Add Middlewares
+    app.add_middleware(DeadlineMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=list(api_settings.cors_origin_list) if api_settings.cors_origin_list else ["*"],
@@ -1,12 +1,25 @@
 from enum import Enum
-from typing import AsyncGenerator, List, Optional
+from typing import List, Optional
 
 from agno.agent import Agent
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Request, WebSocket, status
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-
-from agents.operator import AgentType, get_agent, get_available_agents
+from pydantic import BaseModel, Field
+
+from agents.operator import AgentType, acquire_agent, get_available_agents, rebind_agent, release_agent
+from api.admission import admit_run
+from api.affinity import session_affinity
+from api.batch import run_batch
+from api.deadline import run_deadline
+from api.fair_scheduling import api_key_of, bind_tenant, tenant_of
+from api.idempotency import IDEMPOTENCY_HEADER
+from api.jobs import job_worker
+from api.lanes import Lane, bind_lane
+from api.load_shedding import load_shedder
+from api.run_flow import RunSpec, RunTarget, run_response, start_run
+from api.run_streams import LAST_EVENT_ID_HEADER, resume_response
+from api.settings import api_settings
+from api.websocket import SessionSocket, reload_session_from_storage
 from utils.log import logger
 
 ######################################################
@@ -15,6 +28,27 @@ from utils.log import logger
 
 agents_router = APIRouter(prefix="/agents", tags=["Agents"])
 
+job_worker.register(
+    "agent",
+    acquire=lambda job: acquire_agent(
+        model_id=job["model"],
+        agent_id=AgentType(job["target_id"]),
+        user_id=job["user_id"],
+        session_id=job["session_id"],
+    ),
+    release=release_agent,
+)
+
+# How the REST and gRPC transports run the agents
+agent_target = RunTarget(
+    ids=get_available_agents(),
+    acquire=lambda target_id, model, user_id, session_id: acquire_agent(
+        model_id=model, agent_id=AgentType(target_id), user_id=user_id, session_id=session_id
+    ),
+    release=release_agent,
+    cache=True,
+)
+
 
 class Model(str, Enum):
     gpt_4o = "gpt-4o"
@@ -32,25 +66,6 @@ async def list_agents():
     return get_available_agents()
 
 
-async def chat_response_streamer(agent: Agent, message: str) -> AsyncGenerator:
-    """
-    Stream agent responses chunk by chunk.
-
-    Args:
-        agent: The agent instance to interact with
-        message: User message to process
-
-    Yields:
-        Text chunks from the agent response
-    """
-    run_response = await agent.arun(message, stream=True)
-    async for chunk in run_response:
-        # chunk.content only contains the text response from the Agent.
-        # For advanced use cases, we should yield the entire chunk
-        # that contains the tool calls and intermediate steps.
-        yield chunk.content
-
-
 class RunRequest(BaseModel):
     """Request model for an running an agent"""
 
@@ -59,40 +74,167 @@ class RunRequest(BaseModel):
     model: Model = Model.gpt_4o
     user_id: Optional[str] = None
     session_id: Optional[str] = None
+    # Stream typed SSE events (content, tool calls, reasoning, metrics) instead of plain text
+    stream_events: bool = False
+    # Seconds the client waits for the run, like the X-Request-Timeout header. A run out of time ends with the
+    # partial answer it has.
+    timeout: Optional[float] = Field(None, gt=0)
+    # Set to False to bypass the response cache for this run
+    cache: bool = True
+
+
+class BatchRunRequest(BaseModel):
+    """Request model for running a agent on a batch of messages"""
+
+    runs: List[RunRequest]
+    # Maximum number of runs executing at the same time, capped by the batch_max_concurrency setting
+    max_concurrency: Optional[int] = Field(None, ge=1)
 
 
 @agents_router.post("/{agent_id}/runs", status_code=status.HTTP_200_OK)
-async def run_agent(agent_id: AgentType, body: RunRequest):
+async def run_agent(agent_id: AgentType, body: RunRequest, request: Request):
     """
     Sends a message to a specific agent and returns the response.
 
     Args:
         agent_id: The ID of the agent to interact with
         body: Request parameters including the message
+        request: The incoming request, used to cancel streamed runs when the client disconnects
 
     Returns:
         Either a streaming response or the complete agent response
     """
     logger.debug(f"RunRequest: {body}")
+    # The budget of the run, from the X-Request-Timeout header or the timeout of the request
+    deadline = run_deadline(body.timeout)
+    # The model calls of the run wait for the turn of its user or API key, in the interactive lane
+    tenant = bind_tenant(body.user_id, request.headers)
+    bind_lane(Lane.INTERACTIVE, request.headers, tenant)
+
+    # A client reconnecting to an event stream continues the run it was following, after the last event it received,
+    # on the worker running it
+    last_event_id = request.headers.get(LAST_EVENT_ID_HEADER)
+    if last_event_id and body.stream and body.stream_events:
+        forwarded = await session_affinity.route_stream(request, last_event_id.rpartition(":")[0])
+        return forwarded if forwarded is not None else resume_response(last_event_id)
+
+    # Turns of a session are served by the worker owning it, where its state is warm
+    forwarded = await session_affinity.route(request, body.session_id)
+    if forwarded is not None:
+        return forwarded
+
+    # The rest of the flow of the run is shared with the gRPC transport
+    spec = RunSpec(
+        kind="agent",
+        target_id=agent_id.value,
+        message=body.message,
+        model=body.model.value,
+        user_id=body.user_id,
+        session_id=body.session_id,
+        stream=body.stream,
+        events=body.stream_events,
+        cache=body.cache,
+        idempotency_key=request.headers.get(IDEMPOTENCY_HEADER),
+        deadline=deadline,
+    )
+    return await run_response(await start_run(spec, agent_target), request)
+
+
+@agents_router.post("/{agent_id}/runs:batch", status_code=status.HTTP_200_OK)
+async def run_agent_batch(agent_id: AgentType, body: BatchRunRequest, request: Request):
+    """
+    Runs a agent on a batch of messages concurrently and streams back the results as NDJSON.
+
+    Args:
+        agent_id: The ID of the agent to run
+        body: The run requests and an optional concurrency limit
+        request: The incoming request, whose API key the model calls of the runs are scheduled for, in the bulk lane
 
+    Returns:
+        A stream of JSON lines, one per run request in completion order, carrying the request `index`
+    """
+    logger.debug(f"BatchRunRequest: {len(body.runs)} runs")
+
+    api_key = api_key_of(request.headers)
+    bind_lane(Lane.BULK)
+    concurrency = min(body.max_concurrency or api_settings.batch_max_concurrency, api_settings.batch_max_concurrency)
+    return StreamingResponse(
+        run_batch(
+            body.runs,
+            acquire=lambda run, model_id: acquire_agent(
+                model_id=model_id,
+                agent_id=agent_id,
+                user_id=run.user_id,
+                session_id=run.session_id,
+            ),
+            rebind=lambda agent, run: rebind_agent(agent, user_id=run.user_id, session_id=run.session_id),
+            release=release_agent,
+            concurrency=concurrency,
+            kind="agent",
+            target_id=agent_id.value,
+            tenant=lambda run: tenant_of(run.user_id, api_key),
+            admit=lambda: admit_run(agent_id.value),
+            plan=lambda run: load_shedder.plan(agent_id.value, run.model.value),
+            degrade=lambda agent, degradations: load_shedder.apply(agent, agent_id.value, degradations),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@agents_router.post("/{agent_id}/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_agent_job(agent_id: AgentType, body: RunRequest):
+    """
+    Queues a run of a agent as a background job and returns the job right away.
+
+    Poll `GET /v1/jobs/{job_id}` for its status and progress, and fetch the answer from
+    `GET /v1/jobs/{job_id}/result`. The `stream` options of the request are ignored.
+
+    Args:
+        agent_id: The ID of the agent to run
+        body: Request parameters including the message
+
+    Returns:
+        The queued job
+    """
+    logger.debug(f"Job RunRequest: {body}")
+
+    return await job_worker.submit(
+        "agent",
+        agent_id.value,
+        model=body.model.value,
+        message=body.message,
+        user_id=body.user_id,
+        session_id=body.session_id,
+    )
+
+
+@agents_router.websocket("/{agent_id}/ws")
+async def agent_session_socket(
+    websocket: WebSocket,
+    agent_id: AgentType,
+    model: Model = Model.gpt_4o,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+):
+    """
+    Runs the turns of a session over a WebSocket, keeping the agent, its loaded session and its model client
+    for the lifetime of the socket.
+
+    Send `{"type": "message", "message": "..."}` to start a turn and `{"type": "cancel"}` to cancel it. The events
+    of each turn are sent back as `{"event": ..., "turn": n, "data": {...}}` frames, like the typed SSE events.
+
+    Args:
+        websocket: The WebSocket connection
+        agent_id: The ID of the agent to interact with
+        model: The model of the agent
+        user_id: The user of the session
+        session_id: The session to continue. A new session is started if not set.
+    """
+    await websocket.accept()
+    bind_lane(Lane.INTERACTIVE, websocket.headers, bind_tenant(user_id, websocket.headers))
+    agent: Agent = acquire_agent(model_id=model.value, agent_id=agent_id, user_id=user_id, session_id=session_id)
     try:
-        agent: Agent = get_agent(
-            model_id=body.model.value,
-            agent_id=agent_id,
-            user_id=body.user_id,
-            session_id=body.session_id,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Agent not found: {str(e)}")
-
-    if body.stream:
-        return StreamingResponse(
-            chat_response_streamer(agent, body.message),
-            media_type="text/event-stream",
-        )
-    else:
-        response = await agent.arun(body.message, stream=False)
-        # response.content only contains the text response from the Agent.
-        # For advanced use cases, we should yield the entire response
-        # that contains the tool calls and intermediate steps.
-        return response.content
+        await SessionSocket(websocket, agent, admission_key=agent_id.value).serve()
+    finally:
+        reload_session_from_storage(agent)
+        release_agent(agent)
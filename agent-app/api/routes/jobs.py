@@ -0,0 +1,59 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import JSONResponse
+
+from api.jobs import JobStatus, job_worker
+
+######################################################
+## Router for background jobs
+######################################################
+
+jobs_router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@jobs_router.get("")
+async def get_jobs_stats():
+    """Returns the number of jobs per status and the stats of the job worker of this process"""
+
+    counts = await asyncio.to_thread(job_worker.store.counts)
+    return {"counts": counts, "worker": job_worker.stats()}
+
+
+@jobs_router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns the status and progress of a job.
+
+    Args:
+        job_id: The ID returned when the job was submitted
+
+    Returns:
+        The job, including its result once it succeeded
+    """
+    job = await asyncio.to_thread(job_worker.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@jobs_router.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Returns the answer of a finished job.
+
+    Args:
+        job_id: The ID returned when the job was submitted
+
+    Returns:
+        The result of a succeeded job, the error of a failed job, or the status with 202 while it's pending
+    """
+    job = await asyncio.to_thread(job_worker.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    if job["status"] in (JobStatus.QUEUED, JobStatus.RUNNING):
+        return JSONResponse(
+            {"job_id": job_id, "status": job["status"], "progress": job["progress"]},
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+    return {"job_id": job_id, "status": job["status"], "result": job["result"], "error": job["error"]}
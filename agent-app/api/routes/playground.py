@@ -1,30 +1,35 @@
 from os import getenv
 
-from agno.playground import Playground
-
 from agents.sage import get_sage
 from agents.scholar import get_scholar
 from agents.image_generator import get_image_generator
 from teams.finance_researcher import get_finance_researcher_team
 from teams.multi_language import get_multi_language_team
+from utils.registry import LazyInstance, LazyPlayground
 from workspace.dev_resources import dev_fastapi
 
 # Router for the Playground Interface
 
-# 创建所有Agent
-sage_agent = get_sage(debug_mode=True)
-scholar_agent = get_scholar(debug_mode=True)
-image_generator_agent = get_image_generator(debug_mode=True)
-
-# 创建团队
-finance_researcher_team = get_finance_researcher_team(debug_mode=True)
-multi_language_team = get_multi_language_team(debug_mode=True)
+# Agent和团队在首次使用时才创建，目录在启动时即可用
+playground_agents = [
+    LazyInstance("agent_id", "sage", "Sage", lambda: get_sage(debug_mode=True)),
+    LazyInstance("agent_id", "scholar", "Scholar", lambda: get_scholar(debug_mode=True)),
+    LazyInstance("agent_id", "image_generator", "ImageGenerator", lambda: get_image_generator(debug_mode=True)),
+]
+playground_teams = [
+    LazyInstance(
+        "team_id",
+        "financial-researcher-team",
+        "Finance Researcher Team",
+        lambda: get_finance_researcher_team(debug_mode=True),
+    ),
+    LazyInstance(
+        "team_id", "multi-language-team", "Multi Language Team", lambda: get_multi_language_team(debug_mode=True)
+    ),
+]
 
 # 创建playground实例
-playground = Playground(
-    agents=[sage_agent, scholar_agent, image_generator_agent], 
-    teams=[finance_researcher_team, multi_language_team]
-)
+playground = LazyPlayground(agents=playground_agents, teams=playground_teams)
 
 # 注册服务端点
 if getenv("RUNTIME_ENV") == "dev":
@@ -0,0 +1,53 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Query, Request
+
+from api.affinity import session_affinity
+from api.run_streams import multiplex_response
+from utils.log import logger
+
+######################################################
+## Router for subscriptions to runs in flight
+######################################################
+
+runs_router = APIRouter(prefix="/runs", tags=["Runs"])
+
+
+@runs_router.get("/events")
+async def subscribe_runs(
+    request: Request,
+    run_id: List[str] = Query(default_factory=list),
+    session_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+):
+    """
+    Streams the typed SSE events of several agent and team runs over one connection.
+
+    Each event keeps its name and id, and its data is wrapped as
+    `{"stream_id": ..., "run_id": ..., "kind": ..., "target_id": ..., "data": {...}}`. Only runs streamed with
+    `stream_events` can be subscribed to.
+
+    Runs are kept by the worker running them. A subscription is forwarded to the worker running its runs when they
+    are given by the ids of their `X-Stream-Id` header and all run on the same worker, or else to the worker owning
+    its session. Runs given by their agno run id, and the runs of a user, are only found on the worker the
+    subscription arrives at.
+
+    Args:
+        run_id: Runs to follow until they finish, by the id in their `X-Stream-Id` header or their agno run id
+        session_id: Watch the runs of this session, including the ones started later, until the client disconnects
+        user_id: Watch the runs of this user, including the ones started later, until the client disconnects
+
+    Returns:
+        A stream of the events of the runs, interleaved
+    """
+    logger.debug(f"Run subscription: run_ids={run_id} session_id={session_id} user_id={user_id}")
+
+    owners = {session_affinity.stream_owner(stream_id) for stream_id in run_id}
+    if len(owners) == 1 and owners != {(None, None)}:
+        forwarded = await session_affinity.route_stream(request, run_id[0])
+    else:
+        forwarded = await session_affinity.route(request, session_id)
+    if forwarded is not None:
+        return forwarded
+
+    return multiplex_response(run_id, session_id=session_id, user_id=user_id)
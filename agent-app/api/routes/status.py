@@ -1,6 +1,26 @@
-from fastapi import APIRouter
+import gc
+import os
 
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from agents.operator import agent_pool
+from api.admission import admission_controller
+from api.affinity import session_affinity
+from api.cache import response_cache
+from api.fair_scheduling import fair_scheduler
+from api.idempotency import idempotency_keys
+from api.load_shedding import load_shedder
+from api.run_streams import run_streams
+from api.semantic_cache import semantic_cache
+from api.single_flight import single_flight
+from api.routes.playground import playground_agents, playground_teams
+from api.streaming import coalescing_stats
+from teams.operator import team_pool
 from utils.dttm import current_utc_str
+from utils.memory import process_memory
+from utils.metrics import metrics
+from utils.registry import registry_stats
 
 ######################################################
 ## Router for API status
@@ -19,3 +39,131 @@ def get_health():
         "path": "/health",
         "utc": current_utc_str(),
     }
+
+
+@status_router.get("/memory")
+def get_memory_stats():
+    """Returns the resident, shared and private memory in MiB of the worker serving the request"""
+
+    return {
+        "pid": os.getpid(),
+        "memory": process_memory(),
+        # Objects preloaded before the worker was forked, see api/serve.py
+        "gc_frozen_objects": gc.get_freeze_count(),
+    }
+
+
+@status_router.get("/affinity")
+def get_affinity_stats():
+    """Returns the nodes and workers sessions are routed to, and the share of sessions served warm by this worker"""
+
+    return session_affinity.stats()
+
+
+@status_router.get("/affinity/sessions/{session_id}")
+async def get_session_owner(session_id: str, request: Request):
+    """
+    Routes a request for a session like a run, without running anything.
+
+    Returns:
+        The node and worker serving the session, and whether it was served there recently
+    """
+    forwarded = await session_affinity.route(request, session_id)
+    if forwarded is not None:
+        return forwarded
+    return {
+        "session_id": session_id,
+        "node": session_affinity.node,
+        "worker": session_affinity.worker,
+        "pid": os.getpid(),
+        "warm": request.state.session_warm,
+    }
+
+
+@status_router.get("/pool")
+def get_pool_stats():
+    """Returns hit/miss and construction-time stats of the agent and team pools"""
+
+    return {
+        "agents": agent_pool.stats(),
+        "teams": team_pool.stats(),
+    }
+
+
+@status_router.get("/playground")
+def get_playground_stats():
+    """Returns the build time in seconds of each playground agent and team, null if not built yet"""
+
+    return {
+        "agents": registry_stats(playground_agents),
+        "teams": registry_stats(playground_teams),
+    }
+
+
+@status_router.get("/single_flight")
+def get_single_flight_stats():
+    """Returns the number of runs in flight, started and joined by identical concurrent requests"""
+
+    return single_flight.stats()
+
+
+@status_router.get("/idempotency")
+def get_idempotency_stats():
+    """Returns the number of idempotent runs started, and of retries attached, replayed or rejected"""
+
+    return idempotency_keys.stats()
+
+
+@status_router.get("/streaming")
+def get_streaming_stats():
+    """Returns flush counts and average write size of the stream coalescing buffer"""
+
+    return coalescing_stats.as_dict()
+
+
+@status_router.get("/run_streams")
+def get_run_streams_stats():
+    """Returns the number of buffered run streams and events, and of streams resumed or expired before resuming"""
+
+    return run_streams.stats()
+
+
+@status_router.get("/admission")
+def get_admission_stats():
+    """Returns queue depth, in-flight runs and wait times of run admission, for autoscaling"""
+
+    return admission_controller.stats()
+
+
+@status_router.get("/load_shedding")
+def get_load_shedding_stats():
+    """Returns the load pressure of this worker, its signals, and how many runs were degraded"""
+
+    return load_shedder.stats()
+
+
+@status_router.get("/fair_scheduling")
+def get_fair_scheduling_stats():
+    """
+    Returns the model calls in flight and waiting, the weight, queue depth and average wait of each tenant, and the
+    reserved slots, latency against SLO and throttling of each priority lane
+    """
+
+    return fair_scheduler.stats()
+
+
+@status_router.get("/cache")
+def get_cache_stats():
+    """Returns hit rate, size and evictions of the exact-match and semantic response caches"""
+
+    return {
+        "exact": response_cache.stats(),
+        "semantic": semantic_cache.stats(),
+    }
+
+
+@status_router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Returns latency, throughput, tool, model and database pool histograms in the Prometheus text format"""
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
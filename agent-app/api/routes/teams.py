@@ -1,12 +1,23 @@
 from enum import Enum
-from typing import AsyncGenerator, List, Optional
+from typing import List, Optional
 
-from agno.team import Team
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Request, status
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from teams.operator import TeamType, get_available_teams, get_team
-
+from pydantic import BaseModel, Field
+from teams.operator import TeamType, acquire_team, get_available_teams, rebind_team, release_team
+
+from api.admission import admit_run
+from api.affinity import session_affinity
+from api.batch import run_batch
+from api.deadline import run_deadline
+from api.fair_scheduling import api_key_of, bind_tenant, tenant_of
+from api.idempotency import IDEMPOTENCY_HEADER
+from api.jobs import job_worker
+from api.lanes import Lane, bind_lane
+from api.load_shedding import load_shedder
+from api.run_flow import RunSpec, RunTarget, run_response, start_run
+from api.run_streams import LAST_EVENT_ID_HEADER, resume_response
+from api.settings import api_settings
 from utils.log import logger
 
 ######################################################
@@ -15,6 +26,26 @@ from utils.log import logger
 
 teams_router = APIRouter(prefix="/teams", tags=["Teams"])
 
+job_worker.register(
+    "team",
+    acquire=lambda job: acquire_team(
+        model_id=job["model"],
+        team_id=TeamType(job["target_id"]),
+        user_id=job["user_id"],
+        session_id=job["session_id"],
+    ),
+    release=release_team,
+)
+
+# How the REST and gRPC transports run the teams
+team_target = RunTarget(
+    ids=get_available_teams(),
+    acquire=lambda target_id, model, user_id, session_id: acquire_team(
+        model_id=model, team_id=TeamType(target_id), user_id=user_id, session_id=session_id
+    ),
+    release=release_team,
+)
+
 
 class Model(str, Enum):
     gpt_4o = "gpt-4o"
@@ -31,23 +62,6 @@ async def list_teams():
     return get_available_teams()
 
 
-async def chat_response_streamer(team: Team, message: str) -> AsyncGenerator:
-    """
-    Stream team responses chunk by chunk.
-    Args:
-        team: The team instance to interact with
-        message: User message to process
-    Yields:
-        Text chunks from the team response
-    """
-    run_response = await team.arun(message, stream=True)
-    async for chunk in run_response:
-        # chunk.content only contains the text response from the Agent.
-        # For advanced use cases, we should yield the entire chunk
-        # that contains the tool calls and intermediate steps.
-        yield chunk.content
-
-
 class RunRequest(BaseModel):
     """Request model for an running an team"""
 
@@ -56,38 +70,130 @@ class RunRequest(BaseModel):
     model: Model = Model.gpt_4o
     user_id: Optional[str] = None
     session_id: Optional[str] = None
+    # Stream typed SSE events (content, tool calls, reasoning, metrics) instead of plain text
+    stream_events: bool = False
+    # Seconds the client waits for the run, like the X-Request-Timeout header. A run out of time ends with the
+    # partial answer it has.
+    timeout: Optional[float] = Field(None, gt=0)
+
+
+class BatchRunRequest(BaseModel):
+    """Request model for running a team on a batch of messages"""
+
+    runs: List[RunRequest]
+    # Maximum number of runs executing at the same time, capped by the batch_max_concurrency setting
+    max_concurrency: Optional[int] = Field(None, ge=1)
 
 
 @teams_router.post("/{team_id}/runs", status_code=status.HTTP_200_OK)
-async def run_team(team_id: TeamType, body: RunRequest):
+async def run_team(team_id: TeamType, body: RunRequest, request: Request):
     """
     Sends a message to a specific team and returns the response.
     Args:
         team_id: The ID of the team to interact with
         body: Request parameters including the message
+        request: The incoming request, used to cancel streamed runs when the client disconnects
     Returns:
         Either a streaming response or the complete team response
     """
     logger.debug(f"RunRequest: {body}")
+    # The budget of the run, from the X-Request-Timeout header or the timeout of the request
+    deadline = run_deadline(body.timeout)
+    # The model calls of the run wait for the turn of its user or API key, in the interactive lane
+    tenant = bind_tenant(body.user_id, request.headers)
+    bind_lane(Lane.INTERACTIVE, request.headers, tenant)
+
+    # A client reconnecting to an event stream continues the run it was following, after the last event it received,
+    # on the worker running it
+    last_event_id = request.headers.get(LAST_EVENT_ID_HEADER)
+    if last_event_id and body.stream and body.stream_events:
+        forwarded = await session_affinity.route_stream(request, last_event_id.rpartition(":")[0])
+        return forwarded if forwarded is not None else resume_response(last_event_id)
+
+    # Turns of a session are served by the worker owning it, where its state is warm
+    forwarded = await session_affinity.route(request, body.session_id)
+    if forwarded is not None:
+        return forwarded
+
+    # The rest of the flow of the run is shared with the gRPC transport
+    spec = RunSpec(
+        kind="team",
+        target_id=team_id.value,
+        message=body.message,
+        model=body.model.value,
+        user_id=body.user_id,
+        session_id=body.session_id,
+        stream=body.stream,
+        events=body.stream_events,
+        idempotency_key=request.headers.get(IDEMPOTENCY_HEADER),
+        deadline=deadline,
+    )
+    return await run_response(await start_run(spec, team_target), request)
+
+
+@teams_router.post("/{team_id}/runs:batch", status_code=status.HTTP_200_OK)
+async def run_team_batch(team_id: TeamType, body: BatchRunRequest, request: Request):
+    """
+    Runs a team on a batch of messages concurrently and streams back the results as NDJSON.
 
-    try:
-        team: Team = get_team(
-            model_id=body.model.value,
-            team_id=team_id,
-            user_id=body.user_id,
-            session_id=body.session_id,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Team not found: {str(e)}")
-
-    if body.stream:
-        return StreamingResponse(
-            chat_response_streamer(team, body.message),
-            media_type="text/event-stream",
-        )
-    else:
-        response = await team.arun(body.message, stream=False)
-        # response.content only contains the text response from the Agent.
-        # For advanced use cases, we should yield the entire response
-        # that contains the tool calls and intermediate steps.
-        return response.content
+    Args:
+        team_id: The ID of the team to run
+        body: The run requests and an optional concurrency limit
+        request: The incoming request, whose API key the model calls of the runs are scheduled for, in the bulk lane
+
+    Returns:
+        A stream of JSON lines, one per run request in completion order, carrying the request `index`
+    """
+    logger.debug(f"BatchRunRequest: {len(body.runs)} runs")
+
+    api_key = api_key_of(request.headers)
+    bind_lane(Lane.BULK)
+    concurrency = min(body.max_concurrency or api_settings.batch_max_concurrency, api_settings.batch_max_concurrency)
+    return StreamingResponse(
+        run_batch(
+            body.runs,
+            acquire=lambda run, model_id: acquire_team(
+                model_id=model_id,
+                team_id=team_id,
+                user_id=run.user_id,
+                session_id=run.session_id,
+            ),
+            rebind=lambda team, run: rebind_team(team, user_id=run.user_id, session_id=run.session_id),
+            release=release_team,
+            concurrency=concurrency,
+            kind="team",
+            target_id=team_id.value,
+            tenant=lambda run: tenant_of(run.user_id, api_key),
+            admit=lambda: admit_run(team_id.value),
+            plan=lambda run: load_shedder.plan(team_id.value, run.model.value),
+            degrade=lambda team, degradations: load_shedder.apply(team, team_id.value, degradations),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@teams_router.post("/{team_id}/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_team_job(team_id: TeamType, body: RunRequest):
+    """
+    Queues a run of a team as a background job and returns the job right away.
+
+    Poll `GET /v1/jobs/{job_id}` for its status and progress, and fetch the answer from
+    `GET /v1/jobs/{job_id}/result`. The `stream` options of the request are ignored.
+
+    Args:
+        team_id: The ID of the team to run
+        body: Request parameters including the message
+
+    Returns:
+        The queued job
+    """
+    logger.debug(f"Job RunRequest: {body}")
+
+    return await job_worker.submit(
+        "team",
+        team_id.value,
+        model=body.model.value,
+        message=body.message,
+        user_id=body.user_id,
+        session_id=body.session_id,
+    )
@@ -1,7 +1,9 @@
 from fastapi import APIRouter
 
 from api.routes.agents import agents_router
+from api.routes.jobs import jobs_router
 from api.routes.playground import playground_router
+from api.routes.runs import runs_router
 from api.routes.status import status_router
 from api.routes.teams import teams_router
 
@@ -10,3 +12,5 @@ v1_router.include_router(status_router)
 v1_router.include_router(agents_router)
 v1_router.include_router(playground_router)
 v1_router.include_router(teams_router)
+v1_router.include_router(jobs_router)
+v1_router.include_router(runs_router)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: api/rpc/runs.proto
+# Protobuf Python Version: 6.30.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    6,
+    30,
+    0,
+    '',
+    'api/rpc/runs.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12\x61pi/rpc/runs.proto\x12\x0b\x61gentapp.v1\"\xa7\x01\n\nRunRequest\x12\x11\n\ttarget_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x14\n\x07user_id\x18\x04 \x01(\tH\x00\x88\x01\x01\x12\x17\n\nsession_id\x18\x05 \x01(\tH\x01\x88\x01\x01\x12\x12\n\x05\x63\x61\x63he\x18\x06 \x01(\x08H\x02\x88\x01\x01\x42\n\n\x08_user_idB\r\n\x0b_session_idB\x08\n\x06_cache\"B\n\x08RunEvent\x12\r\n\x05\x65vent\x18\x01 \x01(\t\x12\n\n\x02id\x18\x02 \x01(\t\x12\r\n\x05\x64\x65lta\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\x32\x81\x01\n\x04Runs\x12<\n\x08RunAgent\x12\x17.agentapp.v1.RunRequest\x1a\x15.agentapp.v1.RunEvent0\x01\x12;\n\x07RunTeam\x12\x17.agentapp.v1.RunRequest\x1a\x15.agentapp.v1.RunEvent0\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'api.rpc.runs_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_RUNREQUEST']._serialized_start=36
+  _globals['_RUNREQUEST']._serialized_end=203
+  _globals['_RUNEVENT']._serialized_start=205
+  _globals['_RUNEVENT']._serialized_end=271
+  _globals['_RUNS']._serialized_start=274
+  _globals['_RUNS']._serialized_end=403
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,33 @@
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from typing import ClassVar as _ClassVar, Optional as _Optional
+
+DESCRIPTOR: _descriptor.FileDescriptor
+
+class RunRequest(_message.Message):
+    __slots__ = ("target_id", "message", "model", "user_id", "session_id", "cache")
+    TARGET_ID_FIELD_NUMBER: _ClassVar[int]
+    MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    MODEL_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    SESSION_ID_FIELD_NUMBER: _ClassVar[int]
+    CACHE_FIELD_NUMBER: _ClassVar[int]
+    target_id: str
+    message: str
+    model: str
+    user_id: str
+    session_id: str
+    cache: bool
+    def __init__(self, target_id: _Optional[str] = ..., message: _Optional[str] = ..., model: _Optional[str] = ..., user_id: _Optional[str] = ..., session_id: _Optional[str] = ..., cache: bool = ...) -> None: ...
+
+class RunEvent(_message.Message):
+    __slots__ = ("event", "id", "delta", "data")
+    EVENT_FIELD_NUMBER: _ClassVar[int]
+    ID_FIELD_NUMBER: _ClassVar[int]
+    DELTA_FIELD_NUMBER: _ClassVar[int]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    event: str
+    id: str
+    delta: str
+    data: bytes
+    def __init__(self, event: _Optional[str] = ..., id: _Optional[str] = ..., delta: _Optional[str] = ..., data: _Optional[bytes] = ...) -> None: ...
@@ -0,0 +1,146 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from api.rpc import runs_pb2 as api_dot_rpc_dot_runs__pb2
+
+GRPC_GENERATED_VERSION = '1.72.1'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + f' but the generated code in api/rpc/runs_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class RunsStub(object):
+    """Server-streaming runs of agents and teams, the gRPC counterpart of
+    POST /v1/agents/{agent_id}/runs and POST /v1/teams/{team_id}/runs with stream_events.
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.RunAgent = channel.unary_stream(
+                '/agentapp.v1.Runs/RunAgent',
+                request_serializer=api_dot_rpc_dot_runs__pb2.RunRequest.SerializeToString,
+                response_deserializer=api_dot_rpc_dot_runs__pb2.RunEvent.FromString,
+                _registered_method=True)
+        self.RunTeam = channel.unary_stream(
+                '/agentapp.v1.Runs/RunTeam',
+                request_serializer=api_dot_rpc_dot_runs__pb2.RunRequest.SerializeToString,
+                response_deserializer=api_dot_rpc_dot_runs__pb2.RunEvent.FromString,
+                _registered_method=True)
+
+
+class RunsServicer(object):
+    """Server-streaming runs of agents and teams, the gRPC counterpart of
+    POST /v1/agents/{agent_id}/runs and POST /v1/teams/{team_id}/runs with stream_events.
+    """
+
+    def RunAgent(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RunTeam(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_RunsServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'RunAgent': grpc.unary_stream_rpc_method_handler(
+                    servicer.RunAgent,
+                    request_deserializer=api_dot_rpc_dot_runs__pb2.RunRequest.FromString,
+                    response_serializer=api_dot_rpc_dot_runs__pb2.RunEvent.SerializeToString,
+            ),
+            'RunTeam': grpc.unary_stream_rpc_method_handler(
+                    servicer.RunTeam,
+                    request_deserializer=api_dot_rpc_dot_runs__pb2.RunRequest.FromString,
+                    response_serializer=api_dot_rpc_dot_runs__pb2.RunEvent.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'agentapp.v1.Runs', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('agentapp.v1.Runs', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class Runs(object):
+    """Server-streaming runs of agents and teams, the gRPC counterpart of
+    POST /v1/agents/{agent_id}/runs and POST /v1/teams/{team_id}/runs with stream_events.
+    """
+
+    @staticmethod
+    def RunAgent(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/agentapp.v1.Runs/RunAgent',
+            api_dot_rpc_dot_runs__pb2.RunRequest.SerializeToString,
+            api_dot_rpc_dot_runs__pb2.RunEvent.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RunTeam(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/agentapp.v1.Runs/RunTeam',
+            api_dot_rpc_dot_runs__pb2.RunRequest.SerializeToString,
+            api_dot_rpc_dot_runs__pb2.RunEvent.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,163 @@
+from typing import AsyncGenerator, Dict, Optional
+
+import grpc
+import orjson
+from fastapi import HTTPException, status
+
+from api.cache import replay
+from api.deadline import request_deadline, run_deadline
+from api.fair_scheduling import bind_tenant
+from api.idempotency import IDEMPOTENCY_HEADER, idempotency_keys
+from api.lanes import Lane, bind_lane
+from api.load_shedding import DEGRADED_HEADER
+from api.routes.agents import Model, agent_target
+from api.routes.teams import team_target
+from api.rpc import runs_pb2, runs_pb2_grpc
+from api.run_flow import RunSpec, RunTarget, start_run
+from api.run_streams import RunChannel
+from api.settings import api_settings
+from api.streaming import StreamEvent, StreamEventType
+from utils.log import logger
+
+######################################################
+## gRPC service for runs of agents and teams
+######################################################
+
+# Model of a run request that doesn't set one, the default of the REST routes
+DEFAULT_MODEL = Model.gpt_4o.value
+
+# Status code of the errors of the run flow, by their HTTP status
+GRPC_STATUS = {
+    status.HTTP_404_NOT_FOUND: grpc.StatusCode.NOT_FOUND,
+    status.HTTP_409_CONFLICT: grpc.StatusCode.ABORTED,
+    status.HTTP_422_UNPROCESSABLE_ENTITY: grpc.StatusCode.FAILED_PRECONDITION,
+    status.HTTP_429_TOO_MANY_REQUESTS: grpc.StatusCode.RESOURCE_EXHAUSTED,
+    status.HTTP_504_GATEWAY_TIMEOUT: grpc.StatusCode.DEADLINE_EXCEEDED,
+}
+
+
+def to_proto(event: StreamEvent) -> runs_pb2.RunEvent:
+    """Convert a stream event to its protobuf message"""
+    if event.event == StreamEventType.CONTENT:
+        return runs_pb2.RunEvent(event=event.event, id=event.id or "", delta=event.data["delta"])
+    return runs_pb2.RunEvent(event=event.event, id=event.id or "", data=orjson.dumps(event.data, default=str))
+
+
+class RunsServicer(runs_pb2_grpc.RunsServicer):
+    """
+    Runs agents and teams for gRPC callers, streaming the same events as the REST routes with `stream_events`.
+
+    Runs go through the same flow as the REST routes, `start_run`: response cache, idempotency keys (the
+    `idempotency-key` metadata), single flight, admission, load shedding, pools and run channels, so a gRPC run can
+    also be resumed or subscribed to over REST with the stream id sent in the `x-stream-id` initial metadata.
+    """
+
+    def __init__(self):
+        self._targets: Dict[str, RunTarget] = {}
+
+    def register(self, kind: str, target: RunTarget) -> None:
+        """
+        Register how to run the agents or teams of a kind.
+
+        Args:
+            kind: "agent" or "team"
+            target: The ids and pool of the kind
+        """
+        self._targets[kind] = target
+
+    async def RunAgent(
+        self, request: runs_pb2.RunRequest, context: grpc.aio.ServicerContext
+    ) -> AsyncGenerator[runs_pb2.RunEvent, None]:
+        async for event in self._run("agent", request, context):
+            yield to_proto(event)
+
+    async def RunTeam(
+        self, request: runs_pb2.RunRequest, context: grpc.aio.ServicerContext
+    ) -> AsyncGenerator[runs_pb2.RunEvent, None]:
+        async for event in self._run("team", request, context):
+            yield to_proto(event)
+
+    async def _run(
+        self, kind: str, request: runs_pb2.RunRequest, context: grpc.aio.ServicerContext
+    ) -> AsyncGenerator[StreamEvent, None]:
+        target = self._targets.get(kind)
+        if target is None or request.target_id not in target.ids:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"Unknown {kind}: {request.target_id}")
+        model = request.model or DEFAULT_MODEL
+        if model not in {m.value for m in Model}:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Unknown model: {model}")
+        user_id = request.user_id if request.HasField("user_id") else None
+        invocation = {key: value for key, value in context.invocation_metadata() or ()}
+        bind_lane(Lane.INTERACTIVE, invocation, bind_tenant(user_id, invocation))
+        # The deadline of the call is the deadline of the run, gRPC clients set it natively
+        request_deadline(context.time_remaining())
+
+        spec = RunSpec(
+            kind=kind,
+            target_id=request.target_id,
+            message=request.message,
+            model=model,
+            user_id=user_id,
+            session_id=request.session_id if request.HasField("session_id") else None,
+            cache=request.cache if request.HasField("cache") else True,
+            idempotency_key=invocation.get(IDEMPOTENCY_HEADER.lower()),
+            deadline=run_deadline(None),
+            log_label=" transport=grpc",
+        )
+        try:
+            run = await start_run(spec, target)
+            followed = await idempotency_keys.follow(run.retry, run.timeline) if run.retry is not None else None
+        except HTTPException as e:
+            if e.headers and "Retry-After" in e.headers:
+                context.set_trailing_metadata((("retry-after", e.headers["Retry-After"]),))
+            await context.abort(GRPC_STATUS.get(e.status_code, grpc.StatusCode.UNKNOWN), str(e.detail))
+
+        if isinstance(followed, RunChannel):
+            channel: Optional[RunChannel] = followed
+            metadata = [("idempotent-replayed", "attached")]
+        else:
+            channel = run.channel
+            answer = followed if followed is not None else run.answer
+            metadata = [("idempotent-replayed", "true")] if followed is not None else []
+            if run.answer is not None:
+                metadata.append(("x-cache", "hit"))
+        if channel is not None:
+            metadata.insert(0, ("x-stream-id", channel.stream_id))
+        if run.degradations:
+            metadata.append((DEGRADED_HEADER.lower(), ",".join(run.degradations)))
+        if run.flight is not None:
+            metadata.append(("x-single-flight", run.flight))
+        await context.send_initial_metadata(tuple(metadata))
+
+        if channel is None:
+            async for event in replay(answer, events=True):
+                yield event  # type: ignore
+            return
+        async for event in channel.subscribe():
+            yield event
+
+
+def default_servicer() -> RunsServicer:
+    """The servicer of the agents and teams of the REST routes"""
+    servicer = RunsServicer()
+    servicer.register("agent", agent_target)
+    servicer.register("team", team_target)
+    return servicer
+
+
+async def start_grpc_server(port: int, servicer: Optional[RunsServicer] = None) -> grpc.aio.Server:
+    """
+    Start the gRPC server on the event loop of the API, so it shares its pools, caches and run channels.
+
+    Several workers can listen on the same port, since gRPC sets SO_REUSEPORT.
+
+    Args:
+        port: Port to listen on
+        servicer: The runs service, by default the one of the agents and teams of the REST routes
+    """
+    server = grpc.aio.server(options=[("grpc.max_concurrent_streams", api_settings.grpc_max_concurrent_streams)])
+    runs_pb2_grpc.add_RunsServicer_to_server(servicer or default_servicer(), server)
+    bound = server.add_insecure_port(f"[::]:{port}")
+    await server.start()
+    logger.info(f"gRPC server listening on port {bound}")
+    return server
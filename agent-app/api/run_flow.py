@@ -0,0 +1,276 @@
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, List, Optional, Union
+
+from fastapi import HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.admission import admit_run
+from api.cache import CachedResponse, cached_response, response_cache, store_on_completion
+from api.deadline import DEADLINE_EXCEEDED_HEADER, run_until_deadline, until_deadline
+from api.idempotency import IdempotentRequest, idempotency_keys, request_hash
+from api.load_shedding import degraded_headers, load_shedder
+from api.run_streams import RunChannel, channel_response, run_streams
+from api.semantic_cache import semantic_cache
+from api.settings import api_settings
+from api.single_flight import flight_response, single_flight
+from api.streaming import event_stream, run_stream_response, track_tokens, with_timing
+from utils.deadline import Deadline
+from utils.metrics import RunTracker
+from utils.timing import PhaseTimeline
+
+######################################################
+## The flow of a run request, shared by the REST and gRPC transports
+######################################################
+
+
+@dataclass
+class RunTarget:
+    """How to run the agents or teams of a kind"""
+
+    # Ids of the agents or teams of the kind
+    ids: List[str]
+    # Leases an agent/team bound to a request: acquire(target_id, model, user_id, session_id)
+    acquire: Callable[[str, str, Optional[str], Optional[str]], Any]
+    # Returns a leased agent/team to its pool
+    release: Callable[[Any], None]
+    # Whether answers are served from and stored in the response cache
+    cache: bool = False
+
+
+@dataclass
+class RunSpec:
+    """A run request, whichever transport it came in over"""
+
+    # "agent" or "team"
+    kind: str
+    target_id: str
+    message: str
+    model: str
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    # Whether the client reads the answer as a stream, of typed events or of plain text chunks
+    stream: bool = True
+    events: bool = True
+    # Set to False to bypass the response cache
+    cache: bool = True
+    # Idempotency key of the request, its retries get the result of the first attempt
+    idempotency_key: Optional[str] = None
+    # The budget of the run
+    deadline: Optional[Deadline] = None
+    # Appended to the timing log line of the run, e.g. " transport=grpc"
+    log_label: str = ""
+
+
+@dataclass
+class Run:
+    """
+    A run request after `start_run`: answered from the cache, a retry of an earlier request, attached to a run
+    channel, or holding a leased agent or team for the transport to run without a channel.
+    """
+
+    spec: RunSpec
+    timeline: PhaseTimeline
+    # Cached answer of the request, nothing runs
+    answer: Optional[CachedResponse] = None
+    # A retry of the request running or stored under its idempotency key, nothing runs
+    retry: Optional[IdempotentRequest] = None
+    # Channel of the run
+    channel: Optional[RunChannel] = None
+    # "leader" or "joined" when the run is shared by identical concurrent requests
+    flight: Optional[str] = None
+    degradations: List[str] = field(default_factory=list)
+    # Agent or team of a run without a channel, handed to `release` once the run is done
+    runner: Any = None
+    release: Optional[Callable[[Any], None]] = None
+    tracker: Optional[RunTracker] = None
+    # Stores the answer of a run without a channel in the response cache, None when it isn't cached
+    store: Optional[Callable[[Any], None]] = None
+
+
+async def start_run(spec: RunSpec, target: RunTarget) -> Run:
+    """
+    Take a run request through the response cache, its idempotency key, single flight, admission and load
+    shedding, then lease its agent or team and start it on a run channel when the request needs one.
+
+    Runs with a channel are started here. Plain text streams and non-streamed runs without an idempotency key
+    don't need one, the transport runs their leased agent or team itself.
+
+    Raises:
+        HTTPException: 422 when the idempotency key was used with a different request, 429 when the worker is
+            saturated, 504 when the deadline passed before the run could start, 404 when the agent or team can't
+            be built
+    """
+    timeline = PhaseTimeline()
+
+    # Answers of runs without a session don't depend on history, so they can be served from the cache
+    use_cache = target.cache and spec.cache and spec.session_id is None and response_cache.enabled(spec.target_id)
+    if use_cache:
+        cached = response_cache.get(spec.target_id, spec.model, spec.message)
+        if cached is None:
+            cached = await semantic_cache.get(spec.target_id, spec.model, spec.message)
+        if cached is not None:
+            return Run(spec, timeline, answer=cached)
+
+    # Retries of a request with an idempotency key get the result of the first attempt instead of running again
+    idempotent = None
+    if spec.idempotency_key:
+        fingerprint = request_hash(
+            message=spec.message, model=spec.model, user_id=spec.user_id, session_id=spec.session_id
+        )
+        idempotent = await idempotency_keys.begin(spec.kind, spec.target_id, spec.idempotency_key, fingerprint)
+        if not idempotent.leader:
+            return Run(spec, timeline, retry=idempotent)
+
+    # Identical concurrent runs of a user without a session attach to the run already in flight. Runs with a deadline don't,
+    # as they would end with the deadline of the first one.
+    channel = None
+    flight = spec.deadline is None and single_flight.enabled(spec.target_id, spec.session_id)
+    if flight:
+        channel, leader = single_flight.attach(
+            spec.kind, spec.target_id, spec.model, spec.message, user_id=spec.user_id, session_id=spec.session_id
+        )
+        if not leader:
+            if idempotent is not None:
+                idempotency_keys.track(idempotent, channel)
+            return Run(spec, timeline, channel=channel, flight="joined")
+    elif idempotent is not None or (spec.stream and spec.events):
+        # Runs with an idempotency key and event streams go through a channel, so that retries can attach to them
+        # and clients can resume them after a disconnect
+        channel = run_streams.open(spec.kind, spec.target_id, user_id=spec.user_id, session_id=spec.session_id)
+    if idempotent is not None:
+        idempotency_keys.track(idempotent, channel)
+
+    try:
+        # Wait for a run slot, or reject with 429 when this worker is saturated
+        with timeline.phase("admission"):
+            ticket = await admit_run(spec.target_id)
+    except HTTPException as e:
+        # The error ends the channel, which also releases the idempotency key of the request for its retries
+        if channel is not None:
+            single_flight.abort(channel, str(e.detail))
+        raise
+    tracker = RunTracker(spec.kind, spec.target_id)
+    # Under load the run is degraded, e.g. to a cheaper model, rather than queueing every run into a timeout
+    model_id, degradations = load_shedder.plan(spec.target_id, spec.model)
+    try:
+        with timeline.phase("acquire"):
+            # Cached answers are served to every user, so cacheable runs are anonymous: the agent gets no user
+            # context and stores nothing for the user
+            user_id = None if use_cache else spec.user_id
+            runner = target.acquire(spec.target_id, model_id, user_id, spec.session_id)
+    except Exception as e:
+        tracker.finish()
+        ticket.release()
+        detail = f"{spec.kind.capitalize()} not found: {str(e)}"
+        if channel is not None:
+            single_flight.abort(channel, detail)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+    restore = load_shedder.apply(runner, spec.target_id, degradations)
+
+    def release(runner: Any) -> None:
+        restore()
+        tracker.finish(runner)
+        timeline.finish(runner).log(
+            f"{spec.kind}={spec.target_id}{spec.log_label}", api_settings.timing_log_sample_rate
+        )
+        target.release(runner)
+        ticket.release()
+
+    store = None
+    # Degraded answers are not what the cache promises for the request
+    if use_cache and not degradations:
+
+        def store(content: Any) -> None:
+            response_cache.put(spec.target_id, spec.model, spec.message, runner, content)
+            semantic_cache.put(spec.target_id, spec.model, spec.message, content, model=runner.model.id)
+
+    if channel is None:
+        return Run(
+            spec, timeline, degradations=degradations, runner=runner, release=release, tracker=tracker, store=store
+        )
+
+    events = event_stream(runner, spec.message)
+    if spec.deadline is not None:
+        events = until_deadline(events, runner, spec.deadline)
+    source = with_timing(events, timeline, runner)
+    if store is not None:
+        source = store_on_completion(source, runner, store)
+    if flight:
+        single_flight.run(channel, runner, track_tokens(source, tracker), release)
+    else:
+        run_streams.run(channel, runner, track_tokens(source, tracker), release)
+    return Run(spec, timeline, channel=channel, flight="leader" if flight else None, degradations=degradations)
+
+
+async def chat_response_streamer(runner: Any, message: str) -> AsyncGenerator:
+    """
+    Stream agent or team responses chunk by chunk.
+
+    Args:
+        runner: The agent or team instance to interact with
+        message: User message to process
+
+    Yields:
+        Text chunks from the response
+    """
+    run_response = await runner.arun(message, stream=True)
+    async for chunk in run_response:
+        # chunk.content only contains the text response from the Agent.
+        # For advanced use cases, we should yield the entire chunk
+        # that contains the tool calls and intermediate steps.
+        yield chunk.content
+
+
+async def run_response(run: Run, request: Request) -> Union[StreamingResponse, JSONResponse]:
+    """
+    Build the REST response of a run request started with `start_run`.
+
+    Args:
+        run: The started run request
+        request: The incoming request, used to cancel plain text streams when the client disconnects
+    """
+    spec, timeline = run.spec, run.timeline
+    if run.answer is not None:
+        return cached_response(run.answer, stream=spec.stream, events=spec.events)
+    if run.retry is not None:
+        return await idempotency_keys.respond(run.retry, spec.stream, spec.events, timeline)
+
+    headers = degraded_headers(run.degradations)
+    if run.channel is not None:
+        if run.flight is not None:
+            return await flight_response(
+                run.channel, spec.stream, spec.events, timeline, leader=run.flight == "leader", headers=headers
+            )
+        return await channel_response(run.channel, spec.stream, spec.events, timeline, headers=headers)
+
+    runner, release = run.runner, run.release
+    if spec.stream:
+        # Plain text streams carry no event ids, so they can't be resumed
+        source = chat_response_streamer(runner, spec.message)
+        if spec.deadline is not None:
+            source = until_deadline(source, runner, spec.deadline, events=False)
+        if run.store is not None:
+            source = store_on_completion(source, runner, run.store)
+        response = run_stream_response(request, runner, source, release, run.tracker)
+        response.headers.update(headers)
+        return response
+
+    exceeded = False
+    try:
+        if spec.deadline is not None:
+            content, exceeded = await run_until_deadline(runner, spec.message, spec.deadline)
+        else:
+            content = (await runner.arun(spec.message, stream=False)).content
+        if run.store is not None and not exceeded:
+            run.store(content)
+    finally:
+        release(runner)
+    headers["Server-Timing"] = timeline.server_timing()
+    if exceeded:
+        headers[DEADLINE_EXCEEDED_HEADER] = "true"
+    # content only contains the text response from the Agent.
+    # For advanced use cases, we should yield the entire response
+    # that contains the tool calls and intermediate steps.
+    return JSONResponse(jsonable_encoder(content), headers=headers)
@@ -0,0 +1,454 @@
+import asyncio
+from collections import deque
+from contextlib import nullcontext
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from uuid import uuid4
+
+from agno.agent import Agent
+from agno.team import Team
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.affinity import session_affinity
+from api.settings import api_settings
+from api.streaming import StreamEvent, StreamEventType, coalesced, record_cancelled_run
+from utils.log import logger
+from utils.timing import PhaseTimeline
+
+######################################################
+## Buffered, resumable event streams of runs
+######################################################
+
+# Header a reconnecting SSE client sends with the id of the last event it received
+LAST_EVENT_ID_HEADER = "Last-Event-ID"
+
+
+class RunChannel:
+    """
+    Fan-out of the events of one run to any number of subscribers.
+
+    Every published event gets the SSE id `<stream_id>:<sequence>`. The last `max_events` events are kept, so a
+    subscriber that joins late, or reconnects with the id of the last event it received, still gets the events it
+    missed. When the last subscriber goes away before the run is done, the run is cancelled unless a subscriber
+    comes back within `resume_grace` seconds.
+
+    Args:
+        stream_id: Id of the stream, the prefix of the event ids
+        max_events: Maximum number of events kept, None to keep all events
+        resume_grace: Seconds the run keeps going without subscribers
+        kind: "agent" or "team"
+        target_id: Id of the agent or team
+        user_id: The user of the run
+        session_id: The session of the run, taken from the run_started event when not known up front
+    """
+
+    def __init__(
+        self,
+        stream_id: Optional[str] = None,
+        max_events: Optional[int] = None,
+        resume_grace: float = 0.0,
+        kind: Optional[str] = None,
+        target_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ):
+        self.stream_id = stream_id or uuid4().hex
+        self.resume_grace = resume_grace
+        self.kind = kind
+        self.target_id = target_id
+        self.user_id = user_id
+        self.session_id = session_id
+        # Id of the agno run, set by the run_started event
+        self.run_id: Optional[str] = None
+        self.events: Deque[StreamEvent] = deque(maxlen=max_events)
+        # Sequence number of the oldest kept event
+        self.offset = 0
+        self.done = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_close: List[Callable[[], None]] = []
+        self._on_started: List[Callable[[], None]] = []
+
+    @property
+    def next_sequence(self) -> int:
+        return self.offset + len(self.events)
+
+    def publish(self, event: StreamEvent) -> None:
+        event.id = f"{self.stream_id}:{self.next_sequence}"
+        if self.events.maxlen is not None and len(self.events) == self.events.maxlen:
+            self.offset += 1
+        self.events.append(event)
+        self._notify()
+        if event.event == StreamEventType.RUN_STARTED:
+            self.run_id = event.data.get("run_id")
+            self.session_id = self.session_id or event.data.get("session_id")
+            for callback in self._on_started:
+                callback()
+
+    def close(self) -> None:
+        self.done = True
+        self._notify()
+        for callback in self._on_close:
+            callback()
+
+    def on_close(self, callback: Callable[[], None]) -> None:
+        self._on_close.append(callback)
+
+    def on_started(self, callback: Callable[[], None]) -> None:
+        self._on_started.append(callback)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def start(self, source: AsyncIterator[StreamEvent], on_done: Callable[[bool], None]) -> None:
+        """
+        Publish the events of the source in a task of its own, so the run doesn't depend on any one subscriber.
+
+        Args:
+            source: The event stream of the run
+            on_done: Called with whether the run finished, before subscribers see the channel closed
+        """
+
+        async def pump() -> None:
+            finished = False
+            try:
+                async for event in source:
+                    self.publish(event)
+                finished = True
+            finally:
+                aclose = getattr(source, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                try:
+                    on_done(finished)
+                finally:
+                    self.close()
+
+        self._task = asyncio.create_task(pump())
+
+    def _cancel_if_idle(self) -> None:
+        if self.subscribers == 0 and not self.done and self._task is not None:
+            self._task.cancel()
+
+    async def subscribe(self, start: int = 0, observe: bool = False) -> AsyncGenerator[StreamEvent, None]:
+        """
+        Yield the events of the run from sequence number `start` until the run is done.
+
+        A subscriber that falls further behind than the kept events continues with the oldest kept event.
+
+        Args:
+            start: Sequence number of the first event
+            observe: Only watch the run, without keeping it from being cancelled when all other subscribers left
+        """
+        if observe:
+            async for event in self._events(start):
+                yield event
+            return
+        self.subscribers += 1
+        try:
+            async for event in self._events(start):
+                yield event
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                if self.resume_grace > 0:
+                    asyncio.get_running_loop().call_later(self.resume_grace, self._cancel_if_idle)
+                else:
+                    self._cancel_if_idle()
+
+    async def _events(self, start: int) -> AsyncGenerator[StreamEvent, None]:
+        sequence = start
+        while True:
+            changed = self._changed
+            sequence = max(sequence, self.offset)
+            while sequence < self.next_sequence:
+                yield self.events[sequence - self.offset]
+                sequence = max(sequence + 1, self.offset)
+            if self.done:
+                return
+            await changed.wait()
+
+
+class RunStreams:
+    """
+    Registry of the run channels of this process, by stream id.
+
+    Channels are dropped `retention` seconds after their run is done. Until then a client can resume the stream.
+
+    Args:
+        max_events: Maximum number of events kept per run
+        resume_grace: Seconds a run keeps going after its last client disconnected, waiting for it to resume
+        retention: Seconds a channel is kept after its run is done
+    """
+
+    def __init__(self, max_events: int, resume_grace: float, retention: float):
+        self.max_events = max_events
+        self.resume_grace = resume_grace
+        self.retention = retention
+        self._channels: Dict[str, RunChannel] = {}
+        # Callbacks of the multiplexed subscriptions, told about new runs and runs that started
+        self._watchers: List[Callable[[RunChannel], None]] = []
+        self.opened = 0
+        self.resumed = 0
+        self.expired = 0
+
+    def open(
+        self,
+        kind: Optional[str] = None,
+        target_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> RunChannel:
+        """Create and register the channel of a new run, with a stream id naming the worker running it"""
+        channel = RunChannel(
+            stream_id=session_affinity.new_stream_id(),
+            max_events=self.max_events,
+            resume_grace=self.resume_grace,
+            kind=kind,
+            target_id=target_id,
+            user_id=user_id,
+            session_id=session_id,
+        )
+        self._channels[channel.stream_id] = channel
+        self.opened += 1
+
+        def evict() -> None:
+            asyncio.get_running_loop().call_later(self.retention, self._channels.pop, channel.stream_id, None)
+
+        def announce() -> None:
+            for watcher in list(self._watchers):
+                watcher(channel)
+
+        channel.on_close(evict)
+        channel.on_started(announce)
+        announce()
+        return channel
+
+    def get(self, stream_id: str) -> Optional[RunChannel]:
+        return self._channels.get(stream_id)
+
+    def find(self, run_id: str) -> Optional[RunChannel]:
+        """Find a channel by its stream id, or by the id of its agno run"""
+        channel = self._channels.get(run_id)
+        if channel is not None:
+            return channel
+        return next((channel for channel in self._channels.values() if channel.run_id == run_id), None)
+
+    async def multiplex(
+        self,
+        channels: Sequence[RunChannel] = (),
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """
+        Yield the events of several runs interleaved, each wrapped with the stream and run ids it belongs to.
+
+        The given channels are followed from their first kept event until they are done, like the streams of their
+        own requests. Runs of the given session or user are watched from their first kept event, including runs
+        started later, until the subscription is closed. Watching a run doesn't keep it from being cancelled.
+
+        Args:
+            channels: Channels of the runs to follow
+            session_id: Watch the runs of this session
+            user_id: Watch the runs of this user
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        forwarding: Dict[str, asyncio.Task] = {}
+        pending: Set[str] = {channel.stream_id for channel in channels}
+        watching = session_id is not None or user_id is not None
+
+        async def forward(channel: RunChannel, observe: bool) -> None:
+            try:
+                async for event in channel.subscribe(observe=observe):
+                    data = {
+                        "stream_id": channel.stream_id,
+                        "run_id": channel.run_id,
+                        "kind": channel.kind,
+                        "target_id": channel.target_id,
+                        "data": event.data,
+                    }
+                    queue.put_nowait(StreamEvent(event.event, data, id=event.id))
+            finally:
+                # The stream id alone marks the end of a run
+                queue.put_nowait(channel.stream_id)
+
+        def follow(channel: RunChannel, observe: bool) -> None:
+            if channel.stream_id not in forwarding:
+                forwarding[channel.stream_id] = asyncio.create_task(forward(channel, observe))
+
+        def watch(channel: RunChannel) -> None:
+            if channel.done:
+                return
+            if (session_id is not None and channel.session_id == session_id) or (
+                user_id is not None and channel.user_id == user_id
+            ):
+                follow(channel, observe=True)
+
+        for channel in channels:
+            follow(channel, observe=False)
+        if watching:
+            self._watchers.append(watch)
+            for channel in list(self._channels.values()):
+                watch(channel)
+        try:
+            while watching or pending:
+                item = await queue.get()
+                if isinstance(item, str):
+                    pending.discard(item)
+                    continue
+                yield item
+        finally:
+            if watching:
+                self._watchers.remove(watch)
+            for task in forwarding.values():
+                task.cancel()
+
+    def run(
+        self,
+        channel: RunChannel,
+        runner: Union[Agent, Team],
+        source: AsyncIterator[StreamEvent],
+        release: Callable[[Any], None],
+    ) -> None:
+        """
+        Start the run of a channel.
+
+        Args:
+            channel: The channel of the run
+            runner: The agent or team producing the events
+            source: The event stream of the run
+            release: Returns the runner and any resources held by the run
+        """
+
+        def on_done(finished: bool) -> None:
+            if not finished:
+                record_cancelled_run(runner)
+            release(runner)
+
+        channel.start(source, on_done)
+
+    def resume(self, last_event_id: str) -> Tuple[RunChannel, int]:
+        """
+        Find the channel and the sequence number to resume a stream from, after the event with the given id.
+
+        Raises:
+            HTTPException: 404 when the stream is unknown or was evicted, 409 when the missed events aren't kept anymore
+        """
+        stream_id, _, sequence = last_event_id.rpartition(":")
+        channel = self._channels.get(stream_id)
+        if channel is None or not sequence.isdigit():
+            self.expired += 1
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stream not found or expired")
+        start = int(sequence) + 1
+        if start < channel.offset:
+            self.expired += 1
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Missed events are no longer available")
+        self.resumed += 1
+        return channel, start
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self._channels),
+            "running": sum(1 for channel in self._channels.values() if not channel.done),
+            "buffered_events": sum(len(channel.events) for channel in self._channels.values()),
+            "subscriptions": len(self._watchers),
+            "opened": self.opened,
+            "resumed": self.resumed,
+            "expired": self.expired,
+        }
+
+
+run_streams = RunStreams(
+    max_events=api_settings.stream_buffer_max_events,
+    resume_grace=api_settings.stream_resume_grace_seconds,
+    retention=api_settings.stream_buffer_retention_seconds,
+)
+
+
+async def _text_chunks(source: AsyncIterator[StreamEvent]) -> AsyncGenerator[str, None]:
+    async for event in source:
+        if event.event == StreamEventType.CONTENT:
+            yield event.data["delta"]
+        elif event.event == StreamEventType.ERROR:
+            logger.warning(f"Run failed: {event.data.get('message')}")
+
+
+async def channel_response(
+    channel: RunChannel,
+    stream: bool,
+    events: bool,
+    timeline: PhaseTimeline,
+    headers: Optional[Dict[str, str]] = None,
+    wait_phase: Optional[str] = None,
+) -> Union[StreamingResponse, JSONResponse]:
+    """
+    Build the response of a request attached to a run channel.
+
+    Args:
+        channel: The channel of the run
+        stream: Whether the client asked for a streaming response
+        events: Whether the client asked for typed events instead of plain text chunks
+        timeline: The timeline of the request
+        headers: Headers of the response
+        wait_phase: Phase of the timeline to record the wait for a run led by another request under
+    """
+    headers = dict(headers or {})
+    headers.setdefault("X-Stream-Id", channel.stream_id)
+    if stream:
+        source: AsyncIterator[Any] = channel.subscribe() if events else _text_chunks(channel.subscribe())
+        return StreamingResponse(coalesced(source), media_type="text/event-stream", headers=headers)
+
+    # A request that only waits for the run of another one records the wait, the phases of the run itself are in
+    # the timeline of the other request
+    with timeline.phase(wait_phase) if wait_phase is not None else nullcontext():
+        received = [event async for event in channel.subscribe()]
+    for event in received:
+        if event.event == StreamEventType.ERROR:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=event.data.get("message"))
+    content = "".join(event.data["delta"] for event in received if event.event == StreamEventType.CONTENT)
+    headers["Server-Timing"] = timeline.finish().server_timing()
+    return JSONResponse(content, headers=headers)
+
+
+def resume_response(last_event_id: str) -> StreamingResponse:
+    """Continue the event stream of a run after the event with the given id, replaying the events missed"""
+    channel, start = run_streams.resume(last_event_id)
+    return StreamingResponse(coalesced(channel.subscribe(start)), media_type="text/event-stream")
+
+
+def multiplex_response(
+    run_ids: Sequence[str], session_id: Optional[str] = None, user_id: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Stream the events of several runs over one connection.
+
+    Raises:
+        HTTPException: 400 when no run, session or user is given, 404 when a run is unknown or was evicted
+    """
+    if not run_ids and session_id is None and user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Subscribe to at least one run_id, a session_id or user_id"
+        )
+    channels = []
+    for run_id in dict.fromkeys(run_ids):
+        channel = run_streams.find(run_id)
+        if channel is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Run not found or expired: {run_id}")
+        channels.append(channel)
+    source = run_streams.multiplex(channels, session_id=session_id, user_id=user_id)
+    return StreamingResponse(coalesced(source), media_type="text/event-stream")
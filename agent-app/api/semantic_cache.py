@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql
+
+from agents.settings import agent_settings
+from api.cache import CachedResponse, normalize_message, response_cache
+from api.settings import api_settings
+from db.session import db_engine
+from utils.log import logger
+
+if TYPE_CHECKING:
+    from agno.vectordb.pgvector import PgVector
+
+######################################################
+## Semantic cache of agent responses backed by pgvector
+######################################################
+
+# Number of recent message embeddings kept, so storing an answer doesn't embed its message again
+_EMBEDDING_CACHE_SIZE = 256
+# Expired answers are deleted from the table every this many stores
+_PURGE_EVERY = 100
+
+
+class SemanticCache:
+    """
+    Cache of agent answers matched by the similarity of the question.
+
+    Messages are embedded and looked up in a dedicated pgvector table, scoped to the agent id, model and agent
+    fingerprint of the exact-match cache. The nearest stored question is a hit when its cosine similarity is at
+    least the threshold of the agent. Entries expire after the TTL of the agent in the exact-match cache.
+
+    Args:
+        thresholds: Minimum cosine similarity of a hit per agent id. Agents without a threshold are not cached.
+        table_name: Name of the pgvector table
+    """
+
+    def __init__(self, thresholds: Dict[str, float], table_name: str):
+        self.thresholds = thresholds
+        self.table_name = table_name
+
+        self._vector_db: Optional["PgVector"] = None
+        # Held while the table is created, so concurrent first lookups and stores create it once
+        self._create_lock = Lock()
+        self._lock = Lock()
+        self._embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+        self.lookup_seconds = 0.0
+        self.hit_similarity = 0.0
+
+    def enabled(self, agent_id: str) -> bool:
+        return agent_id in self.thresholds and response_cache.enabled(agent_id)
+
+    @property
+    def vector_db(self) -> "PgVector":
+        # Created on first use, sharing the connection pool of the app
+        if self._vector_db is None:
+            with self._create_lock:
+                if self._vector_db is None:
+                    from agno.embedder.openai import OpenAIEmbedder
+                    from agno.vectordb.pgvector import PgVector
+
+                    vector_db = PgVector(
+                        table_name=self.table_name,
+                        db_engine=db_engine,
+                        embedder=OpenAIEmbedder(id=agent_settings.embedding_model),
+                    )
+                    vector_db.create()
+                    self._vector_db = vector_db
+        return self._vector_db
+
+    def _embed(self, message: str) -> List[float]:
+        with self._lock:
+            embedding = self._embeddings.get(message)
+            if embedding is not None:
+                self._embeddings.move_to_end(message)
+                return embedding
+        embedding = self.vector_db.embedder.get_embedding(message)
+        with self._lock:
+            self._embeddings[message] = embedding
+            while len(self._embeddings) > _EMBEDDING_CACHE_SIZE:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def _lookup(self, agent_id: str, model_id: str, fingerprint: str, message: str) -> Optional[CachedResponse]:
+        table = self.vector_db.table
+        distance = table.c.embedding.cosine_distance(self._embed(message))
+        stmt = (
+            select(table.c.meta_data, distance.label("distance"))
+            .where(table.c.meta_data.contains({"agent_id": agent_id, "model": model_id, "fingerprint": fingerprint}))
+            .where(table.c.meta_data["expires_at"].as_float() > time())
+            .order_by(distance)
+            .limit(1)
+        )
+        with self.vector_db.Session() as sess:
+            row = sess.execute(stmt).first()
+        if row is None:
+            return None
+        similarity = 1 - row.distance
+        if similarity < self.thresholds[agent_id]:
+            return None
+        with self._lock:
+            self.hit_similarity += similarity
+        return CachedResponse(
+            content=row.meta_data["answer"],
+            model=row.meta_data.get("response_model"),
+            expires_at=row.meta_data["expires_at"],
+        )
+
+    async def get(self, agent_id: str, model_id: str, message: str) -> Optional[CachedResponse]:
+        """
+        Look up the answer to the most similar cached question.
+
+        Args:
+            agent_id: The agent id
+            model_id: The model id of the run
+            message: The user message
+
+        Returns:
+            Optional[CachedResponse]: The cached answer, or None on a miss or when the lookup fails
+        """
+        fingerprint = response_cache.fingerprint(agent_id, model_id)
+        if not self.enabled(agent_id) or fingerprint is None:
+            return None
+        start = perf_counter()
+        try:
+            cached = await asyncio.to_thread(self._lookup, agent_id, model_id, fingerprint, normalize_message(message))
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            cached = None
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            self.lookup_seconds += perf_counter() - start
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def _store(self, agent_id: str, model_id: str, fingerprint: str, message: str, content: str, model: str) -> None:
+        table = self.vector_db.table
+        meta_data = {
+            "agent_id": agent_id,
+            "model": model_id,
+            "fingerprint": fingerprint,
+            "answer": content,
+            "response_model": model,
+            "expires_at": time() + response_cache.ttl(agent_id),
+        }
+        _id = hashlib.md5(f"{agent_id}:{model_id}:{fingerprint}:{message}".encode()).hexdigest()
+        stmt = postgresql.insert(table).values(
+            id=_id,
+            name=agent_id,
+            meta_data=meta_data,
+            content=message,
+            embedding=self._embed(message),
+            content_hash=_id,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id"], set_={"meta_data": stmt.excluded.meta_data, "embedding": stmt.excluded.embedding}
+        )
+        with self.vector_db.Session() as sess, sess.begin():
+            sess.execute(stmt)
+            with self._lock:
+                self.stores += 1
+                purge = self.stores % _PURGE_EVERY == 0
+            if purge:
+                sess.execute(delete(table).where(table.c.meta_data["expires_at"].as_float() <= time()))
+
+    def put(self, agent_id: str, model_id: str, message: str, content: Any, model: Optional[str] = None) -> None:
+        """
+        Store the answer of a completed run in the background.
+
+        Args:
+            agent_id: The agent id
+            model_id: The model id of the run
+            message: The user message
+            content: The answer. Only non-empty text answers are cached.
+            model: The model that produced the answer
+        """
+        fingerprint = response_cache.fingerprint(agent_id, model_id)
+        if not self.enabled(agent_id) or fingerprint is None or not isinstance(content, str) or not content:
+            return
+
+        async def store() -> None:
+            try:
+                await asyncio.to_thread(
+                    self._store, agent_id, model_id, fingerprint, normalize_message(message), content, model or model_id
+                )
+            except Exception as e:
+                logger.warning(f"Semantic cache store failed: {e}")
+                with self._lock:
+                    self.errors += 1
+
+        task = asyncio.get_running_loop().create_task(store())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit rate, lookup latency and average similarity of hits."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "thresholds": self.thresholds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "errors": self.errors,
+                "lookup_ms_avg": self.lookup_seconds / lookups * 1000 if lookups else 0.0,
+                "hit_similarity_avg": self.hit_similarity / self.hits if self.hits else 0.0,
+            }
+
+
+semantic_cache = SemanticCache(
+    thresholds=api_settings.semantic_cache_thresholds,
+    table_name=api_settings.semantic_cache_table,
+)
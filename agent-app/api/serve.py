@@ -0,0 +1,246 @@
+"""
+Pre-forking server for multi-worker deployments.
+
+`uvicorn --workers N` spawns fresh interpreters, so every worker imports and initializes the app on its own. This
+server imports the app and the shared, read-only parts of the agents and teams once in the parent, freezes them
+out of the garbage collector, and forks the workers from it. The workers then share those pages copy-on-write
+instead of holding a private copy each.
+
+With `--affinity`, every worker also listens on a port of its own, and requests of a session are forwarded to the
+worker owning it, see api/affinity.py.
+
+Usage:
+    python -m api.serve --workers 2
+    python -m api.serve --workers 2 --no-preload --memory-report-after 20
+    python -m api.serve --workers 4 --affinity
+"""
+
+import argparse
+import gc
+import importlib
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from api.settings import api_settings
+from utils.log import logger
+from utils.memory import memory_report
+
+######################################################
+## Preload of the shared parts of the app
+######################################################
+
+
+def preload(modules: List[str], encodings: List[str]) -> None:
+    """
+    Import and warm the read-only parts of the app before forking, then freeze them.
+
+    Objects allocated before `gc.freeze` are moved to a permanent generation, so collections in the workers don't
+    write to their headers, which would copy the pages holding them into every worker.
+
+    Args:
+        modules: Modules to import, e.g. the agents, teams and their tool libraries
+        encodings: tiktoken encodings whose tables are loaded
+    """
+    # Collections during the preload would leave holes in pages that the workers later fill, unsharing them
+    gc.disable()
+    start = time.perf_counter()
+    import api.main  # noqa: F401
+
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning(f"Preload of {module} failed: {e}")
+    if encodings:
+        try:
+            import tiktoken
+
+            for encoding in encodings:
+                tiktoken.get_encoding(encoding)
+        except Exception as e:
+            logger.warning(f"Preload of the tiktoken encodings failed: {e}")
+    gc.freeze()
+    logger.info(f"Preloaded {len(sys.modules)} modules in {time.perf_counter() - start:.2f}s")
+
+
+def after_fork() -> None:
+    """Reset the state a worker must not share with its parent and siblings"""
+    from db.session import db_engine
+
+    # Connections opened by the parent belong to the parent, the worker opens its own
+    db_engine.dispose(close=False)
+    random.seed()
+    gc.enable()
+
+
+######################################################
+## Workers
+######################################################
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(
+    sockets: List[socket.socket], preloaded: bool, log_level: str, affinity: Optional[Tuple[str, List[str]]]
+) -> None:
+    import uvicorn
+
+    # The worker handles its own signals, uvicorn installs handlers for a graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    if preloaded:
+        after_fork()
+
+    from api.main import app
+
+    if affinity is not None:
+        from api.affinity import session_affinity
+
+        session_affinity.configure_workers(*affinity)
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=sockets)
+
+
+class Supervisor:
+    """
+    Forks the workers, restarts the ones that exit, and stops them all on SIGTERM or SIGINT.
+
+    Args:
+        sock: The listening socket shared by the workers
+        workers: Number of workers
+        preloaded: Whether the app was preloaded in this process
+        log_level: uvicorn log level of the workers
+        worker_sockets: With session affinity, the listening socket of each worker
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        workers: int,
+        preloaded: bool,
+        log_level: str,
+        worker_sockets: Optional[List[socket.socket]] = None,
+    ):
+        self.sock = sock
+        self.workers = workers
+        self.preloaded = preloaded
+        self.log_level = log_level
+        self.worker_sockets = worker_sockets
+        # Slot and start time of each worker, by pid
+        self.pids: Dict[int, Tuple[int, float]] = {}
+        self.stopping = False
+
+    def _worker_url(self, slot: int) -> str:
+        host, port = self.worker_sockets[slot].getsockname()[:2]  # type: ignore
+        return f"http://{'127.0.0.1' if host in ('0.0.0.0', '::') else host}:{port}"
+
+    def spawn(self, slot: int) -> None:
+        sockets = [self.sock]
+        affinity = None
+        if self.worker_sockets is not None:
+            sockets.append(self.worker_sockets[slot])
+            affinity = (self._worker_url(slot), [self._worker_url(i) for i in range(self.workers)])
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(sockets, self.preloaded, self.log_level, affinity)
+            except BaseException as e:
+                logger.error(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.pids[pid] = (slot, time.monotonic())
+        logger.info(f"Started worker {pid}")
+
+    def stop(self, signum: int, frame: object) -> None:
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report(self, signum: int, frame: object) -> None:
+        workers = sorted(self.pids.items(), key=lambda item: item[1][0])
+        processes = [("supervisor", os.getpid())] + [(f"worker {slot}", pid) for pid, (slot, _) in workers]
+        title = f"Memory with {'preloaded' if self.preloaded else 'independent'} workers"
+        print(memory_report(processes, title), flush=True)
+
+    def run(self, memory_report_after: Optional[float] = None) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.report)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        gc.enable()
+        if memory_report_after:
+            signal.setitimer(signal.ITIMER_REAL, memory_report_after)
+
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            worker = self.pids.pop(pid, None)
+            if worker is None or self.stopping:
+                continue
+            slot, started = worker
+            logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            # Don't spin when workers crash right at startup
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            # The restarted worker takes the port, and so the sessions, of the one it replaces
+            self.spawn(slot)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument(
+        "--no-preload", dest="preload", action="store_false", help="Import the app in each worker instead"
+    )
+    parser.add_argument(
+        "--memory-report-after", type=float, default=None, help="Print the memory of every process after N seconds"
+    )
+    parser.add_argument(
+        "--affinity", action="store_true", help="Forward the requests of a session to the worker owning it"
+    )
+    parser.add_argument(
+        "--worker-port-base",
+        type=int,
+        default=None,
+        help="First port of the workers with --affinity, port+1 by default",
+    )
+    args = parser.parse_args(argv)
+
+    sock = _bind(args.host, args.port, args.backlog)
+    worker_sockets = None
+    if args.affinity:
+        base = args.worker_port_base or args.port + 1
+        # Only reachable from this node, requests reach other nodes through their shared port
+        worker_sockets = [_bind("127.0.0.1", base + slot, args.backlog) for slot in range(args.workers)]
+    if args.preload:
+        preload(api_settings.preload_modules, api_settings.preload_encodings)
+    Supervisor(sock, args.workers, args.preload, args.log_level, worker_sockets).run(args.memory_report_after)
+
+
+if __name__ == "__main__":
+    main()
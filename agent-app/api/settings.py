@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import Field, field_validator
 from pydantic_core.core_schema import FieldValidationInfo
@@ -28,6 +28,196 @@ class ApiSettings(BaseSettings):
     # default cors origin list.
     cors_origin_list: Optional[List[str]] = Field(None, validate_default=True)
 
+    # Streamed frames are coalesced into one write until this many bytes are pending
+    stream_flush_bytes: int = 4096
+    # or until the oldest pending frame has waited this long. Set to 0 to write every frame immediately.
+    stream_flush_interval_ms: int = 20
+    # How often streaming routes check whether the client is still connected
+    disconnect_poll_interval_ms: int = 250
+    # Maximum number of runs of one batch request executing at the same time
+    batch_max_concurrency: int = 8
+    # Fraction of runs whose phase timings are logged, between 0 and 1
+    timing_log_sample_rate: float = 0.0
+    # Build the playground agents and teams in the background at startup instead of on first use
+    playground_warmup: bool = False
+
+    # Maximum number of agent and team runs executing at the same time in this process
+    admission_max_in_flight: int = 32
+    # Maximum number of runs of one agent or team executing at the same time
+    admission_max_in_flight_per_agent: int = 16
+    # Per agent/team overrides of admission_max_in_flight_per_agent, e.g. {"finance-researcher": 4}
+    admission_agent_limits: Dict[str, int] = Field(default_factory=dict)
+    # Runs over the limits wait in a queue of this size, further runs are rejected with 429
+    admission_max_queue: int = 64
+    # Runs waiting longer than this for a slot are rejected with 429
+    admission_queue_timeout_seconds: float = 30
+
+    # Deadline in seconds of runs that don't set one with the X-Request-Timeout header or the `timeout` field.
+    # None to let such runs take as long as their model and tools do.
+    run_default_timeout_seconds: Optional[float] = None
+    # Upper bound of the deadline a request can ask for
+    run_max_timeout_seconds: float = 600.0
+    # Floor of the statement timeout of database calls under a deadline, so that the partial answer of an expired
+    # run can still be stored
+    run_min_db_timeout_ms: int = 500
+
+    # Degrade runs progressively under load instead of letting every run time out
+    degrade_enabled: bool = True
+    # The load pressure is the highest of the admission queue depth, the event loop lag and the p95 run duration,
+    # each divided by its value below, at which the worker is considered saturated
+    degrade_queue_depth: int = 16
+    degrade_loop_lag_ms: float = 250
+    degrade_p95_seconds: float = 120
+    # The p95 run duration is taken over the runs finished in the last this many seconds, so it falls back to 0 once
+    # the worker is idle
+    degrade_p95_window_seconds: float = 300
+    # Pressure at which each degradation starts: fewer history runs, no optional tools, then a cheaper model
+    degrade_thresholds: Dict[str, float] = Field(
+        default_factory=lambda: {"history": 0.5, "optional_tools": 0.75, "cheaper_model": 1.0}
+    )
+    # Number of past runs of the session sent to the model by degraded runs
+    degrade_history_runs: int = 1
+    # Model each model is switched to by degraded runs, e.g. {"qwen-max": "qwen-turbo"}. Both models must be served by
+    # the endpoint of the agent or team, e.g. DashScope for the agents. Empty by default: no model is switched.
+    degrade_cheaper_models: Dict[str, str] = Field(default_factory=dict)
+    # Tool functions of each agent or team that only enrich its answers, dropped by degraded runs
+    degrade_optional_tools: Dict[str, List[str]] = Field(
+        default_factory=lambda: {
+            "sage": ["duckduckgo_search", "duckduckgo_news"],
+            "finance-researcher": [
+                "get_company_news",
+                "get_income_statements",
+                "get_key_financial_ratios",
+                "get_technical_indicators",
+                "get_historical_stock_prices",
+            ],
+        }
+    )
+
+    # Maximum number of async model calls executing at the same time in this process, further calls wait for their
+    # turn, shared fairly between tenants and by priority lane. None to not schedule model calls.
+    # Blocking model calls, e.g. of workflows run in a thread, are never scheduled.
+    fair_max_concurrent_model_calls: Optional[int] = None
+    # Tenants are told apart by "user_id", or by "api_key": the X-API-Key header or bearer token of the request,
+    # falling back to the user_id for requests without one
+    fair_tenant_by: str = "user_id"
+    # Share of the model capacity of each tenant relative to the others,
+    # e.g. {"user:ui": 4, "key:3fa9c1d2e4b5a678": 0.25}. The tenants of /v1/status/fair_scheduling show their ids.
+    fair_tenant_weights: Dict[str, float] = Field(default_factory=dict)
+    # Weight of the tenants without one in fair_tenant_weights
+    fair_default_weight: float = 1.0
+    # "memory" to schedule each process on its own, "postgres" to also share the turns of the tenants between all
+    # workers through the fair_share_tags table
+    fair_share_store: str = "memory"
+    # How often a worker syncs the turns of the tenants with the other workers, with the postgres store
+    fair_share_sync_interval_seconds: float = 1.0
+
+    # Model call slots of fair_max_concurrent_model_calls reserved for each priority lane, never taken by the others.
+    # Interactive runs are in the interactive lane, jobs in the background lane and batches in the bulk lane.
+    lane_reserved_model_calls: Dict[str, int] = Field(
+        default_factory=lambda: {"interactive": 8, "background": 2, "bulk": 1}
+    )
+    # Latency SLO in seconds of each lane, from the start of a model call, including its wait for a slot,
+    # to its first chunk
+    lane_latency_slo_seconds: Dict[str, float] = Field(
+        default_factory=lambda: {"interactive": 5.0, "background": 30.0, "bulk": 120.0}
+    )
+    # A lane is throttled down to its reserved slots once the p95 latency of interactive calls reaches this
+    # multiple of their SLO. Bulk is throttled first, then background.
+    lane_throttle_at: Dict[str, float] = Field(default_factory=lambda: {"bulk": 0.8, "background": 1.0})
+    # Seconds of recent interactive calls whose p95 latency drives the throttling
+    lane_latency_window_seconds: float = 60.0
+    # Tenants whose runs are moved to a lower lane, e.g. {"user:eval-bot": "bulk"}.
+    # Any request can also lower its own lane with the X-Priority header.
+    lane_tenants: Dict[str, str] = Field(default_factory=dict)
+
+    # Agents whose answers are cached, with the TTL in seconds of their answers, e.g. {"scholar": 3600}.
+    # Empty by default: the response cache is opt-in per agent.
+    response_cache_ttls: Dict[str, int] = Field(default_factory=dict)
+    # Maximum number of cached answers, least recently used answers are evicted first
+    response_cache_max_entries: int = 1024
+    # Agents whose answers are also served to similar questions, with the minimum cosine similarity of a match,
+    # e.g. {"sage": 0.95}. Agents also need a TTL in response_cache_ttls.
+    semantic_cache_thresholds: Dict[str, float] = Field(default_factory=dict)
+    # pgvector table of the semantic cache
+    semantic_cache_table: str = "response_cache"
+
+    # Agents and teams whose identical concurrent runs share one execution, e.g. ["scholar", "finance-researcher"].
+    # Runs are identical when they have the same model and normalized message. Runs with a session_id are never
+    # shared, since their answer depends on the history of the session.
+    single_flight_ids: List[str] = Field(default_factory=list)
+
+    # Seconds the result of a run request with an Idempotency-Key header is kept for its retries
+    idempotency_ttl_seconds: int = 86400
+    # How often a worker marks the keys of its runs in flight alive
+    idempotency_heartbeat_interval_seconds: float = 30.0
+    # A key whose first request is still running without a heartbeat for this many seconds, at least three
+    # heartbeats, is considered abandoned and runs again
+    idempotency_stale_after_seconds: float = 120.0
+    # Maximum seconds a retry waits for its first request running in another process, before a 409
+    idempotency_wait_timeout_seconds: float = 30.0
+
+    # Maximum number of events of a streamed run kept for clients resuming it with a Last-Event-ID header
+    stream_buffer_max_events: int = 2048
+    # Seconds a streamed run keeps going after its client disconnected, waiting for the client to resume it
+    stream_resume_grace_seconds: float = 10.0
+    # Seconds the events of a streamed run are kept after it finished
+    stream_buffer_retention_seconds: float = 60.0
+
+    # Serve agent and team runs over gRPC next to the REST API, requires the grpc extra
+    grpc_enabled: bool = False
+    # Port of the gRPC server
+    grpc_port: int = 50051
+    # Maximum number of concurrent runs on one HTTP/2 connection of a gRPC client
+    grpc_max_concurrent_streams: int = 256
+    # Seconds runs in flight get to finish when the gRPC server stops
+    grpc_shutdown_grace_seconds: float = 10.0
+
+    # Modules imported once by `python -m api.serve` before forking its workers, shared by all workers
+    preload_modules: List[str] = Field(
+        default_factory=lambda: [
+            "agents.operator",
+            "teams.operator",
+            "agno.tools.duckduckgo",
+            "agno.tools.yfinance",
+            "agno.tools.mcp",
+            "agno.vectordb.pgvector",
+            "agno.embedder.openai",
+            "newspaper",
+        ]
+    )
+    # tiktoken encodings whose tables are loaded before forking the workers
+    preload_encodings: List[str] = Field(default_factory=lambda: ["o200k_base", "cl100k_base"])
+
+    # Base URLs of all nodes of the deployment, including this one, e.g. ["http://10.0.1.5:8000", "http://10.0.2.7:8000"].
+    # Requests of a session are forwarded to the node owning it. Empty to only route between the workers of a node.
+    affinity_nodes: List[str] = Field(default_factory=list)
+    # Base URL of this node, as listed in affinity_nodes
+    affinity_node: Optional[str] = None
+    # Points per node or worker on the consistent hash ring of sessions
+    affinity_virtual_nodes: int = 64
+    # Seconds a node or worker that couldn't be reached is skipped, its sessions are served where they arrive
+    affinity_member_down_seconds: float = 30.0
+    # Seconds to connect to the owner of a session before serving the request locally
+    affinity_connect_timeout: float = 1.0
+
+    # Run a background job worker in each api process
+    jobs_enabled: bool = True
+    # Maximum number of background jobs executing at the same time in this process,
+    # independent of the admission limits of interactive runs
+    job_max_concurrency: int = 4
+    # How often a worker checks for queued jobs right after its queue ran empty
+    job_poll_interval_seconds: float = 1.0
+    # An idle worker waits twice as long between checks each time, up to this many seconds. Jobs submitted to
+    # the same process are claimed right away.
+    job_idle_poll_interval_seconds: float = 30.0
+    # How often a worker records the progress of its jobs
+    job_heartbeat_interval_seconds: float = 5.0
+    # Running jobs without a heartbeat for this long are re-claimed by another worker
+    job_stale_after_seconds: float = 60.0
+    # Jobs claimed this many times without finishing are failed
+    job_max_attempts: int = 3
+
     @field_validator("cors_origin_list", mode="before")
     def set_cors_origin_list(cls, cors_origin_list, info: FieldValidationInfo):
         valid_cors = cors_origin_list or []
@@ -0,0 +1,134 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from agno.agent import Agent
+from agno.team import Team
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.cache import normalize_message
+from api.run_streams import RunChannel, channel_response, run_streams
+from api.settings import api_settings
+from api.streaming import StreamEvent, StreamEventType
+from utils.timing import PhaseTimeline
+
+######################################################
+## Fan-out of one run to several requests
+######################################################
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent runs into one execution.
+
+    Runs of the same agent or team, model, normalized message and user started while a run for them is in flight
+    attach to it and receive its events instead of running again. Only runs without a session are coalesced: the
+    answer of a session-bound run depends on the history of its session. Runs of different users are never
+    coalesced, since agents address their user by id and remember what they learn about them.
+
+    Args:
+        ids: Agent and team ids whose runs are coalesced
+    """
+
+    def __init__(self, ids: List[str]):
+        self.ids = set(ids)
+        self._flights: Dict[Tuple[str, str, str, str, Optional[str]], RunChannel] = {}
+        self.started = 0
+        self.joined = 0
+
+    def enabled(self, target_id: str, session_id: Optional[str]) -> bool:
+        return target_id in self.ids and session_id is None
+
+    def attach(
+        self,
+        kind: str,
+        target_id: str,
+        model_id: str,
+        message: str,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> Tuple[RunChannel, bool]:
+        """
+        Returns the channel of the in-flight run for this request, creating it if there is none.
+
+        The channel is opened with the user and session of the request, so the runs of a user can be followed and
+        resumed whichever of its requests started them.
+
+        Returns:
+            The channel, and whether the caller leads the run. The leader must either `run` or `abort` it.
+        """
+        key = (kind, target_id, model_id, normalize_message(message), user_id)
+        channel = self._flights.get(key)
+        # A run whose first events were dropped from its buffer can't be replayed whole anymore
+        if channel is not None and channel.offset == 0:
+            self.joined += 1
+            return channel, False
+        channel = self._flights[key] = run_streams.open(kind, target_id, user_id=user_id, session_id=session_id)
+        self.started += 1
+        return channel, True
+
+    def _remove(self, channel: RunChannel) -> None:
+        for key, flight in list(self._flights.items()):
+            if flight is channel:
+                del self._flights[key]
+
+    def run(
+        self,
+        channel: RunChannel,
+        runner: Union[Agent, Team],
+        source: AsyncIterator[StreamEvent],
+        release: Callable[[Any], None],
+    ) -> None:
+        """
+        Start the run of a channel, e.g. one returned to its leader by `attach`.
+
+        Args:
+            channel: The channel of the run
+            runner: The agent or team producing the events
+            source: The event stream of the run
+            release: Returns the runner and any resources held by the run
+        """
+
+        def release_flight(runner: Union[Agent, Team]) -> None:
+            self._remove(channel)
+            release(runner)
+
+        run_streams.run(channel, runner, source, release_flight)
+
+    def abort(self, channel: RunChannel, message: str) -> None:
+        """Fail a run that could not be started, sending the error to the requests attached to it"""
+        self._remove(channel)
+        channel.publish(StreamEvent(StreamEventType.ERROR, {"message": message}))
+        channel.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ids": sorted(self.ids),
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "joined": self.joined,
+        }
+
+
+single_flight = SingleFlight(ids=api_settings.single_flight_ids)
+
+
+async def flight_response(
+    channel: RunChannel,
+    stream: bool,
+    events: bool,
+    timeline: PhaseTimeline,
+    leader: bool,
+    headers: Optional[Dict[str, str]] = None,
+) -> Union[StreamingResponse, JSONResponse]:
+    """
+    Build the response of a request attached to a coalesced run, with an `X-Single-Flight` header telling whether
+    the request leads or joined the run, and any other headers given.
+    """
+    # A joined request only waits for the run, the phases of the run itself are in the timeline of its leader
+    return await channel_response(
+        channel,
+        stream,
+        events,
+        timeline,
+        headers={**(headers or {}), "X-Single-Flight": "leader" if leader else "joined"},
+        wait_phase=None if leader else "single_flight",
+    )
@@ -0,0 +1,439 @@
+import asyncio
+import weakref
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Set, Union
+
+import orjson
+from agno.agent import Agent
+from agno.memory.v2.memory import Memory
+from agno.run.response import RunEvent
+from agno.team import Team
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from api.settings import api_settings
+from utils.log import logger
+from utils.metrics import RunTracker
+from utils.timing import PhaseTimeline
+
+######################################################
+## Structured SSE events for agent and team runs
+######################################################
+
+
+class StreamEventType:
+    """Event names sent on the `event:` line of an SSE frame"""
+
+    RUN_STARTED = "run_started"
+    CONTENT = "content"
+    REASONING = "reasoning"
+    TOOL_STARTED = "tool_started"
+    TOOL_COMPLETED = "tool_completed"
+    MEMBER_RESPONSE = "member_response"
+    RUN_COMPLETED = "run_completed"
+    ERROR = "error"
+    # The run was stopped by the deadline of its request, the events before it are its partial answer
+    DEADLINE_EXCEEDED = "deadline_exceeded"
+    TIMING = "timing"
+
+
+@dataclass
+class StreamEvent:
+    """A single typed event of a run stream"""
+
+    event: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    # SSE id of the event, set on events of resumable streams
+    id: Optional[str] = None
+
+    def encode(self) -> bytes:
+        """Encode the event as an SSE frame"""
+        frame = b"event: " + self.event.encode() + b"\ndata: " + orjson.dumps(self.data, default=str) + b"\n\n"
+        if self.id is not None:
+            return b"id: " + self.id.encode() + b"\n" + frame
+        return frame
+
+
+def _tool_data(tool: Any) -> Dict[str, Any]:
+    data: Dict[str, Any] = {
+        "tool_call_id": tool.tool_call_id,
+        "tool_name": tool.tool_name,
+        "tool_args": tool.tool_args,
+    }
+    if tool.result is not None or tool.tool_call_error:
+        data["result"] = tool.result
+        data["error"] = bool(tool.tool_call_error)
+        data["duration"] = tool.metrics.time if tool.metrics is not None else None
+    return data
+
+
+def _member_data(member_response: Any) -> Dict[str, Any]:
+    return {
+        "agent_id": getattr(member_response, "agent_id", None),
+        "team_id": getattr(member_response, "team_id", None),
+        "run_id": member_response.run_id,
+        "content": member_response.content,
+        "tools": [_tool_data(t) for t in member_response.tools or []],
+        "metrics": member_response.metrics,
+    }
+
+
+async def run_events(runner: Union[Agent, Team], message: str) -> AsyncIterator[StreamEvent]:
+    """
+    Run an agent or team and convert its response stream into typed events.
+
+    Args:
+        runner: The agent or team instance to run
+        message: User message to process
+
+    Yields:
+        StreamEvent: content deltas, reasoning, tool start/finish, member responses and final metrics
+    """
+    tools_started: Set[Optional[str]] = set()
+    tools_completed: Set[Optional[str]] = set()
+
+    run_response = await runner.arun(message, stream=True, stream_intermediate_steps=True)
+    async for chunk in run_response:
+        if chunk.event == RunEvent.run_started.value:
+            yield StreamEvent(
+                StreamEventType.RUN_STARTED,
+                {"run_id": chunk.run_id, "session_id": chunk.session_id, "model": runner.model.id},  # type: ignore
+            )
+        elif chunk.event == RunEvent.tool_call_started.value:
+            for tool in chunk.tools or []:
+                if tool.tool_call_id not in tools_started:
+                    tools_started.add(tool.tool_call_id)
+                    yield StreamEvent(StreamEventType.TOOL_STARTED, _tool_data(tool))
+        elif chunk.event == RunEvent.tool_call_completed.value:
+            for tool in chunk.tools or []:
+                if tool.tool_call_id not in tools_completed and (tool.result is not None or tool.tool_call_error):
+                    tools_completed.add(tool.tool_call_id)
+                    yield StreamEvent(StreamEventType.TOOL_COMPLETED, _tool_data(tool))
+        elif chunk.event in (RunEvent.reasoning_started.value, RunEvent.reasoning_step.value):
+            content = chunk.content.model_dump() if hasattr(chunk.content, "model_dump") else chunk.content
+            yield StreamEvent(StreamEventType.REASONING, {"content": content})
+        elif chunk.event == RunEvent.run_response.value:
+            if chunk.reasoning_content or chunk.thinking:
+                yield StreamEvent(
+                    StreamEventType.REASONING, {"content": chunk.thinking, "reasoning": chunk.reasoning_content}
+                )
+            if isinstance(chunk.content, str) and chunk.content:
+                yield StreamEvent(StreamEventType.CONTENT, {"delta": chunk.content})
+
+    final = runner.run_response
+    if final is None:
+        return
+    for member_response in getattr(final, "member_responses", None) or []:
+        yield StreamEvent(StreamEventType.MEMBER_RESPONSE, _member_data(member_response))
+    yield StreamEvent(
+        StreamEventType.RUN_COMPLETED,
+        {
+            "run_id": final.run_id,
+            "session_id": final.session_id,
+            "model": final.model,
+            "metrics": final.metrics,
+        },
+    )
+
+
+async def event_stream(runner: Union[Agent, Team], message: str) -> AsyncGenerator[StreamEvent, None]:
+    """
+    Run an agent or team and yield its events.
+
+    Errors raised by the run are sent as an `error` event, since the response status is already committed.
+    """
+    try:
+        async for event in run_events(runner, message):
+            yield event
+    except Exception as e:
+        yield StreamEvent(StreamEventType.ERROR, {"message": str(e)})
+
+
+async def with_timing(
+    source: AsyncIterator[StreamEvent], timeline: PhaseTimeline, runner: Union[Agent, Team]
+) -> AsyncGenerator[StreamEvent, None]:
+    """Yield the events of a run, then a final `timing` event with the phase durations of the request"""
+    async for event in source:
+        yield event
+    yield StreamEvent(StreamEventType.TIMING, timeline.finish(runner).summary())
+
+
+######################################################
+## Coalescing of stream frames into fewer writes
+######################################################
+
+# Events that are written out immediately instead of waiting for the flush window
+URGENT_EVENTS = {
+    StreamEventType.RUN_STARTED,
+    StreamEventType.TOOL_STARTED,
+    StreamEventType.TOOL_COMPLETED,
+    StreamEventType.MEMBER_RESPONSE,
+    StreamEventType.RUN_COMPLETED,
+    StreamEventType.ERROR,
+    StreamEventType.DEADLINE_EXCEEDED,
+}
+
+
+@dataclass
+class CoalescingStats:
+    """Counters of the coalescing buffer, aggregated over all streams of this process"""
+
+    streams: int = 0
+    frames: int = 0
+    flushes: int = 0
+    bytes: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "streams": self.streams,
+            "frames": self.frames,
+            "flushes": self.flushes,
+            "bytes": self.bytes,
+            "avg_flush_bytes": self.bytes / self.flushes if self.flushes else 0.0,
+            "frames_per_flush": self.frames / self.flushes if self.flushes else 0.0,
+        }
+
+
+coalescing_stats = CoalescingStats()
+
+
+class CoalescingBuffer:
+    """
+    Batches stream frames into fewer, larger writes.
+
+    Frames are buffered until `flush_bytes` are pending or `flush_interval` seconds have passed since the
+    first pending frame. The first frame of a stream and urgent events (tool calls, member responses,
+    final and error events) are flushed immediately, so time-to-first-token is unchanged.
+
+    Args:
+        flush_bytes: Flush once this many bytes are pending
+        flush_interval: Maximum time in seconds a frame waits in the buffer. 0 disables coalescing.
+    """
+
+    def __init__(self, flush_bytes: int, flush_interval: float):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._pending_since = 0.0
+        self._first_content_sent = False
+
+    def _add(self, item: Union[StreamEvent, str, bytes]) -> bool:
+        """Buffer a frame and return True if the buffer should be flushed now"""
+        urgent = False
+        if isinstance(item, StreamEvent):
+            urgent = item.event in URGENT_EVENTS
+            frame = item.encode()
+        elif isinstance(item, str):
+            frame = item.encode()
+        else:
+            frame = item
+
+        if not self._pending:
+            self._pending_since = monotonic()
+        self._pending.append(frame)
+        self._pending_bytes += len(frame)
+        coalescing_stats.frames += 1
+        if not urgent and not self._first_content_sent:
+            # Never delay the first token
+            self._first_content_sent = True
+            return True
+        return urgent or self.flush_interval <= 0 or self._pending_bytes >= self.flush_bytes
+
+    def _flush(self) -> bytes:
+        data = b"".join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        coalescing_stats.flushes += 1
+        coalescing_stats.bytes += len(data)
+        return data
+
+    async def coalesce(
+        self, source: AsyncIterator[Union[StreamEvent, str, bytes, None]]
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Read frames from the source and yield them in coalesced writes.
+
+        Args:
+            source: Async iterator of events, text chunks or encoded frames. None items are skipped.
+
+        Yields:
+            bytes: One or more frames joined together
+        """
+        coalescing_stats.streams += 1
+        iterator = source.__aiter__()
+        next_item: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if next_item is None:
+                    next_item = asyncio.ensure_future(iterator.__anext__())
+                if self._pending:
+                    # Wait for the next frame only until the pending frames are due
+                    timeout = max(0.0, self._pending_since + self.flush_interval - monotonic())
+                    done, _ = await asyncio.wait({next_item}, timeout=timeout)
+                    if not done:
+                        yield self._flush()
+                        continue
+                try:
+                    item = await next_item
+                except StopAsyncIteration:
+                    break
+                finally:
+                    if next_item.done():
+                        next_item = None
+                if item is not None and self._add(item):
+                    yield self._flush()
+            if self._pending:
+                yield self._flush()
+        finally:
+            if next_item is not None and not next_item.done():
+                next_item.cancel()
+                await asyncio.wait({next_item})
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+def coalesced(source: AsyncIterator[Union[StreamEvent, str, bytes, None]]) -> AsyncGenerator[bytes, None]:
+    """Wrap a stream in a CoalescingBuffer configured from the api settings"""
+    buffer = CoalescingBuffer(
+        flush_bytes=api_settings.stream_flush_bytes,
+        flush_interval=api_settings.stream_flush_interval_ms / 1000,
+    )
+    return buffer.coalesce(source)
+
+
+######################################################
+## Cancellation of runs when the client disconnects
+######################################################
+
+
+async def _wait_for_disconnect(request: Request, poll_interval: float) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(poll_interval)
+
+
+def record_cancelled_run(runner: Union[Agent, Team], reason: str = "client disconnect") -> None:
+    """
+    Store the partial answer of a cancelled run in the session, marked with the RunCancelled event.
+
+    Args:
+        runner: The agent or team whose run was cancelled
+        reason: Why the run was cancelled, for the log
+    """
+    run_response = runner.run_response
+    if run_response is None:
+        return
+    run_response.event = RunEvent.run_cancelled.value
+    content = run_response.content if isinstance(run_response.content, str) else ""
+    logger.info(f"Run {run_response.run_id} cancelled after {reason}, {len(content)} chars streamed")
+
+    session_id = runner.session_id
+    if session_id is None:
+        return
+    try:
+        if isinstance(runner.memory, Memory):
+            runner.memory.add_run(session_id=session_id, run=run_response)  # type: ignore
+        runner.write_to_storage(session_id=session_id, user_id=runner.user_id)
+    except Exception as e:
+        logger.warning(f"Could not record cancelled run {run_response.run_id}: {e}")
+
+
+async def cancellable_stream(
+    request: Request,
+    runner: Union[Agent, Team],
+    source: AsyncIterator[Any],
+    release: Callable[[Any], None],
+) -> AsyncGenerator[Any, None]:
+    """
+    Yield from a run stream and cancel the run as soon as the client disconnects.
+
+    Cancelling the pending read of the stream aborts the upstream model request and any pending tool call
+    awaited by the run. A run that did not finish, because the client went away or the response was closed,
+    is recorded as cancelled with its partial answer. The runner is released once the stream is done.
+
+    Args:
+        request: The request of the streaming response
+        runner: The agent or team producing the stream
+        source: The run stream
+        release: Returns the runner to its pool
+    """
+    iterator = source.__aiter__()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(request, api_settings.disconnect_poll_interval_ms / 1000))
+    next_item: Optional[asyncio.Future] = None
+    finished = False
+    try:
+        while True:
+            next_item = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({next_item, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_item.done():
+                break
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                finished = True
+                break
+            except Exception:
+                finished = True
+                raise
+            yield item
+    finally:
+        disconnected.cancel()
+        if next_item is not None and not next_item.done():
+            next_item.cancel()
+            await asyncio.wait({next_item})
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if not finished:
+            record_cancelled_run(runner)
+        release(runner)
+
+
+async def track_tokens(source: AsyncIterator[Any], tracker: RunTracker) -> AsyncGenerator[Any, None]:
+    """Yield from a run stream and mark the first content on the tracker of the run"""
+    try:
+        async for item in source:
+            if (isinstance(item, StreamEvent) and item.event == StreamEventType.CONTENT) or (
+                isinstance(item, str) and item
+            ):
+                tracker.token()
+            yield item
+    finally:
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def run_stream_response(
+    request: Request,
+    runner: Union[Agent, Team],
+    source: AsyncIterator[Any],
+    release: Callable[[Any], None],
+    tracker: Optional[RunTracker] = None,
+) -> StreamingResponse:
+    """
+    Build the SSE response of a run: cancelled on disconnect, coalesced, and releasing the runner when done.
+
+    Args:
+        request: The incoming request
+        runner: The agent or team producing the stream
+        source: The run stream
+        release: Returns the runner and any resources held by the run
+        tracker: Tracker of the run, marks its time to first token
+    """
+    released = False
+
+    def release_once(runner: Union[Agent, Team]) -> None:
+        nonlocal released
+        if not released:
+            released = True
+            release(runner)
+
+    if tracker is not None:
+        source = track_tokens(source, tracker)
+    stream = coalesced(cancellable_stream(request, runner, source, release_once))
+    # A response closed before it starts never runs the stream, so release when the stream is collected
+    weakref.finalize(stream, release_once, runner)
+    return StreamingResponse(stream, media_type="text/event-stream")
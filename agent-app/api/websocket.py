@@ -0,0 +1,129 @@
+import asyncio
+from typing import Any, Dict, Optional, Union
+
+import orjson
+from agno.agent import Agent
+from agno.team import Team
+from fastapi import WebSocket, WebSocketDisconnect
+
+from api.admission import AdmissionRejected, admission_controller
+from api.streaming import StreamEvent, StreamEventType, event_stream, record_cancelled_run
+from utils.log import logger
+from utils.metrics import RunTracker
+
+######################################################
+## Multi-turn sessions over a WebSocket
+######################################################
+
+# Event sent when a turn was cancelled by the client
+RUN_CANCELLED = "run_cancelled"
+
+
+def keep_session_loaded(runner: Union[Agent, Team]) -> None:
+    """
+    Skip reloading the session from storage on the next runs of a runner.
+
+    A run reads its session from storage before it starts, even though the runner already holds the session it
+    wrote at the end of its previous run. While a socket holds the runner exclusively, the in-memory session is
+    up to date, so the read is served from memory as long as the session id doesn't change.
+
+    Args:
+        runner: The agent or team bound to the socket
+    """
+    read_from_storage = type(runner).read_from_storage
+
+    def read_loaded_session(session_id: str, user_id: Optional[str] = None) -> Any:
+        session = getattr(runner, "agent_session", None) or getattr(runner, "team_session", None)
+        if session is not None and session.session_id == session_id:
+            return session
+        return read_from_storage(runner, session_id=session_id, user_id=user_id)  # type: ignore
+
+    runner.read_from_storage = read_loaded_session  # type: ignore
+
+
+def reload_session_from_storage(runner: Union[Agent, Team]) -> None:
+    """Undo `keep_session_loaded`, e.g. before the runner is returned to its pool"""
+    runner.__dict__.pop("read_from_storage", None)
+
+
+class SessionSocket:
+    """
+    Serves the turns of one session over a WebSocket, with the same agent instance for its whole lifetime.
+
+    The client sends `{"type": "message", "message": "..."}` to start a turn and `{"type": "cancel"}` to cancel
+    the running turn. The server sends the events of each turn as `{"event": ..., "turn": n, "data": {...}}`
+    frames: the events of the SSE stream, and `run_cancelled` when a turn was cancelled. One turn runs at a time.
+    Each turn waits for a run slot of the admission controller, an idle socket holds none.
+
+    Args:
+        websocket: The accepted WebSocket
+        runner: The agent bound to the session
+        admission_key: Key of the runs in the admission controller, e.g. the agent id
+        kind: "agent" or "team", labels the metrics of the runs
+    """
+
+    def __init__(self, websocket: WebSocket, runner: Union[Agent, Team], admission_key: str, kind: str = "agent"):
+        self.websocket = websocket
+        self.runner = runner
+        self.admission_key = admission_key
+        self.kind = kind
+        self.turns = 0
+        self._turn: Optional[asyncio.Task] = None
+
+    async def send(self, turn: int, event: str, data: Dict[str, Any]) -> None:
+        frame = orjson.dumps({"event": event, "turn": turn, "data": data}, default=str)
+        await self.websocket.send_text(frame.decode())
+
+    async def serve(self) -> None:
+        """Receive messages until the client disconnects, then cancel the running turn"""
+        try:
+            while True:
+                message = await self.websocket.receive_json()
+                kind = message.get("type") if isinstance(message, dict) else None
+                if kind == "message" and isinstance(message.get("message"), str):
+                    if self._turn is not None and not self._turn.done():
+                        await self.send(self.turns, StreamEventType.ERROR, {"message": "A turn is already running"})
+                        continue
+                    self.turns += 1
+                    self._turn = asyncio.create_task(self._run_turn(self.turns, message["message"]))
+                elif kind == "cancel":
+                    if self._turn is not None and not self._turn.done():
+                        self._turn.cancel()
+                else:
+                    await self.send(self.turns, StreamEventType.ERROR, {"message": "Unknown message"})
+        except WebSocketDisconnect:
+            logger.debug(f"Session socket closed after {self.turns} turns")
+        finally:
+            if self._turn is not None and not self._turn.done():
+                self._turn.cancel()
+                await asyncio.wait({self._turn})
+
+    async def _run_turn(self, turn: int, message: str) -> None:
+        try:
+            ticket = await admission_controller.admit(self.admission_key)
+        except AdmissionRejected as e:
+            await self.send(turn, StreamEventType.ERROR, {"message": str(e), "retry_after": e.retry_after})
+            return
+
+        tracker = RunTracker(self.kind, self.admission_key)
+        try:
+            event: Optional[StreamEvent] = None
+            async for event in event_stream(self.runner, message):
+                if event.event == StreamEventType.CONTENT:
+                    tracker.token()
+                await self.send(turn, event.event, event.data)
+            if event is not None and event.event != StreamEventType.ERROR:
+                # The runner now holds the session it just stored
+                keep_session_loaded(self.runner)
+        except asyncio.CancelledError:
+            record_cancelled_run(self.runner)
+            try:
+                await self.send(turn, RUN_CANCELLED, {})
+            except Exception:
+                # The socket is already closed
+                pass
+        except Exception as e:
+            logger.warning(f"Session socket turn {turn} failed: {e}")
+        finally:
+            tracker.finish(self.runner)
+            ticket.release()
@@ -0,0 +1,50 @@
+"""Create run_jobs table
+
+Revision ID: 7c1f2a9d4e01
+Revises:
+Create Date: 2026-10-17 09:12:44.318205
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "7c1f2a9d4e01"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_jobs",
+        sa.Column("id", sa.String(length=36), nullable=False),
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("target_id", sa.String(length=64), nullable=False),
+        sa.Column("model", sa.String(length=64), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("user_id", sa.String(length=255), nullable=True),
+        sa.Column("session_id", sa.String(length=255), nullable=True),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("progress", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("result", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("worker_id", sa.String(length=64), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        schema="public",
+    )
+    op.create_index(op.f("ix_public_run_jobs_status"), "run_jobs", ["status"], unique=False, schema="public")
+    op.create_index(op.f("ix_public_run_jobs_created_at"), "run_jobs", ["created_at"], unique=False, schema="public")
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_public_run_jobs_created_at"), table_name="run_jobs", schema="public")
+    op.drop_index(op.f("ix_public_run_jobs_status"), table_name="run_jobs", schema="public")
+    op.drop_table("run_jobs", schema="public")
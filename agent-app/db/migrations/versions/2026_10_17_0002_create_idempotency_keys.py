@@ -0,0 +1,42 @@
+"""Create idempotency_keys table
+
+Revision ID: 3b8e6f0c2a17
+Revises: 7c1f2a9d4e01
+Create Date: 2026-10-17 14:03:27.551940
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "3b8e6f0c2a17"
+down_revision = "7c1f2a9d4e01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("scope", sa.String(length=80), nullable=False),
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("request_hash", sa.String(length=64), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("owner", sa.String(length=36), nullable=False),
+        sa.Column("result", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("scope", "key"),
+        schema="public",
+    )
+    op.create_index(
+        op.f("ix_public_idempotency_keys_expires_at"), "idempotency_keys", ["expires_at"], unique=False, schema="public"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_public_idempotency_keys_expires_at"), table_name="idempotency_keys", schema="public")
+    op.drop_table("idempotency_keys", schema="public")
@@ -0,0 +1,31 @@
+"""Create fair_share_tags table
+
+Revision ID: 5d2a9c4e7b30
+Revises: 3b8e6f0c2a17
+Create Date: 2026-10-17 16:21:48.203117
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5d2a9c4e7b30"
+down_revision = "3b8e6f0c2a17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "fair_share_tags",
+        sa.Column("tenant", sa.String(length=255), nullable=False),
+        sa.Column("finish", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("tenant"),
+        schema="public",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("fair_share_tags", schema="public")
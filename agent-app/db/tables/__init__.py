@@ -1 +1,4 @@
 from db.tables.base import Base
+from db.tables.fair_share_tag import FairShareTag
+from db.tables.idempotency_key import IdempotencyKey
+from db.tables.run_job import RunJob
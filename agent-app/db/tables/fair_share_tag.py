@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from db.tables.base import Base
+
+
+class FairShareTag(Base):
+    """
+    The virtual finish time of the model calls of a tenant, shared by all workers for weighted fair scheduling.
+
+    The row of the empty tenant holds the virtual time of the scheduler: the start tag of the last call started.
+    """
+
+    __tablename__ = "fair_share_tags"
+
+    # "user:<user_id>", "key:<hash of the api key>" or "" for the virtual time
+    tenant: Mapped[str] = mapped_column(String(255), primary_key=True)
+    finish: Mapped[float] = mapped_column(Float)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import DateTime, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from db.tables.base import Base
+
+
+class IdempotencyKey(Base):
+    """
+    An `Idempotency-Key` of a run request and the result of its run.
+
+    A key is `running` while its first request executes and `completed` once the result is stored. Keys of failed
+    runs are deleted so the request can be retried. Keys expire after a TTL.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    # "agent:<agent_id>" or "team:<team_id>"
+    scope: Mapped[str] = mapped_column(String(80), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # Hash of the request the key was first used with
+    request_hash: Mapped[str] = mapped_column(String(64))
+    status: Mapped[str] = mapped_column(String(16))
+    # Request that runs the key
+    owner: Mapped[str] = mapped_column(String(36))
+    result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import DateTime, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from db.tables.base import Base
+
+
+class RunJob(Base):
+    """
+    A run of an agent or team executed in the background.
+
+    Jobs are `queued` when submitted, `running` while claimed by a worker, and end `succeeded` or `failed`.
+    A running job whose heartbeat is stale is re-claimed by another worker.
+    """
+
+    __tablename__ = "run_jobs"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    # "agent" or "team"
+    kind: Mapped[str] = mapped_column(String(16))
+    target_id: Mapped[str] = mapped_column(String(64))
+    model: Mapped[str] = mapped_column(String(64))
+    message: Mapped[str] = mapped_column(Text)
+    user_id: Mapped[Optional[str]] = mapped_column(String(255))
+    session_id: Mapped[Optional[str]] = mapped_column(String(255))
+
+    status: Mapped[str] = mapped_column(String(16), index=True, default="queued")
+    progress: Mapped[Dict[str, Any]] = mapped_column(JSONB, default=dict)
+    result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(64))
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
@@ -0,0 +1,104 @@
+"""
+Measure the warm-session hit rate of a multi-worker API with and without session affinity.
+
+Starts `python -m api.serve` locally, once with independent workers and once with `--affinity`, and sends turns of
+many sessions on fresh connections, so every turn can land on any worker. A turn is a hit when the worker serving it
+already served its session, i.e. where the loaded session, warm agents and MCP connections of the session would be.
+
+Usage:
+    PYTHONPATH=. python scripts/affinity_harness.py --workers 4 --sessions 200 --turns 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+
+def start_server(port: int, workers: int, affinity: bool) -> subprocess.Popen:
+    command = [sys.executable, "-m", "api.serve", "--workers", str(workers), "--port", str(port)]
+    command += ["--log-level", "warning", "--no-preload"]
+    if affinity:
+        command += ["--affinity", "--worker-port-base", str(port + 1)]
+    env = {**os.environ, "JOBS_ENABLED": "false"}
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(url: str, workers: int, timeout: float = 120) -> None:
+    """Wait until every worker answers, each fresh connection may reach another one"""
+    deadline = time.monotonic() + timeout
+    pids = set()
+    while time.monotonic() < deadline:
+        try:
+            pids.add(httpx.get(f"{url}/v1/memory", timeout=2).json()["pid"])
+            if len(pids) >= workers:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} didn't start {workers} workers in {timeout}s")
+
+
+async def run_turns(url: str, sessions: int, turns: int, concurrency: int) -> Dict[str, float]:
+    order: List[str] = [f"harness-{session}" for session in range(sessions) for _ in range(turns)]
+    random.shuffle(order)
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Dict] = []
+    # No keep-alive: every turn is a new connection, like requests from many clients behind a load balancer
+    limits = httpx.Limits(max_keepalive_connections=0)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+
+        async def turn(session_id: str) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(f"{url}/v1/affinity/sessions/{session_id}")
+                response.raise_for_status()
+                results.append({**response.json(), "seconds": time.perf_counter() - start})
+
+        await asyncio.gather(*(turn(session_id) for session_id in order))
+
+    latencies = sorted(result["seconds"] for result in results)
+    workers_per_session: Dict[str, set] = {}
+    for result in results:
+        workers_per_session.setdefault(result["session_id"], set()).add(result["pid"])
+    return {
+        "hit_rate": sum(result["warm"] for result in results) / len(results),
+        # Without evictions, the best possible hit rate: every turn but the first of each session
+        "max_hit_rate": (turns - 1) / turns,
+        "workers_per_session": sum(len(pids) for pids in workers_per_session.values()) / len(workers_per_session),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"{'mode':<10}{'hit rate':>10}{'max':>8}{'workers/session':>18}{'p50 ms':>10}{'p95 ms':>10}")
+    for affinity in (False, True):
+        server = start_server(args.port, args.workers, affinity)
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            wait_until_ready(url, args.workers)
+            result = asyncio.run(run_turns(url, args.sessions, args.turns, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        print(
+            f"{'affinity' if affinity else 'none':<10}{result['hit_rate']:>10.1%}{result['max_hit_rate']:>8.1%}"
+            f"{result['workers_per_session']:>18.2f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8790)
+    main(parser.parse_args())
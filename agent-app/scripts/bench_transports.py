@@ -0,0 +1,96 @@
+"""
+Compare streamed agent runs over REST (SSE on HTTP/1.1) and gRPC (HTTP/2).
+
+Runs the same message against a running API on both transports with the same concurrency, and prints the time to
+the first event, the total time of a run and the throughput of each transport.
+
+To measure the transports rather than the model, enable the response cache of the agent, e.g.
+RESPONSE_CACHE_TTLS='{"sage": 3600}', so that every run after the first one is replayed from the cache.
+
+Usage:
+    GRPC_ENABLED=true uvicorn api.main:app
+    PYTHONPATH=. python scripts/bench_transports.py --agent sage --runs 200 --concurrency 20
+"""
+
+import argparse
+import asyncio
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import grpc
+import httpx
+
+from api.rpc import runs_pb2, runs_pb2_grpc
+
+# (seconds to the first event, seconds to the end of the run)
+Sample = Tuple[float, float]
+
+
+async def rest_run(client: httpx.AsyncClient, url: str, payload: Dict) -> Sample:
+    start = perf_counter()
+    first = None
+    async with client.stream("POST", url, json=payload) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            if first is None:
+                first = perf_counter() - start
+    return first or 0.0, perf_counter() - start
+
+
+async def grpc_run(stub: runs_pb2_grpc.RunsStub, request: runs_pb2.RunRequest) -> Sample:
+    start = perf_counter()
+    first = None
+    async for _ in stub.RunAgent(request):
+        if first is None:
+            first = perf_counter() - start
+    return first or 0.0, perf_counter() - start
+
+
+async def bench(run: Callable[[], Awaitable[Sample]], runs: int, concurrency: int) -> Tuple[List[Sample], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited() -> Sample:
+        async with semaphore:
+            return await run()
+
+    start = perf_counter()
+    samples = await asyncio.gather(*(limited() for _ in range(runs)))
+    return list(samples), perf_counter() - start
+
+
+def report(transport: str, samples: List[Sample], elapsed: float) -> None:
+    for label, values in (("first event", [s[0] for s in samples]), ("total", [s[1] for s in samples])):
+        p95 = quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+        print(f"{transport:<6} {label:<12} p50={median(values) * 1000:8.1f}ms p95={p95 * 1000:8.1f}ms")
+    print(f"{transport:<6} throughput   {len(samples) / elapsed:8.1f} runs/s")
+
+
+async def main(args: argparse.Namespace) -> None:
+    payload = {"message": args.message, "model": args.model, "stream": True, "stream_events": True}
+    url = f"{args.rest_url}/v1/agents/{args.agent}/runs"
+    request = runs_pb2.RunRequest(target_id=args.agent, message=args.message, model=args.model)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        # Warm up the agent, and the response cache when it's enabled
+        await rest_run(client, url, payload)
+        samples, elapsed = await bench(lambda: rest_run(client, url, payload), args.runs, args.concurrency)
+    report("rest", samples, elapsed)
+
+    async with grpc.aio.insecure_channel(args.grpc_target) as channel:
+        stub = runs_pb2_grpc.RunsStub(channel)
+        samples, elapsed = await bench(lambda: grpc_run(stub, request), args.runs, args.concurrency)
+    report("grpc", samples, elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", default="sage")
+    parser.add_argument("--message", default="What is Agno?")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rest-url", default="http://localhost:8000")
+    parser.add_argument("--grpc-target", default="localhost:50051")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,15 @@
+#!/bin/bash
+
+############################################################################
+# Generate the gRPC service code from api/rpc/runs.proto
+# Requires grpcio-tools: pip install grpcio-tools
+# Usage: ./scripts/generate_grpc.sh
+############################################################################
+
+CURR_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_ROOT="$(dirname $CURR_DIR)"
+source ${CURR_DIR}/_utils.sh
+
+print_heading "Generating api/rpc from runs.proto"
+cd ${REPO_ROOT}
+python -m grpc_tools.protoc -I. --python_out=. --pyi_out=. --grpc_python_out=. api/rpc/runs.proto
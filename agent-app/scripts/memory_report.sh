@@ -0,0 +1,22 @@
+#!/bin/bash
+
+############################################################################
+# Compare the memory of preloaded and independent workers of the API
+# Usage: ./scripts/memory_report.sh [workers] [seconds]
+############################################################################
+
+CURR_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_ROOT="$(dirname $CURR_DIR)"
+source ${CURR_DIR}/_utils.sh
+
+WORKERS=${1:-2}
+SECONDS_TO_REPORT=${2:-20}
+PORT=${PORT:-8765}
+
+cd ${REPO_ROOT}
+for MODE in "--no-preload" ""; do
+  print_heading "python -m api.serve --workers ${WORKERS} ${MODE}"
+  # The report is printed once the workers started, then the server is stopped
+  timeout -s TERM $((SECONDS_TO_REPORT + 5)) python -m api.serve --workers ${WORKERS} --port ${PORT} \
+    --log-level warning --memory-report-after ${SECONDS_TO_REPORT} ${MODE} 2>/dev/null | grep -A $((WORKERS + 3)) "^Memory"
+done
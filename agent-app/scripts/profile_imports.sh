@@ -0,0 +1,20 @@
+#!/bin/bash
+
+############################################################################
+# Profile the cold import of the API and list the slowest modules
+# Usage: ./scripts/profile_imports.sh [module] [count]
+############################################################################
+
+CURR_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_ROOT="$(dirname $CURR_DIR)"
+source ${CURR_DIR}/_utils.sh
+
+MODULE=${1:-api.main}
+COUNT=${2:-30}
+PROFILE=$(mktemp)
+
+print_heading "Import time of ${MODULE} (cumulative microseconds)"
+cd ${REPO_ROOT}
+PYTHONDONTWRITEBYTECODE=1 python -X importtime -c "import ${MODULE}" 2>${PROFILE} >/dev/null
+sort -t'|' -k2 -n -r ${PROFILE} | head -n ${COUNT}
+rm -f ${PROFILE}
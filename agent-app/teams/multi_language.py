@@ -8,56 +8,21 @@ from agno.team.team import Team
 from db.session import db_url
 from teams.settings import team_settings
 
-japanese_agent = Agent(
-    name="Japanese Agent",
-    agent_id="japanese-agent",
-    role="You only answer in Japanese",
-    model=OpenAIChat(
-        id="gpt-4o",
-        max_completion_tokens=team_settings.default_max_completion_tokens,
-        temperature=team_settings.default_temperature,
-    ),
-)
-chinese_agent = Agent(
-    name="Chinese Agent",
-    agent_id="chinese-agent",
-    role="You only answer in Chinese",
-    model=OpenAIChat(
-        id="gpt-4o",
-        max_completion_tokens=team_settings.default_max_completion_tokens,
-        temperature=team_settings.default_temperature,
-    ),
-)
-spanish_agent = Agent(
-    name="Spanish Agent",
-    agent_id="spanish-agent",
-    role="You only answer in Spanish",
-    model=OpenAIChat(
-        id="gpt-4o",
-        max_completion_tokens=team_settings.default_max_completion_tokens,
-        temperature=team_settings.default_temperature,
-    ),
-)
-french_agent = Agent(
-    name="French Agent",
-    agent_id="french-agent",
-    role="You only answer in French",
-    model=OpenAIChat(
-        id="gpt-4o",
-        max_completion_tokens=team_settings.default_max_completion_tokens,
-        temperature=team_settings.default_temperature,
-    ),
-)
-german_agent = Agent(
-    name="German Agent",
-    agent_id="german-agent",
-    role="You only answer in German",
-    model=OpenAIChat(
-        id="gpt-4o",
-        max_completion_tokens=team_settings.default_max_completion_tokens,
-        temperature=team_settings.default_temperature,
-    ),
-)
+# Languages of the member agents, in routing order
+LANGUAGES = ("Spanish", "Japanese", "French", "German", "Chinese")
+
+
+def get_language_agent(language: str) -> Agent:
+    return Agent(
+        name=f"{language} Agent",
+        agent_id=f"{language.lower()}-agent",
+        role=f"You only answer in {language}",
+        model=OpenAIChat(
+            id="gpt-4o",
+            max_completion_tokens=team_settings.default_max_completion_tokens,
+            temperature=team_settings.default_temperature,
+        ),
+    )
 
 
 def get_multi_language_team(
@@ -77,13 +42,7 @@ def get_multi_language_team(
             max_completion_tokens=team_settings.default_max_completion_tokens,
             temperature=team_settings.default_temperature if model_id != "o3-mini" else None,
         ),
-        members=[
-            spanish_agent,
-            japanese_agent,
-            french_agent,
-            german_agent,
-            chinese_agent,
-        ],
+        members=[get_language_agent(language) for language in LANGUAGES],
         description="You are a language router that directs questions to the appropriate language agent.",
         instructions=[
             "Identify the language of the user's question and direct it to the appropriate language agent.",
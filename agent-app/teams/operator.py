@@ -1,8 +1,12 @@
 from enum import Enum
 from typing import List, Optional
 
+from agno.team import Team
+
 from teams.finance_researcher import get_finance_researcher_team
 from teams.multi_language import get_multi_language_team
+from teams.settings import team_settings
+from utils.pool import InstancePool
 
 
 class TeamType(Enum):
@@ -28,3 +32,56 @@ def get_team(
         )
     else:
         return get_multi_language_team(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
+
+
+# Per-session state that must not leak from one lease of a pooled team to the next
+TEAM_SESSION_ATTRIBUTES = (
+    "team_session",
+    "session_name",
+    "session_state",
+    "session_metrics",
+    "full_team_session_metrics",
+    "memory",
+    "images",
+    "videos",
+    "audio",
+    "extra_data",
+    "run_id",
+    "run_response",
+)
+
+team_pool: InstancePool[Team] = InstancePool(
+    name="teams",
+    reset_attributes=TEAM_SESSION_ATTRIBUTES,
+    max_idle_per_key=team_settings.pool_max_idle_per_key,
+)
+
+
+def acquire_team(
+    model_id: Optional[str] = None,
+    team_id: Optional[TeamType] = None,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> Team:
+    """
+    Lend a pooled team bound to the given user and session.
+
+    The team is built with `get_team` on a pool miss and must be handed back with `release_team`
+    once the run is finished.
+    """
+    return team_pool.acquire(
+        (team_id, model_id),
+        lambda: get_team(model_id=model_id, team_id=team_id),
+        user_id=user_id,
+        session_id=session_id,
+    )
+
+
+def rebind_team(team: Team, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Team:
+    """Bind a team obtained from `acquire_team` to another user and session, keeping the lease."""
+    return team_pool.rebind(team, user_id=user_id, session_id=session_id)
+
+
+def release_team(team: Team) -> None:
+    """Return a team obtained from `acquire_team` to the pool."""
+    team_pool.release(team)
@@ -12,6 +12,8 @@ class TeamSettings(BaseSettings):
     embedding_model: str = "text-embedding-3-small"
     default_max_completion_tokens: int = 16000
     default_temperature: float = 0
+    # Maximum number of idle team instances kept per (team type, model id)
+    pool_max_idle_per_key: int = 4
 
 
 # Create an TeamSettings object
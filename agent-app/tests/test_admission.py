@@ -0,0 +1,101 @@
+"""
+准入控制测试文件
+
+这个文件测试运行并发上限、有界等待队列和429拒绝。
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from api import admission
+from api.admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController:
+    """测试准入控制器"""
+
+    def test_limits_per_key_and_global(self):
+        """测试单个agent和全局的并发上限"""
+
+        async def main():
+            controller = AdmissionController(max_in_flight=3, max_in_flight_per_key=2, max_queue=10)
+            running = {"sage": 0, "scholar": 0, "total": 0}
+            peak = {"sage": 0, "scholar": 0, "total": 0}
+
+            async def run(key):
+                ticket = await controller.admit(key)
+                running[key] += 1
+                running["total"] += 1
+                peak[key] = max(peak[key], running[key])
+                peak["total"] = max(peak["total"], running["total"])
+                await asyncio.sleep(0.01)
+                running[key] -= 1
+                running["total"] -= 1
+                ticket.release()
+
+            await asyncio.gather(*[run("sage") for _ in range(5)], *[run("scholar") for _ in range(5)])
+            return controller, peak
+
+        controller, peak = asyncio.run(main())
+        assert peak["sage"] <= 2 and peak["scholar"] <= 2
+        assert peak["total"] == 3
+        stats = controller.stats()
+        assert stats["admitted"] == 10
+        assert stats["in_flight"] == 0
+        assert stats["queue_depth"] == 0
+
+    def test_rejects_when_queue_is_full(self):
+        """测试等待队列满时立即拒绝"""
+
+        async def main():
+            controller = AdmissionController(max_in_flight=1, max_in_flight_per_key=1, max_queue=1)
+            ticket = await controller.admit("sage")
+            waiting = asyncio.create_task(controller.admit("sage"))
+            await asyncio.sleep(0)
+            assert controller.stats()["queue_depth"] == 1
+            with pytest.raises(AdmissionRejected) as e:
+                await controller.admit("sage")
+            assert e.value.retry_after >= 1
+            ticket.release()
+            (await waiting).release()
+            return controller.stats()
+
+        stats = asyncio.run(main())
+        assert stats["rejected"] == 1
+        assert stats["admitted"] == 2
+
+    def test_rejects_after_queue_timeout(self):
+        """测试等待超时后拒绝，并且不占用名额"""
+
+        async def main():
+            controller = AdmissionController(max_in_flight=1, max_in_flight_per_key=1, queue_timeout=0.01)
+            ticket = await controller.admit("sage")
+            with pytest.raises(AdmissionRejected):
+                await controller.admit("sage")
+            ticket.release()
+            ticket.release()
+            # 超时的请求没有泄漏名额
+            (await controller.admit("sage")).release()
+            return controller.stats()
+
+        stats = asyncio.run(main())
+        assert stats["in_flight"] == 0
+        assert stats["queue_depth"] == 0
+
+    def test_admit_run_returns_429(self, monkeypatch):
+        """测试路由辅助函数返回429和Retry-After"""
+
+        async def main():
+            controller = AdmissionController(max_in_flight=1, max_in_flight_per_key=1, max_queue=0)
+            monkeypatch.setattr(admission, "admission_controller", controller)
+            ticket = await admission.admit_run("sage")
+            with pytest.raises(HTTPException) as e:
+                await admission.admit_run("sage")
+            ticket.release()
+            return e.value
+
+        error = asyncio.run(main())
+        assert error.status_code == 429
+        assert error.headers["Retry-After"] == "1"
@@ -0,0 +1,128 @@
+"""
+会话亲和性测试文件
+
+这个文件测试一致性哈希在成员变化时只迁移少量会话、请求被转发到会话所属的worker、已转发的请求不再转发、所属worker不可达时在本地处理，以及续传事件流的请求被转发到运行它的worker。
+"""
+
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Request
+from starlette.requests import Request as StarletteRequest
+
+from api.affinity import AFFINITY_HEADER, SessionAffinity
+from utils.hashring import HashRing
+
+
+def _request(path="/v1/agents/sage/runs", headers=None, body=b'{"message": "hi"}'):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return StarletteRequest(scope, receive)
+
+
+def _owner_app():
+    app = FastAPI()
+
+    @app.post("/v1/agents/sage/runs")
+    async def run(request: Request):
+        return {"hop": request.headers.get(AFFINITY_HEADER), "body": (await request.body()).decode()}
+
+    return app
+
+
+class TestSessionAffinity:
+    """会话亲和性测试类"""
+
+    def test_membership_change_moves_few_sessions(self):
+        """测试哈希结果稳定，增加一个成员只迁移约1/N的会话，且都迁移到新成员"""
+        members = [f"http://127.0.0.1:{8001 + i}" for i in range(4)]
+        ring = HashRing(members)
+        sessions = [f"session-{i}" for i in range(2000)]
+        before = {session: ring.lookup(session) for session in sessions}
+        assert before == {session: HashRing(reversed(members)).lookup(session) for session in sessions}
+        assert len(set(before.values())) == 4
+
+        ring.add("http://127.0.0.1:8005")
+        moved = [session for session in sessions if ring.lookup(session) != before[session]]
+        assert 0.1 < len(moved) / len(sessions) < 0.3
+        assert {ring.lookup(session) for session in moved} == {"http://127.0.0.1:8005"}
+
+        ring.remove("http://127.0.0.1:8005")
+        assert {session: ring.lookup(session) for session in sessions} == before
+        assert HashRing().lookup("s1") is None
+
+    def test_forward_to_owner(self):
+        """测试请求转发到所属worker并带上转发标记，已转发的请求在本地处理"""
+        workers = ["http://worker-0", "http://worker-1"]
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_owner_app()))
+        affinity = SessionAffinity(nodes=[], node=None, client=client)
+        affinity.configure_workers(workers[0], workers)
+        session_id = next(f"s{i}" for i in range(100) if affinity.owner(f"s{i}")["worker"] == workers[1])
+        local_id = next(f"s{i}" for i in range(100) if affinity.owner(f"s{i}")["worker"] == workers[0])
+
+        async def scenario():
+            response = await affinity.route(_request(), session_id)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            await response.background()
+            forwarded = _request(headers={AFFINITY_HEADER: "worker"})
+            served_here = await affinity.route(forwarded, session_id)
+            local = _request()
+            return response, body, served_here, forwarded.state.session_warm, await affinity.route(local, local_id)
+
+        response, body, served_here, warm, local = asyncio.run(scenario())
+        assert response.headers[AFFINITY_HEADER] == "forwarded-worker"
+        assert httpx.Response(200, content=body).json() == {"hop": "worker", "body": '{"message": "hi"}'}
+        assert served_here is None and warm is False and local is None
+        assert affinity.stats()["forwarded"] == 1 and affinity.stats()["local"] == 2
+
+    def test_unreachable_owner_is_skipped(self):
+        """测试所属worker不可达时在本地处理，并在一段时间内跳过它"""
+
+        def refuse(request):
+            raise httpx.ConnectError("connection refused")
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(refuse))
+        workers = ["http://worker-0", "http://worker-1"]
+        affinity = SessionAffinity(nodes=[], node=None, down_seconds=60, client=client)
+        affinity.configure_workers(workers[0], workers)
+        session_id = next(f"s{i}" for i in range(100) if affinity.owner(f"s{i}")["worker"] == workers[1])
+
+        async def scenario():
+            first = await affinity.route(_request(), session_id)
+            second = _request()
+            return first, await affinity.route(second, session_id), second.state.session_warm
+
+        first, second, warm = asyncio.run(scenario())
+        assert first is None and second is None and warm is True
+        stats = affinity.stats()
+        assert stats["failed"] == 1 and stats["down"] == [workers[1]] and stats["warm_hit_rate"] == 0.5
+
+    def test_resume_forwarded_to_worker_running_the_stream(self):
+        """测试事件流的id带有运行它的worker，续传请求被转发到该worker，与会话无关"""
+        workers = ["http://worker-0", "http://worker-1"]
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_owner_app()))
+        owner = SessionAffinity(nodes=[], node=None)
+        owner.configure_workers(workers[1], workers)
+        stream_id = owner.new_stream_id()
+        affinity = SessionAffinity(nodes=[], node=None, client=client)
+        affinity.configure_workers(workers[0], workers)
+
+        async def scenario():
+            resume = _request(headers={"Last-Event-ID": f"{stream_id}:7"})
+            response = await affinity.route_stream(resume, stream_id)
+            await response.background()
+            return response, await affinity.route_stream(_request(), affinity.new_stream_id())
+
+        response, local = asyncio.run(scenario())
+        assert owner.stream_owner(stream_id) == (None, workers[1])
+        assert response.headers[AFFINITY_HEADER] == "forwarded-worker" and local is None
+        assert SessionAffinity(nodes=[], node=None).new_stream_id().count(".") == 0
@@ -0,0 +1,127 @@
+"""
+批量运行测试文件
+
+这个文件测试批量运行的并发上限、结果输出、agent复用，以及每个请求的准入和负载降级。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+
+from api.admission import AdmissionController
+from api.batch import run_batch
+
+
+class _FakeRunner:
+    """模拟agent，记录并发运行数量"""
+
+    running = 0
+    max_running = 0
+
+    def __init__(self):
+        self.session_id = None
+
+    async def arun(self, message, stream=False):
+        _FakeRunner.running += 1
+        _FakeRunner.max_running = max(_FakeRunner.max_running, _FakeRunner.running)
+        await asyncio.sleep(0.01)
+        _FakeRunner.running -= 1
+        if message == "fail":
+            raise RuntimeError("model error")
+        return SimpleNamespace(run_id=f"run-{message}", session_id=self.session_id, content=message.upper())
+
+
+def _batch(runs, concurrency):
+    acquired, released = [], []
+
+    def acquire(run, model_id):
+        runner = _FakeRunner()
+        runner.session_id = run.session_id
+        acquired.append(runner)
+        return runner
+
+    def rebind(runner, run):
+        runner.session_id = run.session_id
+
+    async def _run():
+        return [orjson.loads(line) async for line in run_batch(runs, acquire, rebind, released.append, concurrency)]
+
+    return asyncio.run(_run()), acquired, released
+
+
+def _run_request(message, model="gpt-4o"):
+    return SimpleNamespace(message=message, model=model, user_id=None, session_id=f"session-{message}")
+
+
+class TestRunBatch:
+    """批量运行测试类"""
+
+    def test_results_and_concurrency(self):
+        """测试所有请求都有结果，且并发数不超过上限"""
+        _FakeRunner.max_running = 0
+        runs = [_run_request(str(i)) for i in range(10)]
+        results, acquired, released = _batch(runs, concurrency=3)
+
+        assert sorted(r["index"] for r in results) == list(range(10))
+        assert all(r["status"] == "success" for r in results)
+        assert {r["content"] for r in results} == {str(i) for i in range(10)}
+        assert {r["session_id"] for r in results} == {f"session-{i}" for i in range(10)}
+        assert _FakeRunner.max_running <= 3
+
+    def test_runners_are_reused(self):
+        """测试每个worker只租用一次agent并在结束后归还"""
+        runs = [_run_request(str(i)) for i in range(10)]
+        _, acquired, released = _batch(runs, concurrency=2)
+
+        assert len(acquired) == 2
+        assert sorted(map(id, released)) == sorted(map(id, acquired))
+
+    def test_failed_run_does_not_stop_batch(self):
+        """测试单个请求失败不影响其他请求"""
+        runs = [_run_request("a"), _run_request("fail"), _run_request("b")]
+        results, _, _ = _batch(runs, concurrency=2)
+
+        by_index = {r["index"]: r for r in results}
+        assert by_index[1]["status"] == "error"
+        assert "model error" in by_index[1]["error"]
+        assert by_index[0]["status"] == by_index[2]["status"] == "success"
+
+    def test_items_are_admitted_and_degraded(self):
+        """测试每个请求占用一个准入名额并在结束后归还，未获准入的请求单独失败，降级的请求使用更便宜的模型并在结束后恢复"""
+        controller = AdmissionController(max_in_flight=1, max_in_flight_per_key=1, max_queue=1, queue_timeout=5)
+        runs = [_run_request(str(i)) for i in range(3)]
+        built, restored, in_flight = [], [], []
+
+        def acquire(run, model_id):
+            built.append(model_id)
+            return _FakeRunner()
+
+        async def admit():
+            if len(in_flight) == 2:
+                raise RuntimeError("Too many runs waiting")
+            ticket = await controller.admit("sage")
+            in_flight.append(controller.in_flight)
+            return ticket
+
+        def degrade(runner, degradations):
+            return lambda: restored.append(degradations)
+
+        async def _run():
+            batch = run_batch(
+                runs,
+                acquire,
+                lambda runner, run: None,
+                lambda runner: None,
+                concurrency=3,
+                admit=admit,
+                plan=lambda run: ("gpt-4o-mini", ["cheaper_model"]),
+                degrade=degrade,
+            )
+            return [orjson.loads(line) async for line in batch]
+
+        by_index = {r["index"]: r for r in asyncio.run(_run())}
+        assert [r["status"] for _, r in sorted(by_index.items())].count("error") == 1
+        assert in_flight == [1, 1] and controller.in_flight == 0
+        assert set(built) == {"gpt-4o-mini"} and restored == [["cheaper_model"]] * 2
+        assert all(r["degraded"] == ["cheaper_model"] for r in by_index.values() if r["status"] == "success")
@@ -0,0 +1,128 @@
+"""
+响应缓存测试文件
+
+这个文件测试精确匹配缓存的键、不同用户共享的匿名回答、过期、淘汰和流式回放。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+
+from api import run_flow
+from api.cache import CachedResponse, ResponseCache, agent_fingerprint, cached_response, normalize_message, replay
+from api.run_flow import RunSpec, RunTarget, start_run
+from api.streaming import StreamEventType
+
+
+def _agent(instructions="Be concise.", temperature=0):
+    """模拟agent，只包含指纹需要的配置"""
+    return SimpleNamespace(
+        description="Scholar",
+        instructions=instructions,
+        additional_instructions=None,
+        expected_output=None,
+        model=SimpleNamespace(id="gpt-4o", temperature=temperature, max_completion_tokens=16000),
+        tools=[SimpleNamespace(name="duckduckgo")],
+        run_response=None,
+        session_id=None,
+    )
+
+
+class TestResponseCache:
+    """精确匹配缓存测试类"""
+
+    def test_normalized_message_hits(self):
+        """测试大小写和空白不同的问题命中同一个缓存"""
+        cache = ResponseCache(ttls={"scholar": 60}, max_entries=10)
+        assert cache.get("scholar", "gpt-4o", "What are US tariffs?") is None
+
+        cache.put("scholar", "gpt-4o", "What are US tariffs?", _agent(), "An answer")
+        hit = cache.get("scholar", "gpt-4o", "  what are   us tariffs? ")
+        assert hit is not None and hit.content == "An answer"
+        assert cache.get("scholar", "o3-mini", "What are US tariffs?") is None
+        assert normalize_message(" A\n b ") == "a b"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 2
+
+    def test_cached_runs_are_anonymous(self, monkeypatch):
+        """测试可缓存的运行不带用户上下文，所以不同用户的相同问题共享回答；不缓存的运行仍绑定用户"""
+        cache = ResponseCache(ttls={"scholar": 60}, max_entries=10)
+        monkeypatch.setattr(run_flow, "response_cache", cache)
+        acquired = []
+
+        def acquire(target_id, model_id, user_id, session_id):
+            acquired.append(user_id)
+            return _agent()
+
+        target = RunTarget(ids=["scholar", "sage"], acquire=acquire, release=lambda runner: None, cache=True)
+
+        async def scenario():
+            spec = RunSpec("agent", "scholar", "What are US tariffs?", "gpt-4o", user_id="alice", stream=False)
+            run = await start_run(spec, target)
+            run.store("An answer")
+            run.release(run.runner)
+            spec = RunSpec("agent", "scholar", "what are us tariffs?", "gpt-4o", user_id="bob", stream=False)
+            hit = await start_run(spec, target)
+            spec = RunSpec("agent", "sage", "What are US tariffs?", "gpt-4o", user_id="bob", stream=False)
+            uncached = await start_run(spec, target)
+            uncached.release(uncached.runner)
+            return hit.answer
+
+        hit = asyncio.run(scenario())
+        assert hit is not None and hit.content == "An answer"
+        assert acquired == [None, "bob"]
+
+    def test_opt_in_per_agent(self):
+        """测试只缓存配置了TTL的agent，且不缓存空回答"""
+        cache = ResponseCache(ttls={"scholar": 60}, max_entries=10)
+        assert not cache.enabled("sage")
+        cache.put("sage", "gpt-4o", "hi", _agent(), "hello")
+        cache.put("scholar", "gpt-4o", "hi", _agent(), "")
+        assert cache.stats()["entries"] == 0
+
+    def test_fingerprint_changes_with_config(self):
+        """测试提示词或模型参数变化后指纹不同，旧缓存失效"""
+        assert agent_fingerprint(_agent()) == agent_fingerprint(_agent())
+        assert agent_fingerprint(_agent()) != agent_fingerprint(_agent(instructions="Be verbose."))
+        assert agent_fingerprint(_agent()) != agent_fingerprint(_agent(temperature=0.7))
+
+        cache = ResponseCache(ttls={"scholar": 60}, max_entries=10)
+        cache.put("scholar", "gpt-4o", "hi", _agent(), "old")
+        cache.put("scholar", "gpt-4o", "bye", _agent(instructions="Be verbose."), "new")
+        assert cache.get("scholar", "gpt-4o", "hi") is None
+        assert cache.get("scholar", "gpt-4o", "bye").content == "new"
+
+    def test_ttl_and_eviction(self):
+        """测试过期和按最近使用淘汰"""
+        cache = ResponseCache(ttls={"scholar": 60, "sage": 60}, max_entries=2)
+        cache.put("sage", "gpt-4o", "q", _agent(), "a")
+        cache._entries[next(iter(cache._entries))].expires_at = 0
+        assert cache.get("sage", "gpt-4o", "q") is None
+        assert cache.stats()["expirations"] == 1
+
+        for message in ("a", "b"):
+            cache.put("scholar", "gpt-4o", message, _agent(), message)
+        cache.get("scholar", "gpt-4o", "a")
+        cache.put("scholar", "gpt-4o", "c", _agent(), "c")
+        assert cache.get("scholar", "gpt-4o", "b") is None
+        assert cache.get("scholar", "gpt-4o", "a") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_replay_as_stream(self):
+        """测试缓存的回答以流式事件回放"""
+        cached = CachedResponse(content="x" * 100, model="gpt-4o", expires_at=0)
+
+        async def collect(events):
+            return [item async for item in replay(cached, events)]
+
+        events = asyncio.run(collect(True))
+        assert events[0].event == StreamEventType.RUN_STARTED
+        assert events[-1].event == StreamEventType.RUN_COMPLETED
+        assert "".join(e.data["delta"] for e in events if e.event == StreamEventType.CONTENT) == cached.content
+        assert "".join(asyncio.run(collect(False))) == cached.content
+
+        response = cached_response(cached, stream=False, events=False)
+        assert response.headers["X-Cache"] == "hit"
+        assert orjson.loads(response.body) == cached.content
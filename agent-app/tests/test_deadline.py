@@ -0,0 +1,159 @@
+"""
+截止时间传递测试文件
+
+这个文件测试请求的截止时间：超时后停止运行并返回已生成的部分答案、工具调用和模型请求受剩余时间限制、
+X-Request-Timeout请求头的解析、排队等待超过截止时间时返回504，
+以及数据库语句超时只在比服务器默认值更短时设置。
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from agno.models.openai import OpenAIChat
+from agno.tools.function import Function, FunctionCall
+from fastapi import FastAPI, HTTPException
+
+from api import admission
+from api.admission import AdmissionController
+from api.deadline import DEADLINE_HEADER, DeadlineMiddleware, run_deadline, run_until_deadline, until_deadline
+from api.streaming import StreamEvent, StreamEventType
+from utils.deadline import Deadline, current_deadline, instrument_deadlines, statement_timeout_ms
+
+
+class FakeRunner:
+    """没有会话的运行者，超时后不需要保存部分答案"""
+
+    run_response = None
+
+
+async def slow_events(closed):
+    try:
+        yield StreamEvent(StreamEventType.RUN_STARTED, {"run_id": "r1"})
+        yield StreamEvent(StreamEventType.CONTENT, {"delta": "Partial "})
+        yield StreamEvent(StreamEventType.CONTENT, {"delta": "answer"})
+        await asyncio.sleep(10)
+        yield StreamEvent(StreamEventType.CONTENT, {"delta": " never sent"})
+    finally:
+        closed.append(True)
+
+
+class TestDeadline:
+    """截止时间测试类"""
+
+    def test_stream_ends_with_partial_answer(self):
+        """测试超时后流以deadline_exceeded事件结束，并关闭运行"""
+
+        async def scenario():
+            closed = []
+            deadline = Deadline(0.05)
+            events = [event async for event in until_deadline(slow_events(closed), FakeRunner(), deadline)]
+            return events, closed
+
+        events, closed = asyncio.run(scenario())
+        assert [event.event for event in events] == ["run_started", "content", "content", "deadline_exceeded"]
+        assert events[-1].data == {"timeout": 0.05}
+        assert closed == [True]
+
+    def test_non_streamed_run_returns_partial_content(self, monkeypatch):
+        """测试非流式运行超时后返回已生成的文本"""
+        closed = []
+        monkeypatch.setattr("api.deadline.run_events", lambda runner, message: slow_events(closed))
+
+        async def scenario():
+            return await run_until_deadline(FakeRunner(), "hi", Deadline(0.05))
+
+        assert asyncio.run(scenario()) == ("Partial answer", True)
+
+    def test_tool_calls_and_model_requests_get_the_remaining_budget(self):
+        """测试工具调用在截止时间被中断或不再启动，模型请求的超时不超过剩余时间"""
+        instrument_deadlines()
+
+        async def slow_tool() -> str:
+            await asyncio.sleep(10)
+            return "done"
+
+        async def fast_tool() -> str:
+            return "done"
+
+        def blocking_tool() -> str:
+            return "done"
+
+        async def scenario():
+            unbounded = await FunctionCall(function=Function.from_callable(fast_tool)).aexecute()
+            deadline = Deadline(0.05)
+            call = FunctionCall(function=Function.from_callable(slow_tool))
+            interrupted = await call.aexecute()
+            request_kwargs = OpenAIChat(id="gpt-4o", timeout=60).get_request_kwargs()
+            await asyncio.sleep(0.01)
+            not_started = FunctionCall(function=Function.from_callable(blocking_tool)).execute()
+            return unbounded, interrupted, call, request_kwargs, not_started, deadline
+
+        unbounded, interrupted, call, request_kwargs, not_started, deadline = asyncio.run(scenario())
+        assert unbounded.status == "success"
+        assert interrupted.status == "failure" and call.result == "Deadline exceeded, the tool was not run"
+        assert not_started.status == "failure"
+        assert request_kwargs["timeout"] <= deadline.seconds
+        assert "timeout" not in OpenAIChat(id="gpt-4o").get_request_kwargs()
+
+    def test_request_timeout_header(self):
+        """测试请求头设置截止时间，请求体的timeout只能缩短它，非法值返回400"""
+        app = FastAPI()
+        app.add_middleware(DeadlineMiddleware)
+
+        @app.get("/budget")
+        async def budget(timeout: float = None):
+            deadline = run_deadline(timeout)
+            return {"seconds": deadline.seconds if deadline is not None else None}
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                header = await client.get("/budget", headers={DEADLINE_HEADER: "20"})
+                shorter = await client.get("/budget", params={"timeout": 5}, headers={DEADLINE_HEADER: "20"})
+                longer = await client.get("/budget", params={"timeout": 30}, headers={DEADLINE_HEADER: "20"})
+                none = await client.get("/budget")
+                invalid = await client.get("/budget", headers={DEADLINE_HEADER: "-1"})
+            return header, shorter, longer, none, invalid, current_deadline.get()
+
+        header, shorter, longer, none, invalid, leaked = asyncio.run(scenario())
+        assert header.json() == {"seconds": 20.0}
+        assert shorter.json() == {"seconds": 5.0}
+        assert longer.json() == {"seconds": 20.0}
+        assert none.json() == {"seconds": None}
+        assert invalid.status_code == 400
+        assert leaked is None
+
+    def test_admission_wait_bounded_by_deadline(self, monkeypatch):
+        """测试排队等待不超过剩余时间，超时返回504而不是429"""
+        controller = AdmissionController(max_in_flight=1, max_in_flight_per_key=1, queue_timeout=30)
+        monkeypatch.setattr(admission, "admission_controller", controller)
+
+        async def scenario():
+            ticket = await controller.admit("sage")
+            Deadline(0.05)
+            with pytest.raises(HTTPException) as e:
+                await admission.admit_run("sage")
+            ticket.release()
+            return e.value
+
+        error = asyncio.run(scenario())
+        assert error.status_code == 504
+        assert controller.stats()["in_flight"] == 0
+
+    def test_statement_timeout_only_when_tighter_than_the_server(self):
+        """测试数据库语句超时取剩余时间与下限中的较大者，服务器默认值已经更短时不再设置"""
+
+        async def scenario():
+            deadline = Deadline(10)
+            return (
+                statement_timeout_ms(deadline, 0, 500),
+                statement_timeout_ms(deadline, 5000, 500),
+                statement_timeout_ms(deadline, 60000, 500),
+                statement_timeout_ms(Deadline(0.01), 60000, 500),
+            )
+
+        unset, tighter_server, looser_server, floor = asyncio.run(scenario())
+        assert 9000 < unset <= 10000 and looser_server == unset
+        assert tighter_server is None
+        assert floor == 500
@@ -0,0 +1,148 @@
+"""
+公平调度测试文件
+
+这个文件测试模型调用在租户之间的加权公平调度：大量排队的重度用户不会饿死后到的轻度用户、按权重分配容量、
+多个worker通过共享存储同步后仍然公平、共享存储不可用时退避，以及按用户或API Key区分租户。
+"""
+
+import asyncio
+
+from api import fair_scheduling
+from api.fair_scheduling import FairScheduler, bind_tenant, current_tenant
+
+
+class _FakeStore:
+    """内存中的共享存储，语义与fair_share_tags表相同"""
+
+    def __init__(self, down=False):
+        self.down = down
+        self.attempts = 0
+        self.virtual_time = 0.0
+        self.finish = {}
+
+    def sync(self, costs, virtual_time):
+        self.attempts += 1
+        if self.down:
+            raise ConnectionError("database is down")
+        self.virtual_time = max(self.virtual_time, virtual_time)
+        for tenant, cost in costs.items():
+            self.finish[tenant] = max(self.finish.get(tenant, 0.0), self.virtual_time) + cost
+        return {t: f for t, f in self.finish.items() if f > self.virtual_time}, self.virtual_time
+
+
+async def _call(scheduler, tenant, started):
+    async with scheduler.slot(tenant):
+        started.append(tenant)
+        await asyncio.sleep(0)
+
+
+async def _wait_queued(scheduler, tenant, n):
+    while scheduler.queued.get(tenant, 0) < n:
+        await asyncio.sleep(0.001)
+
+
+class TestFairScheduler:
+    """公平调度测试类"""
+
+    def test_heavy_tenant_does_not_starve_a_light_one(self):
+        """测试重度用户排了很多调用时，后到的轻度用户的调用几乎立即执行"""
+
+        async def scenario():
+            scheduler = FairScheduler(capacity=1)
+            started = []
+            await scheduler.acquire("user:script")
+            heavy = [asyncio.create_task(_call(scheduler, "user:script", started)) for _ in range(20)]
+            await _wait_queued(scheduler, "user:script", 20)
+            light = [asyncio.create_task(_call(scheduler, "user:ui", started)) for _ in range(2)]
+            await _wait_queued(scheduler, "user:ui", 2)
+            scheduler.release()
+            await asyncio.gather(*heavy, *light)
+            return started, scheduler.stats()
+
+        started, stats = asyncio.run(scenario())
+        assert started[:3].count("user:ui") == 2
+        assert stats["in_flight"] == 0 and stats["queued"] == 0
+        assert stats["tenants"]["user:script"]["served"] == 21
+
+    def test_capacity_is_shared_by_weight(self):
+        """测试积压的租户按权重分配容量"""
+
+        async def scenario():
+            scheduler = FairScheduler(capacity=1, weights={"user:ui": 3})
+            started = []
+            await scheduler.acquire("user:other")
+            tasks = []
+            for tenant in ("user:ui", "user:batch"):
+                tasks += [asyncio.create_task(_call(scheduler, tenant, started)) for _ in range(30)]
+                await _wait_queued(scheduler, tenant, 30)
+            scheduler.release()
+            await asyncio.gather(*tasks)
+            return started
+
+        started = asyncio.run(scenario())
+        assert started[:20].count("user:ui") == 15
+
+    def test_workers_sharing_the_store_stay_fair(self):
+        """测试在一个worker上积压的租户，同步后在另一个worker上也排在其他租户之后"""
+
+        async def scenario(store):
+            first = FairScheduler(capacity=1, store=store)
+            second = FairScheduler(capacity=1, store=store)
+            started = []
+            await first.acquire("user:script")
+            backlog = [asyncio.create_task(_call(first, "user:script", started)) for _ in range(10)]
+            await _wait_queued(first, "user:script", 10)
+            await first.sync()
+            await second.sync()
+
+            await second.acquire("user:other")
+            order = []
+            tasks = [asyncio.create_task(_call(second, "user:script", order))]
+            await _wait_queued(second, "user:script", 1)
+            tasks.append(asyncio.create_task(_call(second, "user:ui", order)))
+            await _wait_queued(second, "user:ui", 1)
+            second.release()
+            await asyncio.gather(*tasks)
+            first.release()
+            await asyncio.gather(*backlog)
+            return order
+
+        assert asyncio.run(scenario(_FakeStore())) == ["user:ui", "user:script"]
+        # Without the shared tags the second worker doesn't know about the backlog of the script
+        assert asyncio.run(scenario(None)) == ["user:script", "user:ui"]
+
+    def test_unreachable_store_is_skipped_for_a_while(self):
+        """测试共享存储不可用时不阻塞模型调用，退避期间不再访问存储，之后补上未同步的消耗"""
+
+        async def scenario():
+            store = _FakeStore(down=True)
+            scheduler = FairScheduler(capacity=1, store=store, backoff=60)
+            async with scheduler.slot("user:a"):
+                pass
+            await scheduler.sync()
+            await scheduler.sync()
+            attempts = store.attempts
+            store.down = False
+            scheduler._skip_store_until = float("-inf")
+            await scheduler.sync()
+            return attempts, store.finish
+
+        attempts, finish = asyncio.run(scenario())
+        assert attempts == 1
+        assert finish == {"user:a": 1.0}
+
+    def test_tenant_by_user_or_api_key(self, monkeypatch):
+        """测试租户按用户区分，或按API Key的哈希区分"""
+
+        async def scenario():
+            by_user = bind_tenant("alice", {"X-API-Key": "secret"})
+            monkeypatch.setattr(fair_scheduling.api_settings, "fair_tenant_by", "api_key")
+            by_key = bind_tenant("alice", {"authorization": "Bearer secret"})
+            without_key = bind_tenant("alice", {})
+            return by_user, by_key, without_key, current_tenant.get()
+
+        by_user, by_key, without_key, bound = asyncio.run(scenario())
+        assert by_user == "user:alice"
+        assert by_key.startswith("key:") and "secret" not in by_key
+        assert without_key == bound == "user:alice"
+        assert current_tenant.get() == "anonymous"
@@ -0,0 +1,200 @@
+"""
+幂等键测试文件
+
+这个文件使用内存中的存储测试重试请求：执行中时加入原来的执行、完成后回放保存的结果、不同请求复用键时拒绝、失败或未能启动时释放键、
+等待其他进程中的执行，以及执行时间超过过期时间时靠心跳保持键。
+"""
+
+import asyncio
+from time import monotonic
+
+import pytest
+from fastapi import HTTPException
+
+from api.idempotency import IdempotencyKeys, KeyStatus, request_hash
+from api.run_streams import RunChannel
+from api.single_flight import SingleFlight
+from api.streaming import StreamEvent, StreamEventType
+from utils.timing import PhaseTimeline
+
+
+class _FakeStore:
+    """内存中的幂等键存储，接口与IdempotencyStore一致"""
+
+    def __init__(self):
+        self.keys = {}
+
+    def begin(self, scope, key, request_hash, owner, ttl, stale_after):
+        record = self.keys.get((scope, key))
+        stale = record is not None and record["status"] == KeyStatus.RUNNING
+        if record is None or (stale and record["updated_at"] < monotonic() - stale_after):
+            record = self.keys[(scope, key)] = {
+                "status": KeyStatus.RUNNING,
+                "owner": owner,
+                "request_hash": request_hash,
+                "result": None,
+                "updated_at": monotonic(),
+            }
+        return dict(record)
+
+    def heartbeat(self, requests):
+        for scope, key, owner in requests:
+            record = self.keys.get((scope, key))
+            if record is not None and record["owner"] == owner and record["status"] == KeyStatus.RUNNING:
+                record["updated_at"] = monotonic()
+
+    def get(self, scope, key):
+        record = self.keys.get((scope, key))
+        return dict(record) if record is not None else None
+
+    def complete(self, scope, key, owner, result):
+        self.keys[(scope, key)].update(status=KeyStatus.COMPLETED, result=result)
+
+    def release(self, scope, key, owner):
+        self.keys.pop((scope, key), None)
+
+    def purge(self):
+        pass
+
+
+async def _source(runs, gate, error=False):
+    runs.append(1)
+    yield StreamEvent(StreamEventType.RUN_STARTED, {"run_id": "r1"})
+    await gate.wait()
+    if error:
+        yield StreamEvent(StreamEventType.ERROR, {"message": "model error"})
+        return
+    yield StreamEvent(StreamEventType.CONTENT, {"delta": "Hello"})
+    yield StreamEvent(StreamEventType.RUN_COMPLETED, {"run_id": "r1", "model": "gpt-4o", "session_id": "s1"})
+
+
+def _keys(store):
+    return IdempotencyKeys(store, ttl=60, stale_after=600, wait_timeout=0.2, poll_interval=0.01)
+
+
+async def _start(keys, runs, gate, error=False):
+    """领头请求开始执行"""
+    fingerprint = request_hash(message="hi", model="gpt-4o")
+    request = await keys.begin("agent", "sage", "key-1", fingerprint)
+    channel = RunChannel()
+    keys.track(request, channel)
+    SingleFlight(ids=[]).run(channel, None, _source(runs, gate, error), lambda runner: None)
+    return request, fingerprint
+
+
+class TestIdempotencyKeys:
+    """幂等键测试类"""
+
+    def test_retry_attaches_then_replays(self):
+        """测试执行中的重试加入原来的执行，完成后的重试回放结果，并且只执行一次"""
+        store = _FakeStore()
+        keys = _keys(store)
+
+        async def scenario():
+            runs, gate = [], asyncio.Event()
+            request, fingerprint = await _start(keys, runs, gate)
+            retry = await keys.begin("agent", "sage", "key-1", fingerprint)
+            attached = asyncio.create_task(keys.respond(retry, False, False, PhaseTimeline()))
+            await asyncio.sleep(0.01)
+            gate.set()
+            attached = await attached
+            await asyncio.sleep(0.01)
+
+            later = await keys.begin("agent", "sage", "key-1", fingerprint)
+            replayed = await keys.respond(later, False, False, PhaseTimeline())
+            return request.leader, retry.leader, attached, replayed, runs
+
+        leader, retry_leader, attached, replayed, runs = asyncio.run(scenario())
+        assert leader and not retry_leader
+        assert attached.headers["Idempotent-Replayed"] == "attached"
+        assert attached.body == replayed.body == b'"Hello"'
+        assert replayed.headers["Idempotent-Replayed"] == "true"
+        assert runs == [1]
+        assert store.keys[("agent:sage", "key-1")]["result"]["session_id"] == "s1"
+
+    def test_key_reused_with_different_request(self):
+        """测试同一个键用于不同请求时返回422"""
+        keys = _keys(_FakeStore())
+
+        async def scenario():
+            await keys.begin("agent", "sage", "key-1", request_hash(message="hi"))
+            await keys.begin("agent", "sage", "key-1", request_hash(message="bye"))
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(scenario())
+        assert error.value.status_code == 422
+
+    def test_failed_run_releases_key(self):
+        """测试执行失败后释放键，重试可以重新执行"""
+        store = _FakeStore()
+        keys = _keys(store)
+
+        async def scenario():
+            gate = asyncio.Event()
+            gate.set()
+            await _start(keys, [], gate, error=True)
+            await asyncio.sleep(0.02)
+
+        asyncio.run(scenario())
+        assert store.keys == {}
+
+    def test_run_rejected_before_start_releases_key(self):
+        """测试执行前被拒绝（如429）的请求通过其通道释放键，重试可以重新执行"""
+        store = _FakeStore()
+        keys = _keys(store)
+
+        async def scenario():
+            request = await keys.begin("agent", "sage", "key-1", request_hash(message="hi"))
+            channel = RunChannel()
+            keys.track(request, channel)
+            SingleFlight(ids=[]).abort(channel, "Too many runs waiting")
+            await asyncio.sleep(0.02)
+
+        asyncio.run(scenario())
+        assert store.keys == {}
+
+    def test_retry_of_run_in_other_process(self):
+        """测试在其他进程中执行的请求：等待结果，超时返回409"""
+        store = _FakeStore()
+        keys = _keys(store)
+        fingerprint = request_hash(message="hi")
+        store.begin("agent:sage", "key-1", fingerprint, "other-worker", 60, 600)
+
+        async def scenario():
+            retry = await keys.begin("agent", "sage", "key-1", fingerprint)
+            with pytest.raises(HTTPException) as error:
+                await keys.respond(retry, False, False, PhaseTimeline())
+            assert error.value.status_code == 409
+
+            waiting = asyncio.create_task(keys.respond(retry, True, True, PhaseTimeline()))
+            await asyncio.sleep(0.02)
+            store.complete("agent:sage", "key-1", "other-worker", {"content": "Hello", "model": "gpt-4o"})
+            response = await waiting
+            return [chunk async for chunk in response.body_iterator]
+
+        body = b"".join(asyncio.run(scenario()))
+        assert b"event: content" in body and b"Hello" in body
+
+    def test_long_run_keeps_its_key(self):
+        """测试执行时间超过过期时间的执行靠心跳保持键，重试加入它而不是再执行一次；没有心跳的键过期后可以重新执行"""
+        store = _FakeStore()
+        keys = IdempotencyKeys(
+            store, ttl=60, stale_after=0.03, wait_timeout=0.2, poll_interval=0.01, heartbeat_interval=0.01
+        )
+
+        async def scenario():
+            runs, gate = [], asyncio.Event()
+            request, fingerprint = await _start(keys, runs, gate)
+            await asyncio.sleep(0.15)
+            retry = await keys.begin("agent", "sage", "key-1", fingerprint)
+            gate.set()
+            await asyncio.sleep(0.05)
+
+            store.keys[("agent:sage", "key-2")] = dict(store.keys[("agent:sage", "key-1")], status=KeyStatus.RUNNING)
+            await asyncio.sleep(0.05)
+            abandoned = await keys.begin("agent", "sage", "key-2", fingerprint)
+            return runs, retry.leader, abandoned.leader
+
+        runs, retry_leads, abandoned_leads = asyncio.run(scenario())
+        assert runs == [1] and not retry_leads
+        assert abandoned_leads
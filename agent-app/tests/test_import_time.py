@@ -0,0 +1,54 @@
+"""
+导入耗时测试文件
+
+这个文件在新的解释器中导入api.main，检查重量级的工具库没有在导入时加载。
+导入耗时随机器而变，不在测试中断言，用 ./scripts/profile_imports.sh 查看各模块的导入耗时。
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Libraries that must only be loaded when the agent or team using them is built
+DEFERRED_MODULES = (
+    "agno.tools.duckduckgo",
+    "duckduckgo_search",
+    "agno.tools.yfinance",
+    "yfinance",
+    "pandas",
+    "agno.vectordb.pgvector",
+    "pgvector",
+    "agno.tools.mcp",
+    "mcp",
+    "newspaper",
+)
+
+_PROBE = """
+import json, sys
+import api.main
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def _cold_import():
+    """在新的解释器中导入api.main，返回已加载的模块"""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestImportTime:
+    """导入耗时测试类"""
+
+    def test_heavy_libraries_are_deferred(self):
+        """测试导入api.main时没有加载重量级的工具库"""
+        modules = set(_cold_import())
+        loaded = [name for name in DEFERRED_MODULES if name in modules]
+        assert loaded == []
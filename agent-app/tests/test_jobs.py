@@ -0,0 +1,178 @@
+"""
+后台任务测试文件
+
+这个文件使用内存中的任务存储测试任务的执行、进度、失败、未知类型的任务立即失败、并发上限、关闭时重新入队，
+以及空闲时减少查询、提交任务时立即唤醒。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from agno.run.response import RunEvent, RunResponse
+
+from api.jobs import JobStatus, JobWorker
+
+
+class _FakeStore:
+    """内存中的任务存储，接口与JobStore一致"""
+
+    def __init__(self, jobs):
+        self.jobs = {job["job_id"]: dict(job, status=JobStatus.QUEUED, attempts=0) for job in jobs}
+        self.heartbeats = []
+
+    def create(self, kind, target_id, model, message, user_id=None, session_id=None):
+        job = dict(_job(f"job-{len(self.jobs)}", message), status=JobStatus.QUEUED, attempts=0)
+        self.jobs[job["job_id"]] = job
+        return dict(job)
+
+    def claim(self, worker_id, stale_after, max_attempts):
+        for job in self.jobs.values():
+            if job["status"] == JobStatus.QUEUED:
+                job.update(status=JobStatus.RUNNING, worker_id=worker_id, attempts=job["attempts"] + 1)
+                return dict(job)
+        return None
+
+    def heartbeat(self, worker_id, progress):
+        self.heartbeats.append(progress)
+
+    def finish(self, job_id, worker_id, progress, result=None, error=None):
+        status = JobStatus.FAILED if error is not None else JobStatus.SUCCEEDED
+        self.jobs[job_id].update(status=status, progress=progress, result=result, error=error)
+
+    def requeue(self, job_id, worker_id):
+        self.jobs[job_id].update(status=JobStatus.QUEUED, worker_id=None)
+
+
+class _FakeRunner:
+    """模拟agent，流式返回固定的回答"""
+
+    running = 0
+    max_running = 0
+
+    def __init__(self, delay=0.0):
+        self.model = SimpleNamespace(id="gpt-4o")
+        self.session_id = "s1"
+        self.delay = delay
+        self.run_response = None
+
+    async def arun(self, message, stream=True, stream_intermediate_steps=False):
+        if message == "fail":
+            raise RuntimeError("model error")
+
+        async def _stream():
+            _FakeRunner.running += 1
+            _FakeRunner.max_running = max(_FakeRunner.max_running, _FakeRunner.running)
+            try:
+                await asyncio.sleep(self.delay)
+                for delta in ("Hello", " world"):
+                    yield RunResponse(event=RunEvent.run_response.value, content=delta)
+                self.run_response = RunResponse(run_id="r1", content="Hello world", metrics={"time": [0.1]})
+            finally:
+                _FakeRunner.running -= 1
+
+        return _stream()
+
+
+def _job(job_id, message="hi"):
+    return {"job_id": job_id, "kind": "agent", "target_id": "sage", "message": message}
+
+
+def _worker(store, max_concurrency=2, delay=0.0):
+    released = []
+    worker = JobWorker(store, max_concurrency=max_concurrency, poll_interval=0.01, heartbeat_interval=0.01)
+    worker.register("agent", acquire=lambda job: _FakeRunner(delay), release=released.append)
+    return worker, released
+
+
+async def _run_until(worker, done, timeout=2.0):
+    worker.start()
+    try:
+        for _ in range(int(timeout / 0.01)):
+            if done():
+                return
+            await asyncio.sleep(0.01)
+    finally:
+        await worker.stop()
+
+
+class TestJobWorker:
+    """后台任务执行测试类"""
+
+    def test_runs_jobs_and_records_results(self):
+        """测试任务执行成功和失败的结果与进度"""
+        store = _FakeStore([_job("a"), _job("b", message="fail")])
+        worker, released = _worker(store)
+
+        def finished():
+            return all(job["status"] in (JobStatus.SUCCEEDED, JobStatus.FAILED) for job in store.jobs.values())
+
+        asyncio.run(_run_until(worker, finished))
+
+        succeeded, failed = store.jobs["a"], store.jobs["b"]
+        assert succeeded["status"] == JobStatus.SUCCEEDED
+        assert succeeded["result"]["content"] == "Hello world"
+        assert succeeded["result"]["session_id"] == "s1"
+        assert succeeded["progress"]["content_chars"] == len("Hello world")
+        assert failed["status"] == JobStatus.FAILED
+        assert failed["error"] == "model error"
+        assert len(released) == 2
+        assert worker.stats()["succeeded"] == 1 and worker.stats()["failed"] == 1
+
+    def test_unknown_kind_fails_right_away(self):
+        """测试未知类型的任务（例如旧版本留下的）立即失败，不会一直处于执行中"""
+        store = _FakeStore([dict(_job("old"), kind="workflow")])
+        worker, released = _worker(store)
+
+        asyncio.run(_run_until(worker, lambda: store.jobs["old"]["status"] == JobStatus.FAILED))
+
+        assert store.jobs["old"]["status"] == JobStatus.FAILED
+        assert store.jobs["old"]["error"] == "Unknown job kind: workflow"
+        assert not worker._progress and not released
+
+    def test_concurrency_limit(self):
+        """测试同时执行的任务数量不超过上限"""
+        _FakeRunner.max_running = 0
+        store = _FakeStore([_job(str(i)) for i in range(6)])
+        worker, _ = _worker(store, max_concurrency=2, delay=0.02)
+
+        asyncio.run(_run_until(worker, lambda: all(j["status"] == JobStatus.SUCCEEDED for j in store.jobs.values())))
+
+        assert all(job["status"] == JobStatus.SUCCEEDED for job in store.jobs.values())
+        assert _FakeRunner.max_running == 2
+
+    def test_stop_requeues_running_jobs(self):
+        """测试关闭时正在执行的任务重新入队，并记录了心跳"""
+        store = _FakeStore([_job("slow")])
+        worker, released = _worker(store, delay=10)
+
+        asyncio.run(_run_until(worker, lambda: len(store.heartbeats) > 0))
+
+        assert store.jobs["slow"]["status"] == JobStatus.QUEUED
+        assert "slow" in store.heartbeats[0]
+        assert len(released) == 1
+
+    def test_idle_worker_backs_off_and_wakes_on_submit(self):
+        """测试空闲的worker逐渐减少查询，提交的任务立即唤醒它"""
+        store = _FakeStore([])
+        released = []
+        worker = JobWorker(store, max_concurrency=2, poll_interval=0.01, idle_poll_interval=10)
+        worker.register("agent", acquire=lambda job: _FakeRunner(), release=released.append)
+
+        async def scenario():
+            worker.start()
+            try:
+                await asyncio.sleep(0.2)
+                idle_claims = worker.claims
+                job = await worker.submit("agent", "sage", "gpt-4o", "hi")
+                for _ in range(100):
+                    if store.jobs[job["job_id"]]["status"] == JobStatus.SUCCEEDED:
+                        break
+                    await asyncio.sleep(0.01)
+                return idle_claims, store.jobs[job["job_id"]]["status"]
+            finally:
+                await worker.stop()
+
+        idle_claims, status = asyncio.run(scenario())
+        # Waits of 0.01, 0.02, 0.04, 0.08 and 0.16 seconds instead of a claim every 0.01 seconds
+        assert idle_claims <= 6
+        assert status == JobStatus.SUCCEEDED
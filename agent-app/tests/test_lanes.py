@@ -0,0 +1,103 @@
+"""
+优先级通道测试文件
+
+这个文件测试模型调用的优先级通道：交互通道的预留并发不会被批量调用占用、交互延迟升高时先限流批量通道再限流后台通道，
+以及请求只能降低自己的通道。
+"""
+
+import asyncio
+
+from api import lanes
+from api.fair_scheduling import FairScheduler
+from api.lanes import Lane, LanePolicy, lane_of
+
+SLOS = {Lane.INTERACTIVE: 1.0, Lane.BACKGROUND: 10.0, Lane.BULK: 60.0}
+
+
+def _policy():
+    return LanePolicy(
+        reserved={Lane.INTERACTIVE: 2, Lane.BACKGROUND: 1, Lane.BULK: 1},
+        slo_seconds=SLOS,
+        throttle_at={Lane.BULK: 0.8, Lane.BACKGROUND: 1.0},
+    )
+
+
+async def _hold(scheduler, lane, started, done):
+    async with scheduler.slot("user:a", lane):
+        started.append(lane)
+        await done.wait()
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0.001)
+
+
+class TestLanes:
+    """优先级通道测试类"""
+
+    def test_reserved_slots_are_kept_for_interactive_calls(self):
+        """测试批量调用占不到交互通道的预留槽位，交互调用到达后立即执行"""
+
+        async def scenario():
+            scheduler = FairScheduler(capacity=6, lanes=_policy())
+            started, done = [], asyncio.Event()
+            tasks = [asyncio.create_task(_hold(scheduler, Lane.BULK, started, done)) for _ in range(10)]
+            await _settle()
+            bulk = scheduler.stats()["in_flight_per_lane"][Lane.BULK]
+            tasks += [asyncio.create_task(_hold(scheduler, Lane.INTERACTIVE, started, done)) for _ in range(2)]
+            await _settle()
+            in_flight = dict(scheduler.stats()["in_flight_per_lane"])
+            done.set()
+            await asyncio.gather(*tasks)
+            return bulk, in_flight, scheduler.in_flight
+
+        bulk, in_flight, left = asyncio.run(scenario())
+        # 6 slots, 2 reserved for interactive and 1 for background calls
+        assert bulk == 3
+        assert in_flight == {Lane.BULK: 3, Lane.INTERACTIVE: 2}
+        assert left == 0
+
+    def test_bulk_is_throttled_first_when_interactive_latency_rises(self):
+        """测试交互延迟接近SLO时批量通道降到预留并发，超过SLO时后台通道也被限流，延迟恢复后解除"""
+        policy = _policy()
+        assert not policy.is_throttled(Lane.BULK)
+        for _ in range(20):
+            policy.observe(Lane.INTERACTIVE, 0.9)
+        assert policy.is_throttled(Lane.BULK) and not policy.is_throttled(Lane.BACKGROUND)
+        assert policy.limit(Lane.BULK, 16) == 1 and policy.limit(Lane.BACKGROUND, 16) == 16
+        for _ in range(20):
+            policy.observe(Lane.INTERACTIVE, 1.5)
+        assert policy.is_throttled(Lane.BACKGROUND)
+        assert not policy.is_throttled(Lane.INTERACTIVE)
+        stats = policy.stats()["lanes"][Lane.INTERACTIVE]
+        assert stats["calls"] == 40 and stats["over_slo"] == 20
+
+        policy.window = 0
+        policy._pressure_at = float("-inf")
+        assert not policy.is_throttled(Lane.BULK)
+
+        async def scenario():
+            policy.window = 60
+            for _ in range(20):
+                policy.observe(Lane.INTERACTIVE, 1.5)
+            scheduler = FairScheduler(capacity=6, lanes=policy)
+            started, done = [], asyncio.Event()
+            tasks = [asyncio.create_task(_hold(scheduler, Lane.BULK, started, done)) for _ in range(4)]
+            await _settle()
+            bulk = scheduler.in_flight
+            done.set()
+            await asyncio.gather(*tasks)
+            return bulk
+
+        assert asyncio.run(scenario()) == 1
+
+    def test_requests_can_only_lower_their_lane(self, monkeypatch):
+        """测试X-Priority请求头和租户配置只能降低请求的通道"""
+        monkeypatch.setattr(lanes.api_settings, "lane_tenants", {"user:eval-bot": Lane.BULK})
+        assert lane_of(Lane.INTERACTIVE) == Lane.INTERACTIVE
+        assert lane_of(Lane.INTERACTIVE, {"X-Priority": "background"}) == Lane.BACKGROUND
+        assert lane_of(Lane.BULK, {"X-Priority": "interactive"}) == Lane.BULK
+        assert lane_of(Lane.INTERACTIVE, {"X-Priority": "urgent"}) == Lane.INTERACTIVE
+        assert lane_of(Lane.INTERACTIVE, {}, "user:eval-bot") == Lane.BULK
+        assert lane_of(Lane.BACKGROUND, {}, "user:alice") == Lane.BACKGROUND
@@ -0,0 +1,135 @@
+"""
+负载降级测试文件
+
+这个文件用合成负载测试降级策略：随着排队深度、事件循环延迟和p95耗时上升，依次缩短历史、去掉可选工具、
+切换到更便宜的模型，负载下降后取消降级；并测试降级只作用于本次租用的agent，归还前恢复原样。
+"""
+
+import asyncio
+import time
+
+from agno.agent import Agent
+from agno.models.openai import OpenAIChat
+from agno.team import Team
+from agno.tools.duckduckgo import DuckDuckGoTools
+from agno.tools.yfinance import YFinanceTools
+
+from api.admission import AdmissionController
+from api.load_shedding import Degradation, LoadShedder
+
+THRESHOLDS = {Degradation.HISTORY: 0.5, Degradation.OPTIONAL_TOOLS: 0.75, Degradation.CHEAPER_MODEL: 1.0}
+
+
+def _shedder(controller, **kwargs):
+    options = dict(
+        queue_depth=4,
+        loop_lag=0.1,
+        p95_seconds=10,
+        thresholds=THRESHOLDS,
+        cheaper_models={"gpt-4o": "gpt-4o-mini"},
+        optional_tools={"sage": ["duckduckgo_search", "duckduckgo_news"], "finance": ["get_company_news"]},
+    )
+    options.update(kwargs)
+    return LoadShedder(controller, **options)
+
+
+class TestLoadShedder:
+    """负载降级测试类"""
+
+    def test_degrades_progressively_with_queue_depth(self):
+        """测试排队越深降级越多，负载下降后恢复正常"""
+
+        async def scenario():
+            controller = AdmissionController(max_in_flight=2, max_in_flight_per_key=2, max_queue=100)
+            shedder = _shedder(controller)
+            running = [await controller.admit("sage") for _ in range(2)]
+            plans = [shedder.plan("sage", "gpt-4o")]
+            waiting = []
+            for _ in range(4):
+                waiting.append(asyncio.create_task(controller.admit("sage")))
+                await asyncio.sleep(0)
+                plans.append(shedder.plan("sage", "gpt-4o"))
+            for ticket in running:
+                ticket.release()
+            for task in waiting:
+                (await task).release()
+            plans.append(shedder.plan("sage", "gpt-4o"))
+            return plans, shedder, controller
+
+        plans, shedder, controller = asyncio.run(scenario())
+        assert plans[0] == ("gpt-4o", [])
+        assert plans[1] == ("gpt-4o", [])
+        assert plans[2] == ("gpt-4o", ["history"])
+        assert plans[3] == ("gpt-4o", ["history", "optional_tools"])
+        assert plans[4] == ("gpt-4o-mini", ["history", "optional_tools", "cheaper_model"])
+        assert plans[5] == ("gpt-4o", [])
+        assert shedder.stats()["degraded"] == {"history": 3, "optional_tools": 2, "cheaper_model": 1}
+        assert controller.stats()["in_flight"] == 0
+
+    def test_slow_runs_and_loop_lag_raise_the_pressure(self):
+        """测试最近运行的p95耗时和事件循环延迟都会提高负载压力"""
+
+        async def scenario():
+            controller = AdmissionController(max_in_flight=4, max_in_flight_per_key=4)
+            shedder = _shedder(controller, loop_lag=0.1)
+            for seconds in (1, 2, 8):
+                ticket = await controller.admit("scholar")
+                ticket.admitted_at -= seconds
+                ticket.release()
+            p95 = shedder.plan("scholar", "o3-mini")
+
+            shedder.lag_interval = 0.01
+            shedder.start()
+            await asyncio.sleep(0.02)
+            # A blocking call stalls the event loop
+            time.sleep(0.2)
+            await asyncio.sleep(0.02)
+            lagging = shedder.signals()["loop_lag"]
+            await shedder.stop()
+            return p95, lagging
+
+        p95, lagging = asyncio.run(scenario())
+        # Scholar has no optional tools, so at a pressure of 0.8 only its history is shortened
+        assert p95 == ("o3-mini", ["history"])
+        assert lagging > 1
+
+    def test_apply_and_restore_agent_and_team(self):
+        """测试降级作用于agent和团队成员的历史和工具，恢复后与原来完全相同"""
+        shedder = _shedder(AdmissionController(max_in_flight=1, max_in_flight_per_key=1))
+        search = DuckDuckGoTools()
+        sage = Agent(model=OpenAIChat(id="gpt-4o"), tools=[search], num_history_responses=3)
+        finance = YFinanceTools(stock_price=True, company_news=True)
+        member = Agent(model=OpenAIChat(id="gpt-4o"), tools=[finance], num_history_runs=5)
+        team = Team(members=[member], model=OpenAIChat(id="gpt-4o"))
+
+        restore = shedder.apply(sage, "sage", ["history", "optional_tools"])
+        assert sage.tools == [] and sage.num_history_responses == 1
+        restore()
+        assert sage.tools == [search] and sage.num_history_responses == 3
+
+        restore = shedder.apply(team, "finance", ["optional_tools"])
+        assert list(member.tools[0].functions) == ["get_current_stock_price"]
+        assert member.num_history_runs == 5
+        # The shared toolkit itself is untouched
+        assert list(finance.functions) == ["get_current_stock_price", "get_company_news"]
+        restore()
+        assert member.tools == [finance]
+
+    def test_p95_of_old_runs_stops_counting_once_idle(self):
+        """测试慢运行结束一段时间后不再计入p95，空闲的worker恢复正常"""
+
+        async def scenario():
+            controller = AdmissionController(max_in_flight=4, max_in_flight_per_key=4, held_window=0.05)
+            shedder = _shedder(controller)
+            for _ in range(3):
+                ticket = await controller.admit("finance")
+                ticket.admitted_at -= 600
+                ticket.release()
+            busy = shedder.plan("finance", "gpt-4o")
+            await asyncio.sleep(0.06)
+            return busy, shedder.signals()["p95"], shedder.plan("finance", "gpt-4o")
+
+        busy, p95, idle = asyncio.run(scenario())
+        assert busy == ("gpt-4o-mini", ["history", "optional_tools", "cheaper_model"])
+        assert p95 == 0
+        assert idle == ("gpt-4o", [])
@@ -0,0 +1,100 @@
+"""
+指标测试文件
+
+这个文件测试直方图、运行指标的记录和Prometheus文本格式输出。
+"""
+
+from agno.models.message import Message, MessageMetrics
+from agno.models.response import ToolExecution
+from agno.run.response import RunResponse
+from agno.run.team import TeamRunResponse
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from utils.metrics import Histogram, Metrics, RunTracker, instrument_db_pools, metrics
+
+
+def _response():
+    """模拟一次包含模型调用和工具调用的运行结果"""
+    return RunResponse(
+        model="gpt-4o",
+        model_provider="OpenAI",
+        messages=[
+            Message(role="user", content="hi"),
+            Message(role="assistant", content="old", from_history=True, metrics=MessageMetrics(time=9.0)),
+            Message(role="assistant", content="hello", metrics=MessageMetrics(time=0.5, output_tokens=50)),
+        ],
+        tools=[
+            ToolExecution(tool_call_id="t1", tool_name="duckduckgo_search", metrics=MessageMetrics(time=1.2)),
+        ],
+    )
+
+
+class _Runner:
+    def __init__(self, response):
+        self.run_response = response
+
+
+class TestMetrics:
+    """指标测试类"""
+
+    def test_histogram_buckets_and_render(self):
+        """测试直方图分桶和Prometheus输出"""
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1]
+
+        registry = Metrics()
+        registry.histogram("latency_seconds", "Latency", (0.1, 1.0))
+        registry.gauge("in_flight", "In flight")
+        registry.observe("latency_seconds", 0.5, id='say "hi"')
+        registry.add("in_flight", 2, id="sage")
+        output = registry.render()
+        assert 'latency_seconds_bucket{id="say \\"hi\\"",le="0.1"} 0' in output
+        assert 'latency_seconds_bucket{id="say \\"hi\\"",le="1.0"} 1' in output
+        assert 'latency_seconds_bucket{id="say \\"hi\\"",le="+Inf"} 1' in output
+        assert 'latency_seconds_count{id="say \\"hi\\""} 1' in output
+        assert 'in_flight{id="sage"} 2.0' in output
+
+    def test_run_tracker(self):
+        """测试运行耗时、首个token、模型调用、工具调用和并发数"""
+        metrics.clear()
+        tracker = RunTracker("agent", "scholar")
+        assert metrics.get("runs_in_flight", kind="agent", id="scholar") == 1
+        tracker.token()
+        tracker.token()
+        tracker.finish(_Runner(_response()))
+        tracker.finish(_Runner(_response()))
+
+        assert metrics.get("runs_in_flight", kind="agent", id="scholar") == 0
+        assert metrics.get("run_duration_seconds", kind="agent", id="scholar").count == 1
+        assert metrics.get("run_time_to_first_token_seconds", kind="agent", id="scholar").count == 1
+        model_calls = metrics.get(
+            "model_call_duration_seconds", kind="agent", id="scholar", provider="OpenAI", model="gpt-4o"
+        )
+        assert model_calls.count == 1 and model_calls.sum == 0.5
+        assert metrics.get("run_output_tokens_per_second", kind="agent", id="scholar").sum == 100
+        tool_calls = metrics.get("tool_call_duration_seconds", kind="agent", id="scholar", tool="duckduckgo_search")
+        assert tool_calls.sum == 1.2
+
+    def test_team_member_responses(self):
+        """测试团队成员的模型和工具调用记在团队名下"""
+        metrics.clear()
+        team_response = TeamRunResponse(model="gpt-4o", model_provider="OpenAI", member_responses=[_response()])
+        RunTracker("team", "finance-researcher").finish(_Runner(team_response))
+        tool_calls = metrics.get(
+            "tool_call_duration_seconds", kind="team", id="finance-researcher", tool="duckduckgo_search"
+        )
+        assert tool_calls.count == 1
+
+    def test_db_pool_checkout_wait(self):
+        """测试数据库连接池等待时间按当前运行的agent记录"""
+        metrics.clear()
+        instrument_db_pools()
+        engine = create_engine("sqlite://", poolclass=QueuePool)
+        tracker = RunTracker("agent", "sage")
+        with engine.connect() as connection:
+            connection.execute(text("select 1"))
+        tracker.finish()
+        assert metrics.get("db_pool_checkout_wait_seconds", kind="agent", id="sage").count == 1
@@ -0,0 +1,69 @@
+"""
+实例池测试文件
+
+这个文件测试agent/team实例池的复用、状态重置和统计信息。
+"""
+
+from utils.pool import InstancePool
+
+
+class _Dummy:
+    def __init__(self):
+        self.user_id = None
+        self.session_id = None
+        self.session_state = None
+        self.memory = None
+
+
+class TestInstancePool:
+    """实例池测试类"""
+
+    def test_miss_then_hit(self):
+        """测试首次获取时构建实例，归还后复用同一实例"""
+        pool: InstancePool[_Dummy] = InstancePool(name="test")
+        first = pool.acquire("sage", _Dummy, user_id="u1")
+        pool.release(first)
+        second = pool.acquire("sage", _Dummy, user_id="u2")
+
+        assert second is first
+        assert second.user_id == "u2"
+        stats = pool.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["in_use"] == 1
+
+    def test_keys_are_isolated(self):
+        """测试不同的key不会共享实例"""
+        pool: InstancePool[_Dummy] = InstancePool(name="test")
+        first = pool.acquire(("sage", "gpt-4o"), _Dummy)
+        pool.release(first)
+        other = pool.acquire(("sage", "o3-mini"), _Dummy)
+
+        assert other is not first
+
+    def test_session_attributes_are_reset(self):
+        """测试归还后会话状态不会泄漏到下一次租用"""
+        pool: InstancePool[_Dummy] = InstancePool(name="test", reset_attributes=("session_state", "memory"))
+        first = pool.acquire("sage", _Dummy, session_id="s1")
+        first.session_state = {"current_session_id": "s1"}
+        first.memory = object()
+        pool.release(first)
+
+        second = pool.acquire("sage", _Dummy, session_id="s2")
+        assert second is first
+        assert second.session_state is None
+        assert second.memory is None
+        assert second.session_id == "s2"
+
+    def test_max_idle_per_key(self):
+        """测试超过空闲上限的实例会被丢弃"""
+        pool: InstancePool[_Dummy] = InstancePool(name="test", max_idle_per_key=1)
+        first = pool.acquire("sage", _Dummy)
+        second = pool.acquire("sage", _Dummy)
+        pool.release(first)
+        pool.release(second)
+
+        stats = pool.stats()
+        assert stats["idle"] == 1
+        assert stats["discarded"] == 1
+        assert stats["in_use"] == 0
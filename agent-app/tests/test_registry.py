@@ -0,0 +1,77 @@
+"""
+延迟创建注册表测试文件
+
+这个文件测试agent和团队只在首次使用时创建、并发时只创建一次、后台预热，以及延迟playground与agno的Playground属性一致。
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from agno.agent import Agent
+from agno.app.playground.operator import get_agent_by_id
+from agno.playground import Playground
+from agno.team import Team
+
+from utils.registry import LazyInstance, LazyPlayground, registry_stats, warm_up
+
+
+def _lazy_agent(agent_id, builds):
+    def factory():
+        builds.append(agent_id)
+        return Agent(name=agent_id.title(), agent_id=agent_id)
+
+    return LazyInstance("agent_id", agent_id, agent_id.title(), factory)
+
+
+class TestLazyRegistry:
+    """延迟创建注册表测试类"""
+
+    def test_lookup_by_id_does_not_build(self):
+        """测试按id查找和读取名称不会创建实例，其他属性在首次访问时创建"""
+        builds = []
+        agents = [_lazy_agent("sage", builds), _lazy_agent("scholar", builds)]
+        playground = LazyPlayground(agents=agents, teams=[])
+
+        found = get_agent_by_id("scholar", playground.agents)
+        assert found is agents[1]
+        assert found.name == "Scholar"
+        assert builds == []
+
+        assert found.app_id == playground.app_id
+        found.monitoring = False
+        assert found.get().monitoring is False
+        assert builds == ["scholar"]
+        assert registry_stats(agents)["sage"] is None
+
+    def test_concurrent_first_use_builds_once(self):
+        """测试并发首次使用只创建一次"""
+        builds = []
+        agent = _lazy_agent("sage", builds)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            instances = list(executor.map(lambda _: agent.get(), range(8)))
+        assert builds == ["sage"]
+        assert all(instance is instances[0] for instance in instances)
+
+    def test_warm_up_initializes_teams(self):
+        """测试预热创建团队并初始化成员"""
+        team = LazyInstance(
+            "team_id",
+            "multi-language-team",
+            "Multi Language Team",
+            lambda: Team(name="Multi Language Team", team_id="multi-language-team", members=[Agent(name="Spanish")]),
+        )
+        playground = LazyPlayground(agents=[], teams=[team])
+        warm_up([team]).join()
+
+        assert team.built
+        assert team.get().members[0].app_id == playground.app_id
+        assert registry_stats([team])["multi-language-team"] >= 0
+
+    def test_lazy_playground_sets_the_attributes_of_agno_playground(self):
+        """测试不调用agno的构造函数时，延迟playground仍然具有agno的Playground设置的所有属性"""
+        builds = []
+        lazy = LazyPlayground(agents=[_lazy_agent("sage", builds)], teams=[], app_id="app")
+        agno = Playground(agents=[Agent(name="Sage", agent_id="sage")], app_id="app")
+
+        assert set(vars(agno)) <= set(vars(lazy))
+        assert lazy.app_id == "app" and lazy.get_async_router() is not None
+        assert builds == []
@@ -0,0 +1,126 @@
+"""
+gRPC服务测试文件
+
+这个文件在本地端口启动gRPC服务，使用模拟的agent测试流式返回的事件与REST接口一致、元数据中返回流id、未知的agent返回NOT_FOUND，以及与REST共用的运行流程中的错误转换为gRPC状态码。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+grpc = pytest.importorskip("grpc")
+
+from agno.run.response import RunEvent, RunResponse  # noqa: E402
+
+from fastapi import HTTPException  # noqa: E402
+
+from api import run_flow  # noqa: E402
+from api.rpc import runs_pb2, runs_pb2_grpc  # noqa: E402
+from api.rpc.server import RunsServicer, RunTarget  # noqa: E402
+from api.run_streams import run_streams  # noqa: E402
+
+
+class _FakeRunner:
+    """模拟agent，流式返回固定的回答"""
+
+    def __init__(self):
+        self.model = SimpleNamespace(id="gpt-4o")
+        self.session_id = "s1"
+        self.run_response = None
+
+    async def arun(self, message, stream=True, stream_intermediate_steps=False):
+        async def _stream():
+            yield RunResponse(event=RunEvent.run_started.value, run_id="r1", session_id="s1")
+            for delta in ("Hello", " world"):
+                yield RunResponse(content=delta)
+
+        return _stream()
+
+
+async def _serve(released):
+    servicer = RunsServicer()
+    servicer.register(
+        "agent",
+        RunTarget(ids=["sage"], acquire=lambda *args: _FakeRunner(), release=released.append),
+    )
+    server = grpc.aio.server()
+    runs_pb2_grpc.add_RunsServicer_to_server(servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    return server, port
+
+
+class TestRunsService:
+    """gRPC服务测试类"""
+
+    def test_run_agent_streams_events(self):
+        """测试流式返回运行事件，内容事件使用delta字段，其他事件的数据为JSON"""
+
+        async def scenario():
+            released = []
+            server, port = await _serve(released)
+            try:
+                async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                    call = runs_pb2_grpc.RunsStub(channel).RunAgent(
+                        runs_pb2.RunRequest(target_id="sage", message="hi", user_id="u1")
+                    )
+                    metadata = await call.initial_metadata()
+                    events = [event async for event in call]
+            finally:
+                await server.stop(None)
+            return metadata, events, released
+
+        metadata, events, released = asyncio.run(scenario())
+        assert [event.event for event in events] == ["run_started", "content", "content", "timing"]
+        assert "".join(event.delta for event in events) == "Hello world"
+        assert orjson.loads(events[0].data)["run_id"] == "r1"
+        assert events[0].id == f"{metadata['x-stream-id']}:0"
+        assert len(released) == 1
+        assert run_streams.stats()["opened"] >= 1
+
+    def test_unknown_agent_and_model(self):
+        """测试未知的agent返回NOT_FOUND，未知的模型返回INVALID_ARGUMENT"""
+
+        async def scenario():
+            server, port = await _serve([])
+            codes = []
+            try:
+                async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                    stub = runs_pb2_grpc.RunsStub(channel)
+                    for request in (
+                        runs_pb2.RunRequest(target_id="nobody", message="hi"),
+                        runs_pb2.RunRequest(target_id="sage", message="hi", model="gpt-2"),
+                    ):
+                        with pytest.raises(grpc.aio.AioRpcError) as e:
+                            [event async for event in stub.RunAgent(request)]
+                        codes.append(e.value.code())
+            finally:
+                await server.stop(None)
+            return codes
+
+        assert asyncio.run(scenario()) == [grpc.StatusCode.NOT_FOUND, grpc.StatusCode.INVALID_ARGUMENT]
+
+    def test_rejected_run_keeps_its_retry_after(self, monkeypatch):
+        """测试共用流程中准入被拒绝时返回RESOURCE_EXHAUSTED，并在尾部元数据中带上retry-after"""
+
+        async def reject(key):
+            raise HTTPException(status_code=429, detail="Too many runs waiting", headers={"Retry-After": "3"})
+
+        monkeypatch.setattr(run_flow, "admit_run", reject)
+
+        async def scenario():
+            server, port = await _serve([])
+            try:
+                async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                    call = runs_pb2_grpc.RunsStub(channel).RunAgent(runs_pb2.RunRequest(target_id="sage", message="hi"))
+                    with pytest.raises(grpc.aio.AioRpcError) as e:
+                        [event async for event in call]
+            finally:
+                await server.stop(None)
+            return e.value.code(), dict(list(e.value.trailing_metadata()))
+
+        code, trailing = asyncio.run(scenario())
+        assert code == grpc.StatusCode.RESOURCE_EXHAUSTED
+        assert trailing["retry-after"] == "3"
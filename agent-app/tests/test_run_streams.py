@@ -0,0 +1,167 @@
+"""
+可恢复事件流测试文件
+
+这个文件测试事件带有SSE id、断线后按Last-Event-ID从下一个事件继续、缓冲区有上限时拒绝恢复已丢弃的事件、完成后缓冲区被清除，断线等待时间内不取消执行，以及在一个连接上订阅多个执行的事件。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from api.run_streams import RunStreams
+from api.streaming import StreamEvent, StreamEventType
+
+
+def _runner():
+    return SimpleNamespace(run_response=None, session_id=None)
+
+
+async def _source(gate, deltas=("a", "b", "c", "d"), run_id="r1", session_id=None):
+    yield StreamEvent(StreamEventType.RUN_STARTED, {"run_id": run_id, "session_id": session_id})
+    for delta in deltas:
+        await gate.wait()
+        yield StreamEvent(StreamEventType.CONTENT, {"delta": delta})
+    yield StreamEvent(StreamEventType.RUN_COMPLETED, {"run_id": "r1"})
+
+
+async def _collect(source):
+    return [event async for event in source]
+
+
+class TestRunStreams:
+    """可恢复事件流测试类"""
+
+    def test_resume_after_last_event_id(self):
+        """测试断线重连后从Last-Event-ID的下一个事件继续，断线期间执行不被取消"""
+        streams = RunStreams(max_events=100, resume_grace=1.0, retention=60)
+
+        async def scenario():
+            released = []
+            gate = asyncio.Event()
+            channel = streams.open()
+            streams.run(channel, _runner(), _source(gate), released.append)
+            subscription = channel.subscribe()
+            first = await subscription.__anext__()
+            await subscription.aclose()
+
+            gate.set()
+            await asyncio.sleep(0.01)
+            resumed, start = streams.resume(first.id)
+            rest = [event async for event in resumed.subscribe(start)]
+            return channel, first, rest, released
+
+        channel, first, rest, released = asyncio.run(scenario())
+        assert first.id == f"{channel.stream_id}:0"
+        assert first.encode().startswith(f"id: {first.id}\n".encode())
+        assert [event.data.get("delta") for event in rest] == ["a", "b", "c", "d", None]
+        assert [event.id for event in rest][-1] == f"{channel.stream_id}:5"
+        assert len(released) == 1 and streams.stats()["resumed"] == 1
+
+    def test_bounded_buffer_rejects_dropped_events(self):
+        """测试缓冲区只保留最近的事件，恢复已丢弃的事件返回409，未知的流返回404"""
+        streams = RunStreams(max_events=2, resume_grace=0, retention=60)
+
+        async def scenario():
+            gate = asyncio.Event()
+            gate.set()
+            channel = streams.open()
+            streams.run(channel, _runner(), _source(gate), lambda runner: None)
+            events = [event async for event in channel.subscribe()]
+            return channel, events
+
+        channel, events = asyncio.run(scenario())
+        assert channel.offset == 4 and len(channel.events) == 2
+        with pytest.raises(HTTPException) as e:
+            streams.resume(f"{channel.stream_id}:0")
+        assert e.value.status_code == 409
+        assert streams.resume(f"{channel.stream_id}:3")[1] == 4
+        with pytest.raises(HTTPException) as e:
+            streams.resume("unknown:3")
+        assert e.value.status_code == 404
+
+    def test_evicted_after_retention(self):
+        """测试执行完成后经过保留时间清除缓冲区"""
+        streams = RunStreams(max_events=100, resume_grace=0, retention=0.01)
+
+        async def scenario():
+            gate = asyncio.Event()
+            gate.set()
+            channel = streams.open()
+            streams.run(channel, _runner(), _source(gate), lambda runner: None)
+            [event async for event in channel.subscribe()]
+            kept = streams.get(channel.stream_id) is channel
+            await asyncio.sleep(0.03)
+            return kept, streams.get(channel.stream_id)
+
+        kept, evicted = asyncio.run(scenario())
+        assert kept and evicted is None
+        assert streams.stats()["streams"] == 0
+
+    def test_cancelled_without_resume(self):
+        """测试断线后在等待时间内没有重连则取消执行"""
+        streams = RunStreams(max_events=100, resume_grace=0.01, retention=60)
+
+        async def scenario():
+            released = []
+            channel = streams.open()
+            streams.run(channel, _runner(), _source(asyncio.Event()), released.append)
+            subscription = channel.subscribe()
+            await subscription.__anext__()
+            await subscription.aclose()
+            await asyncio.sleep(0.03)
+            return channel.done, released
+
+        done, released = asyncio.run(scenario())
+        assert done and len(released) == 1
+
+    def test_multiplex_runs(self):
+        """测试按执行id订阅多个执行，事件交错并带有执行id，全部完成后结束"""
+        streams = RunStreams(max_events=100, resume_grace=0, retention=60)
+
+        async def scenario():
+            gate = asyncio.Event()
+            first, second = streams.open("agent", "sage"), streams.open("team", "finance-researcher")
+            streams.run(first, _runner(), _source(gate, run_id="r1"), lambda runner: None)
+            streams.run(second, _runner(), _source(gate, ("x",), run_id="r2"), lambda runner: None)
+            await asyncio.sleep(0.01)
+            assert streams.find("r2") is second
+            subscription = asyncio.create_task(_collect(streams.multiplex([first, second])))
+            gate.set()
+            return await subscription
+
+        events = asyncio.run(scenario())
+        by_run = {}
+        for event in events:
+            by_run.setdefault(event.data["run_id"], []).append(event.data["data"].get("delta"))
+        assert by_run == {"r1": [None, "a", "b", "c", "d", None], "r2": [None, "x", None]}
+        assert {event.data["kind"] for event in events} == {"agent", "team"}
+
+    def test_watch_session(self):
+        """测试订阅会话时收到之后开始的执行，其他会话的执行不会收到"""
+        streams = RunStreams(max_events=100, resume_grace=0, retention=60)
+
+        async def scenario():
+            gate = asyncio.Event()
+            received = []
+
+            async def watch():
+                async for event in streams.multiplex(session_id="s1"):
+                    received.append((event.data["run_id"], event.event))
+
+            watcher = asyncio.create_task(watch())
+            await asyncio.sleep(0)
+            for run_id, session_id in (("r1", "s1"), ("r2", "s2")):
+                channel = streams.open("agent", "sage")
+                streams.run(channel, _runner(), _source(gate, ("a",), run_id, session_id), lambda runner: None)
+            gate.set()
+            await asyncio.sleep(0.01)
+            subscriptions = streams.stats()["subscriptions"]
+            watcher.cancel()
+            await asyncio.sleep(0)
+            return received, subscriptions
+
+        received, subscriptions = asyncio.run(scenario())
+        assert received == [("r1", "run_started"), ("r1", "content"), ("r1", "run_completed")]
+        assert subscriptions == 1 and streams.stats()["subscriptions"] == 0
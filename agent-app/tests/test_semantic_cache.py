@@ -0,0 +1,102 @@
+"""
+语义缓存测试文件
+
+这个文件测试语义缓存的启用条件、新进程中按agent配置计算指纹、失败降级、指标和向量缓存，不需要数据库。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from api import semantic_cache as semantic_cache_module
+from api.cache import CachedResponse, ResponseCache, agent_fingerprint
+from api.semantic_cache import SemanticCache
+
+
+def _agent():
+    return SimpleNamespace(
+        description="Sage",
+        instructions="Be concise.",
+        expected_output=None,
+        model=SimpleNamespace(id="gpt-4o", temperature=0),
+        tools=[],
+    )
+
+
+def _caches(monkeypatch):
+    exact = ResponseCache(ttls={"sage": 60, "scholar": 60}, max_entries=10)
+    monkeypatch.setattr(semantic_cache_module, "response_cache", exact)
+    return exact, SemanticCache(thresholds={"sage": 0.9}, table_name="response_cache")
+
+
+class TestSemanticCache:
+    """语义缓存测试类"""
+
+    def test_lookup_requires_threshold_and_fingerprint(self, monkeypatch):
+        """测试只有配置了阈值且已知指纹的agent才查询"""
+        exact, cache = _caches(monkeypatch)
+        lookups = []
+        cache._lookup = lambda *args: lookups.append(args) or CachedResponse("cached", "gpt-4o", 0)
+
+        assert asyncio.run(cache.get("sage", "gpt-4o", "What are US tariffs?")) is None
+        exact.fingerprint("sage", "gpt-4o", _agent())
+        exact.fingerprint("scholar", "gpt-4o", _agent())
+        assert asyncio.run(cache.get("scholar", "gpt-4o", "hi")) is None
+        assert lookups == []
+
+        hit = asyncio.run(cache.get("sage", "gpt-4o", "  What are US   tariffs?"))
+        assert hit.content == "cached"
+        assert lookups[0][3] == "what are us tariffs?"
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["hit_rate"] == 1.0
+
+    def test_fresh_process_looks_up_with_config_fingerprint(self, monkeypatch):
+        """测试本进程还没有存过答案时，按agent配置计算指纹并查询共享的向量表，且每个agent和模型只计算一次"""
+        computed = []
+        exact = ResponseCache(
+            ttls={"sage": 60},
+            max_entries=10,
+            config_fingerprint=lambda agent_id, model_id: computed.append(agent_id) or agent_fingerprint(_agent()),
+        )
+        monkeypatch.setattr(semantic_cache_module, "response_cache", exact)
+        cache = SemanticCache(thresholds={"sage": 0.9}, table_name="response_cache")
+        lookups = []
+        cache._lookup = lambda *args: lookups.append(args) or CachedResponse("cached", "gpt-4o", 0)
+
+        assert asyncio.run(cache.get("sage", "gpt-4o", "hi")).content == "cached"
+        assert exact.get("sage", "gpt-4o", "hi") is None
+        assert lookups[0][2] == agent_fingerprint(_agent()) and computed == ["sage"]
+
+    def test_failures_are_misses(self, monkeypatch):
+        """测试数据库或向量化失败时按未命中处理"""
+        exact, cache = _caches(monkeypatch)
+        exact.fingerprint("sage", "gpt-4o", _agent())
+
+        def fail(*args):
+            raise RuntimeError("connection refused")
+
+        cache._lookup = fail
+        assert asyncio.run(cache.get("sage", "gpt-4o", "hi")) is None
+        stats = cache.stats()
+        assert stats["misses"] == 1 and stats["errors"] == 1
+
+    def test_store_in_background_reuses_embedding(self, monkeypatch):
+        """测试后台写入，且写入时复用查询时的向量"""
+        exact, cache = _caches(monkeypatch)
+        exact.fingerprint("sage", "gpt-4o", _agent())
+        embedded = []
+        cache._vector_db = SimpleNamespace(
+            embedder=SimpleNamespace(get_embedding=lambda text: embedded.append(text) or [0.1, 0.2])
+        )
+        stored = []
+        cache._store = lambda *args: stored.append(args) or cache._embed(args[3])
+
+        async def main():
+            cache._embed("hi")
+            cache.put("sage", "gpt-4o", "Hi", "hello", model="gpt-4o")
+            cache.put("sage", "gpt-4o", "Hi", "", model="gpt-4o")
+            await asyncio.gather(*cache._tasks)
+
+        asyncio.run(main())
+        assert len(stored) == 1
+        assert stored[0][3:5] == ("hi", "hello")
+        assert embedded == ["hi"]
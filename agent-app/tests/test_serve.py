@@ -0,0 +1,65 @@
+"""
+预加载服务测试文件
+
+这个文件测试进程内存的读取，以及在新的解释器中预加载应用后冻结对象、fork出的进程与父进程共享内存。
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from utils.memory import memory_report, process_memory
+
+_PROBE = """
+import gc, json, os
+from api.serve import after_fork, preload
+from utils.memory import process_memory
+
+preload(["agents.operator"], [])
+frozen = gc.get_freeze_count()
+read, write = os.pipe()
+pid = os.fork()
+if pid == 0:
+    after_fork()
+    os.write(write, json.dumps({"gc": gc.isenabled(), "memory": process_memory()}).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+child = json.loads(os.read(read, 65536))
+print(json.dumps({"frozen": frozen, "child": child}))
+"""
+
+
+class TestServe:
+    """预加载服务测试类"""
+
+    def test_process_memory(self):
+        """测试读取当前进程的内存并生成报告"""
+        memory = process_memory()
+        if memory is None:
+            pytest.skip("smaps_rollup is only available on Linux")
+        assert memory["rss"] > 0 and memory["pss"] > 0
+        assert memory["shared"] + memory["private"] == pytest.approx(memory["rss"], rel=0.05)
+        report = memory_report([("test", "self")], "Memory")
+        assert report.splitlines()[0] == "Memory" and "total pss" in report
+        assert process_memory(2**22 + 1) is None
+
+    def test_preloaded_fork_shares_memory(self):
+        """测试预加载后对象被冻结，fork出的进程重新启用垃圾回收并与父进程共享大部分内存"""
+        if process_memory() is None:
+            pytest.skip("smaps_rollup is only available on Linux")
+        result = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=Path(__file__).parent.parent,
+            capture_output=True,
+            text=True,
+            timeout=120,
+            check=True,
+        )
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        assert probe["frozen"] > 0
+        child = probe["child"]
+        assert child["gc"] is True
+        assert child["memory"]["shared"] > child["memory"]["private"]
@@ -0,0 +1,136 @@
+"""
+相同请求合并测试文件
+
+这个文件测试相同的并发请求共享一次执行、不同用户的请求各自执行、晚加入的请求收到完整的输出、所有请求离开后取消执行，
+以及启动失败时的错误传递。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from api.run_streams import run_streams
+from api.single_flight import SingleFlight, flight_response
+from api.streaming import StreamEvent, StreamEventType
+from utils.timing import PhaseTimeline
+
+
+def _runner():
+    return SimpleNamespace(run_response=None, session_id=None)
+
+
+async def _source(runs, gate=None, deltas=("Hello", " world")):
+    runs.append(1)
+    yield StreamEvent(StreamEventType.RUN_STARTED, {"run_id": "r1"})
+    for delta in deltas:
+        if gate is not None:
+            await gate.wait()
+        yield StreamEvent(StreamEventType.CONTENT, {"delta": delta})
+    yield StreamEvent(StreamEventType.RUN_COMPLETED, {"run_id": "r1"})
+
+
+async def _collect(channel):
+    return [event.event for event in [e async for e in channel.subscribe()]]
+
+
+class TestSingleFlight:
+    """相同请求合并测试类"""
+
+    def test_identical_runs_share_one_execution(self):
+        """测试相同的请求只执行一次，晚加入的请求也收到完整输出，会话请求不合并"""
+        flights = SingleFlight(ids=["scholar"])
+        assert not flights.enabled("scholar", session_id="s1")
+        assert not flights.enabled("sage", session_id=None)
+
+        async def scenario():
+            runs, released = [], []
+            gate = asyncio.Event()
+            channel, leader = flights.attach("agent", "scholar", "gpt-4o", "What is  RAG?")
+            flights.run(channel, _runner(), _source(runs, gate), released.append)
+            first = asyncio.create_task(_collect(channel))
+            await asyncio.sleep(0.01)
+
+            joined, joined_leader = flights.attach("agent", "scholar", "gpt-4o", "what is rag?")
+            second = asyncio.create_task(_collect(joined))
+            gate.set()
+            results = await asyncio.gather(first, second)
+            return leader, joined is channel, joined_leader, runs, released, results
+
+        leader, same, joined_leader, runs, released, results = asyncio.run(scenario())
+        assert leader and same and not joined_leader
+        assert runs == [1] and len(released) == 1
+        assert results[0] == results[1] == ["run_started", "content", "content", "run_completed"]
+        assert flights.stats()["in_flight"] == 0
+        assert flights.stats()["joined"] == 1
+
+    def test_users_get_their_own_runs(self):
+        """测试不同用户同时问相同的问题时各自执行，通道带有用户，可以按用户找到"""
+        flights = SingleFlight(ids=["scholar"])
+
+        async def scenario():
+            alice, alice_leads = flights.attach("agent", "scholar", "gpt-4o", "Who am I?", user_id="alice")
+            bob, bob_leads = flights.attach("agent", "scholar", "gpt-4o", "who am i?", user_id="bob")
+            again, again_leads = flights.attach("agent", "scholar", "gpt-4o", "Who am I?", user_id="alice")
+            watched = run_streams.multiplex(user_id="bob")
+            runs = []
+            flights.run(alice, _runner(), _source(runs), lambda runner: None)
+            flights.run(bob, _runner(), _source(runs), lambda runner: None)
+            first = await watched.__anext__()
+            await watched.aclose()
+            await asyncio.gather(_collect(alice), _collect(bob))
+            joined = again is alice and not again_leads
+            return alice_leads, bob_leads, joined, runs, alice.user_id, first.data["stream_id"] == bob.stream_id
+
+        alice_leads, bob_leads, joined, runs, user_id, found = asyncio.run(scenario())
+        assert alice_leads and bob_leads and joined
+        assert runs == [1, 1] and user_id == "alice" and found
+        assert flights.stats()["started"] == 2 and flights.stats()["joined"] == 1
+
+    def test_non_streamed_requests_get_the_content(self):
+        """测试非流式请求收到合并执行的完整回答"""
+        flights = SingleFlight(ids=["scholar"])
+
+        async def scenario():
+            channel, _ = flights.attach("agent", "scholar", "gpt-4o", "hi")
+            joined, _ = flights.attach("agent", "scholar", "gpt-4o", "hi")
+            flights.run(channel, _runner(), _source([]), lambda runner: None)
+            return await flight_response(joined, stream=False, events=False, timeline=PhaseTimeline(), leader=False)
+
+        response = asyncio.run(scenario())
+        assert response.body == b'"Hello world"'
+        assert response.headers["X-Single-Flight"] == "joined"
+        assert "single_flight;dur=" in response.headers["Server-Timing"]
+
+    def test_cancelled_when_all_requests_leave(self, monkeypatch):
+        """测试所有请求都离开、且恢复等待时间过后取消执行并释放"""
+        monkeypatch.setattr(run_streams, "resume_grace", 0.02)
+        flights = SingleFlight(ids=["scholar"])
+
+        async def scenario():
+            released = []
+            channel, _ = flights.attach("agent", "scholar", "gpt-4o", "hi")
+            flights.run(channel, _runner(), _source([], asyncio.Event()), released.append)
+            subscription = channel.subscribe()
+            assert (await subscription.__anext__()).event == StreamEventType.RUN_STARTED
+            await subscription.aclose()
+            await asyncio.sleep(0.01)
+            waiting = not channel.done
+            await asyncio.sleep(0.03)
+            return waiting, channel.done, released
+
+        waiting, done, released = asyncio.run(scenario())
+        assert waiting and done and len(released) == 1
+
+    def test_abort_sends_error_to_joined_requests(self):
+        """测试领头请求启动失败时，加入的请求收到错误"""
+        flights = SingleFlight(ids=["scholar"])
+
+        async def scenario():
+            channel, _ = flights.attach("agent", "scholar", "gpt-4o", "hi")
+            joined, _ = flights.attach("agent", "scholar", "gpt-4o", "hi")
+            waiting = asyncio.create_task(_collect(joined))
+            await asyncio.sleep(0)
+            flights.abort(channel, "Too many runs in flight")
+            return await waiting
+
+        assert asyncio.run(scenario()) == ["error"]
+        assert flights.stats()["in_flight"] == 0
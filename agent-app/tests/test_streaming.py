@@ -0,0 +1,246 @@
+"""
+结构化事件流测试文件
+
+这个文件测试agent/team运行结果到SSE事件的转换和编码。
+"""
+
+import asyncio
+
+import orjson
+from agno.memory.v2.memory import Memory
+from agno.models.response import ToolExecution
+from agno.run.response import RunEvent, RunResponse
+
+from api.streaming import (
+    CoalescingBuffer,
+    StreamEvent,
+    StreamEventType,
+    cancellable_stream,
+    event_stream,
+    run_events,
+)
+
+
+class _Model:
+    id = "gpt-4o"
+
+
+class _FakeRunner:
+    """模拟agent，按顺序返回给定的流式响应"""
+
+    model = _Model()
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.run_response = RunResponse(run_id="r1", session_id="s1", model="gpt-4o", metrics={"time": [1.0]})
+
+    async def arun(self, message, stream=True, stream_intermediate_steps=False):
+        async def _stream():
+            for chunk in self.chunks:
+                yield chunk
+            if self.error:
+                raise self.error
+
+        return _stream()
+
+
+def _collect(runner):
+    async def _run():
+        return [event async for event in run_events(runner, "hi")]
+
+    return asyncio.run(_run())
+
+
+class TestStreamEvents:
+    """结构化事件流测试类"""
+
+    def test_event_encoding(self):
+        """测试事件编码为SSE帧"""
+        frame = StreamEvent(StreamEventType.CONTENT, {"delta": "你好"}).encode()
+        assert frame.startswith(b"event: content\ndata: ")
+        assert frame.endswith(b"\n\n")
+        assert orjson.loads(frame.split(b"data: ")[1]) == {"delta": "你好"}
+
+    def test_content_and_tool_events(self):
+        """测试内容增量、工具调用和最终指标事件"""
+        started = ToolExecution(tool_call_id="t1", tool_name="duckduckgo_search", tool_args={"query": "x"})
+        completed = ToolExecution(tool_call_id="t1", tool_name="duckduckgo_search", result="[]")
+        runner = _FakeRunner(
+            [
+                RunResponse(event=RunEvent.run_started.value, run_id="r1", session_id="s1"),
+                RunResponse(event=RunEvent.tool_call_started.value, content="Hel", tools=[started]),
+                RunResponse(event=RunEvent.tool_call_completed.value, content="Hel", tools=[completed]),
+                RunResponse(content="Hel"),
+                RunResponse(content="lo"),
+                RunResponse(event=RunEvent.run_completed.value, content="Hello"),
+            ]
+        )
+        events = _collect(runner)
+
+        assert [e.event for e in events] == [
+            StreamEventType.RUN_STARTED,
+            StreamEventType.TOOL_STARTED,
+            StreamEventType.TOOL_COMPLETED,
+            StreamEventType.CONTENT,
+            StreamEventType.CONTENT,
+            StreamEventType.RUN_COMPLETED,
+        ]
+        assert events[2].data["result"] == "[]"
+        assert "".join(e.data["delta"] for e in events if e.event == StreamEventType.CONTENT) == "Hello"
+        assert events[-1].data["metrics"] == {"time": [1.0]}
+
+    def test_error_event(self):
+        """测试运行失败时发送error事件"""
+        runner = _FakeRunner([RunResponse(content="partial")], error=RuntimeError("boom"))
+
+        async def _run():
+            return [event.encode() async for event in event_stream(runner, "hi")]
+
+        frames = asyncio.run(_run())
+        assert frames[0].startswith(b"event: content")
+        assert frames[-1].startswith(b"event: error")
+        assert b"boom" in frames[-1]
+
+
+async def _source(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+def _coalesce(buffer, source):
+    async def _run():
+        return [frame async for frame in buffer.coalesce(source)]
+
+    return asyncio.run(_run())
+
+
+class TestCoalescingBuffer:
+    """流式输出合并缓冲测试类"""
+
+    def test_first_token_is_not_delayed(self):
+        """测试第一个内容帧立即发送，后续帧合并发送"""
+        buffer = CoalescingBuffer(flush_bytes=1024, flush_interval=10)
+        frames = _coalesce(buffer, _source(["a", "b", "c"]))
+
+        assert frames == [b"a", b"bc"]
+
+    def test_urgent_events_flush_immediately(self):
+        """测试工具调用和结束事件会立即刷新缓冲"""
+        buffer = CoalescingBuffer(flush_bytes=1024, flush_interval=10)
+        tool = StreamEvent(StreamEventType.TOOL_STARTED, {"tool_name": "duckduckgo_search"})
+        frames = _coalesce(buffer, _source(["a", "b", tool, "c"]))
+
+        assert len(frames) == 3
+        assert frames[0] == b"a"
+        assert frames[1].startswith(b"b" + b"event: tool_started")
+        assert frames[2] == b"c"
+
+    def test_byte_threshold(self):
+        """测试缓冲达到字节阈值时刷新"""
+        buffer = CoalescingBuffer(flush_bytes=2, flush_interval=10)
+        frames = _coalesce(buffer, _source(["a", "b", "c", "d", "e"]))
+
+        assert frames == [b"a", b"bc", b"de"]
+
+    def test_time_window(self):
+        """测试等待超过时间窗口时刷新，即使没有新帧到达"""
+        buffer = CoalescingBuffer(flush_bytes=1024, flush_interval=0.01)
+        frames = _coalesce(buffer, _source(["a", "b", "c"], delay=0.05))
+
+        assert frames == [b"a", b"b", b"c"]
+
+    def test_none_chunks_are_skipped(self):
+        """测试None内容不会被写出"""
+        buffer = CoalescingBuffer(flush_bytes=1024, flush_interval=0)
+        frames = _coalesce(buffer, _source(["a", None, "b"]))
+
+        assert frames == [b"a", b"b"]
+
+    def test_source_is_closed(self):
+        """测试提前关闭时会关闭上游生成器，确保agent被归还"""
+        closed = []
+
+        async def _upstream():
+            try:
+                yield "a"
+                yield "b"
+            finally:
+                closed.append(True)
+
+        async def _run():
+            buffer = CoalescingBuffer(flush_bytes=1024, flush_interval=0)
+            stream = buffer.coalesce(_upstream())
+            await stream.__anext__()
+            await stream.aclose()
+
+        asyncio.run(_run())
+        assert closed == [True]
+
+
+class _FakeRequest:
+    """模拟请求，在指定时间后断开连接"""
+
+    def __init__(self, disconnect_after):
+        self.disconnect_at = asyncio.get_running_loop().time() + disconnect_after
+
+    async def is_disconnected(self):
+        return asyncio.get_running_loop().time() >= self.disconnect_at
+
+
+class _CancellableRunner:
+    def __init__(self):
+        self.session_id = "s1"
+        self.user_id = "u1"
+        self.memory = Memory()
+        self.run_response = RunResponse(run_id="r1", session_id="s1", content="partial")
+        self.stored = []
+
+    def write_to_storage(self, session_id, user_id=None):
+        self.stored.append(session_id)
+
+
+class TestCancellableStream:
+    """客户端断开时取消运行的测试类"""
+
+    def _run(self, disconnect_after, chunks, delay):
+        runner = _CancellableRunner()
+        released = []
+        upstream_closed = []
+
+        async def _upstream():
+            try:
+                for chunk in chunks:
+                    await asyncio.sleep(delay)
+                    yield chunk
+            finally:
+                upstream_closed.append(True)
+
+        async def _consume():
+            request = _FakeRequest(disconnect_after)
+            return [item async for item in cancellable_stream(request, runner, _upstream(), released.append)]
+
+        items = asyncio.run(_consume())
+        return items, runner, released, upstream_closed
+
+    def test_completed_run_is_released(self):
+        """测试正常完成的运行被归还且不记录为取消"""
+        items, runner, released, _ = self._run(10, ["a", "b"], 0)
+
+        assert items == ["a", "b"]
+        assert released == [runner]
+        assert runner.run_response.event == RunEvent.run_response.value
+        assert runner.stored == []
+
+    def test_disconnect_cancels_run(self):
+        """测试客户端断开后取消运行并保存部分回答"""
+        items, runner, released, upstream_closed = self._run(0.05, ["a", "b", "c"], 1)
+
+        assert items == []
+        assert upstream_closed == [True]
+        assert released == [runner]
+        assert runner.run_response.event == RunEvent.run_cancelled.value
+        assert runner.memory.runs["s1"][0].content == "partial"
+        assert runner.stored == ["s1"]
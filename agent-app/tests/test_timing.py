@@ -0,0 +1,71 @@
+"""
+请求阶段耗时测试文件
+
+这个文件测试各阶段耗时的归属、Server-Timing头的格式、流式响应最后的耗时事件，以及会话读写的计时。
+"""
+
+import asyncio
+
+from agno.agent import Agent
+from agno.models.message import Message, MessageMetrics
+from agno.models.response import ToolExecution
+from agno.run.response import RunResponse
+
+from api.streaming import StreamEvent, StreamEventType, with_timing
+from utils.timing import PhaseTimeline, current_timeline, instrument_runners
+
+
+class _Runner:
+    def __init__(self):
+        self.run_response = RunResponse(
+            messages=[
+                Message(role="assistant", content="old", from_history=True, metrics=MessageMetrics(time=9.0)),
+                Message(role="assistant", content="hello", metrics=MessageMetrics(time=0.5)),
+            ],
+            tools=[ToolExecution(tool_call_id="t1", tool_name="duckduckgo_search", metrics=MessageMetrics(time=0.2))],
+        )
+
+
+class TestPhaseTimeline:
+    """请求阶段耗时测试类"""
+
+    def test_phases_and_server_timing(self):
+        """测试阶段耗时累加、模型和工具调用的归属以及Server-Timing格式"""
+        timeline = PhaseTimeline()
+        timeline.add("admission", 0.01)
+        timeline.add("admission", 0.02)
+        timeline.started -= 2.0
+        summary = timeline.finish(_Runner()).summary()
+        timeline.finish(_Runner())
+
+        assert summary["admission"] == 30.0
+        assert summary["model"] == 500.0
+        assert summary["tool.duckduckgo_search"] == 200.0
+        assert summary["total"] >= 2000.0
+        assert summary["other"] == round(summary["total"] - 730.0, 2)
+        header = timeline.server_timing()
+        assert header.startswith("admission;dur=30.0, model;dur=500.0, tool.duckduckgo_search;dur=200.0, other;dur=")
+
+    def test_stream_ends_with_timing_event(self):
+        """测试流式事件最后是耗时事件"""
+
+        async def source():
+            yield StreamEvent(StreamEventType.CONTENT, {"content": "hi"})
+
+        async def collect():
+            timeline = PhaseTimeline()
+            return [event async for event in with_timing(source(), timeline, _Runner())]
+
+        events = asyncio.run(collect())
+        assert [event.event for event in events] == [StreamEventType.CONTENT, StreamEventType.TIMING]
+        assert events[-1].data["model"] == 500.0
+
+    def test_session_load_is_timed(self):
+        """测试agent从存储加载会话的耗时记入当前请求"""
+        instrument_runners()
+        agent = Agent()
+        timeline = PhaseTimeline()
+        agent.read_from_storage(session_id="s1")
+        assert "session_load" in timeline.summary()
+        current_timeline.set(None)
+        agent.read_from_storage(session_id="s1")
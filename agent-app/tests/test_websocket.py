@@ -0,0 +1,106 @@
+"""
+WebSocket会话测试文件
+
+这个文件测试WebSocket上的多轮对话、取消当前轮次，以及后续轮次不再从存储加载会话。
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from agno.run.response import RunEvent, RunResponse
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from api.websocket import SessionSocket, keep_session_loaded, reload_session_from_storage
+
+
+class _FakeAgent:
+    """模拟agent，记录从存储加载会话的次数"""
+
+    def __init__(self):
+        self.model = SimpleNamespace(id="gpt-4o")
+        self.session_id = "s1"
+        self.agent_session = None
+        self.run_response = None
+        self.storage_reads = 0
+
+    def read_from_storage(self, session_id, user_id=None):
+        self.storage_reads += 1
+        self.agent_session = SimpleNamespace(session_id=session_id)
+        return self.agent_session
+
+    async def arun(self, message, stream=True, stream_intermediate_steps=False):
+        self.read_from_storage(session_id=self.session_id)
+
+        async def _stream():
+            if message == "slow":
+                await asyncio.sleep(10)
+            yield RunResponse(event=RunEvent.run_response.value, content=f"echo {message}")
+            self.run_response = RunResponse(run_id="r1", session_id=self.session_id, content=f"echo {message}")
+
+        return _stream()
+
+
+def _client(agent):
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def socket(websocket: WebSocket):
+        await websocket.accept()
+        try:
+            await SessionSocket(websocket, agent, admission_key="sage").serve()
+        finally:
+            reload_session_from_storage(agent)
+
+    return TestClient(app)
+
+
+def _receive_turn(ws):
+    frames = []
+    while True:
+        frame = ws.receive_json()
+        frames.append(frame)
+        if frame["event"] in ("run_completed", "run_cancelled", "error"):
+            return frames
+
+
+class TestSessionSocket:
+    """WebSocket会话测试类"""
+
+    def test_turns_reuse_loaded_session(self):
+        """测试多轮对话只在第一轮从存储加载会话"""
+        agent = _FakeAgent()
+        with _client(agent).websocket_connect("/ws") as ws:
+            for turn, message in enumerate(("hi", "again", "bye"), start=1):
+                ws.send_json({"type": "message", "message": message})
+                frames = _receive_turn(ws)
+                assert all(frame["turn"] == turn for frame in frames)
+                assert frames[0] == {"event": "content", "turn": turn, "data": {"delta": f"echo {message}"}}
+                assert frames[-1]["event"] == "run_completed"
+
+        assert agent.storage_reads == 1
+        # 关闭后恢复从存储加载
+        assert "read_from_storage" not in agent.__dict__
+
+    def test_cancel_turn(self):
+        """测试取消正在运行的轮次后可以继续下一轮"""
+        agent = _FakeAgent()
+        with _client(agent).websocket_connect("/ws") as ws:
+            ws.send_json({"type": "message", "message": "slow"})
+            ws.send_json({"type": "message", "message": "too early"})
+            assert ws.receive_json()["data"]["message"] == "A turn is already running"
+            ws.send_json({"type": "cancel"})
+            assert _receive_turn(ws)[-1] == {"event": "run_cancelled", "turn": 1, "data": {}}
+
+            ws.send_json({"type": "message", "message": "hi"})
+            assert _receive_turn(ws)[-1]["event"] == "run_completed"
+
+    def test_session_change_reads_storage(self):
+        """测试会话id变化时仍然从存储加载"""
+        agent = _FakeAgent()
+        agent.read_from_storage(session_id="s1")
+        keep_session_loaded(agent)
+        agent.read_from_storage(session_id="s1")
+        assert agent.storage_reads == 1
+        agent.read_from_storage(session_id="s2")
+        assert agent.storage_reads == 2
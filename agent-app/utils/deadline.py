@@ -0,0 +1,167 @@
+from contextvars import ContextVar
+from functools import wraps
+from time import monotonic
+from typing import Any, Optional
+
+from utils.log import logger
+
+# Deadline of the request being served in the current context
+current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised by a stage that can't start because the deadline of its request has passed"""
+
+
+class Deadline:
+    """
+    Time budget of one request, shared by every layer that serves it: admission, agent construction, model calls,
+    tool calls, workflow stages and database calls. Each layer bounds its own timeout by the remaining budget.
+
+    Creating a deadline makes it the deadline of the current context, so instrumented code sees it.
+
+    Args:
+        seconds: The budget of the request, from now
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = monotonic() + seconds
+        current_deadline.set(self)
+
+    def remaining(self) -> float:
+        """Seconds left, 0 once expired"""
+        return max(0.0, self.expires - monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return monotonic() >= self.expires
+
+    def budget(self, timeout: Optional[float]) -> float:
+        """A timeout of a layer bounded by the remaining budget, the remaining budget when the layer has none"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def check(self, stage: str) -> None:
+        """
+        Raise before starting a stage when no budget is left.
+
+        Raises:
+            DeadlineExceeded: If the deadline has passed
+        """
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.seconds}s exceeded before {stage}")
+
+
+def budget(timeout: Optional[float]) -> Optional[float]:
+    """A timeout bounded by the deadline of the current context, if any"""
+    deadline = current_deadline.get()
+    return timeout if deadline is None else deadline.budget(timeout)
+
+
+def expired() -> bool:
+    """Whether the deadline of the current context, if any, has passed"""
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.expired
+
+
+def statement_timeout_ms(deadline: Deadline, server_timeout_ms: int, min_timeout_ms: int) -> Optional[int]:
+    """
+    Statement timeout of a database transaction under a deadline, None when the server default is already as tight.
+
+    Args:
+        deadline: The deadline of the request
+        server_timeout_ms: The statement_timeout of the server, 0 when it has none
+        min_timeout_ms: Floor of the timeout
+    """
+    timeout_ms = max(min_timeout_ms, int(deadline.remaining() * 1000))
+    if 0 < server_timeout_ms <= timeout_ms:
+        return None
+    return timeout_ms
+
+
+_deadlines_instrumented = False
+
+
+def instrument_deadlines(min_db_timeout_ms: int = 500, engine: Optional[Any] = None) -> None:
+    """
+    Bound tool calls, OpenAI requests and the database statements of an engine by the deadline of the current request.
+
+    Args:
+        min_db_timeout_ms: Floor of the statement timeout, so the partial answer of an expired run can still be stored
+        engine: The SQLAlchemy engine whose statements are bounded, None to leave database statements alone
+    """
+    global _deadlines_instrumented
+    if _deadlines_instrumented:
+        return
+    _deadlines_instrumented = True
+
+    import asyncio
+
+    from agno.models.openai import OpenAIChat
+    from agno.tools.function import FunctionCall, FunctionExecutionResult
+    from sqlalchemy import event
+
+    def skipped(call: FunctionCall) -> FunctionExecutionResult:
+        # The model sees the error as the result of the tool and answers with what it has
+        call.error = "Deadline exceeded, the tool was not run"
+        call.result = call.error
+        logger.info(f"Skipped {call.get_call_str()}: deadline exceeded")
+        return FunctionExecutionResult(status="failure", error=call.error)
+
+    aexecute = FunctionCall.aexecute
+    execute = FunctionCall.execute
+
+    @wraps(aexecute)
+    async def aexecute_until_deadline(self: FunctionCall) -> FunctionExecutionResult:
+        deadline = current_deadline.get()
+        if deadline is None:
+            return await aexecute(self)
+        if deadline.expired:
+            return skipped(self)
+        try:
+            return await asyncio.wait_for(aexecute(self), deadline.remaining())
+        except asyncio.TimeoutError:
+            return skipped(self)
+
+    @wraps(execute)
+    def execute_until_deadline(self: FunctionCall) -> FunctionExecutionResult:
+        # A blocking tool can't be interrupted once started, it's only not started after the deadline
+        if expired():
+            return skipped(self)
+        return execute(self)
+
+    FunctionCall.aexecute = aexecute_until_deadline  # type: ignore
+    FunctionCall.execute = execute_until_deadline  # type: ignore
+
+    get_request_kwargs = OpenAIChat.get_request_kwargs
+
+    @wraps(get_request_kwargs)
+    def request_kwargs_until_deadline(self: OpenAIChat, *args: Any, **kwargs: Any) -> Any:
+        request_kwargs = get_request_kwargs(self, *args, **kwargs)
+        deadline = current_deadline.get()
+        if deadline is not None:
+            request_kwargs["timeout"] = max(0.001, deadline.budget(request_kwargs.get("timeout", self.timeout)))
+        return request_kwargs
+
+    OpenAIChat.get_request_kwargs = request_kwargs_until_deadline  # type: ignore
+
+    if engine is None or engine.dialect.name != "postgresql":
+        return
+
+    @event.listens_for(engine, "begin")
+    def statement_timeout(conn: Any) -> None:
+        deadline = current_deadline.get()
+        if deadline is None:
+            return
+        # The default of the server, read once per pooled connection
+        server_timeout_ms = conn.info.get("server_statement_timeout_ms")
+        if server_timeout_ms is None:
+            server_timeout_ms = int(
+                conn.exec_driver_sql("SELECT setting FROM pg_settings WHERE name = 'statement_timeout'").scalar()
+            )
+            conn.info["server_statement_timeout_ms"] = server_timeout_ms
+        timeout_ms = statement_timeout_ms(deadline, server_timeout_ms, min_db_timeout_ms)
+        if timeout_ms is not None:
+            # Scoped to the transaction, the connection goes back to the pool without it
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
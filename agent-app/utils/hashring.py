@@ -0,0 +1,54 @@
+import hashlib
+from bisect import bisect
+from typing import Iterable, List, Optional, Tuple
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to members.
+
+    Every member is placed on the ring `virtual_nodes` times, and a key belongs to the first member point at or
+    after its hash. Adding or removing one of N members only moves about 1/N of the keys, all to or from that member.
+
+    Args:
+        members: The initial members, e.g. worker or node URLs
+        virtual_nodes: Points per member, more points spread the keys more evenly
+    """
+
+    def __init__(self, members: Iterable[str] = (), virtual_nodes: int = 64):
+        self.virtual_nodes = virtual_nodes
+        self._points: List[Tuple[int, str]] = []
+        self._members: List[str] = []
+        for member in members:
+            self.add(member)
+
+    @property
+    def members(self) -> List[str]:
+        return list(self._members)
+
+    def add(self, member: str) -> None:
+        if member in self._members:
+            return
+        self._members.append(member)
+        self._points.extend((_hash(f"{member}#{i}"), member) for i in range(self.virtual_nodes))
+        self._points.sort()
+
+    def remove(self, member: str) -> None:
+        if member not in self._members:
+            return
+        self._members.remove(member)
+        self._points = [point for point in self._points if point[1] != member]
+
+    def lookup(self, key: str) -> Optional[str]:
+        """The member owning a key, None when the ring is empty"""
+        if not self._points:
+            return None
+        index = bisect(self._points, (_hash(key), "")) % len(self._points)
+        return self._points[index][1]
+
+    def __len__(self) -> int:
+        return len(self._members)
@@ -0,0 +1,62 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Fields of /proc/<pid>/smaps_rollup summed into the shared and private memory of a process
+_SHARED_FIELDS = ("Shared_Clean", "Shared_Dirty")
+_PRIVATE_FIELDS = ("Private_Clean", "Private_Dirty")
+
+
+def process_memory(pid: Union[int, str] = "self") -> Optional[Dict[str, float]]:
+    """
+    Resident, proportional, shared and private memory of a process in MiB, from /proc/<pid>/smaps_rollup.
+
+    Shared memory is the part of the resident memory also mapped by other processes, e.g. the pages a forked
+    worker still shares with its parent. PSS splits the shared pages between the processes sharing them, so the
+    sum of the PSS of all workers is their actual footprint.
+
+    Args:
+        pid: The process id, by default the current process
+
+    Returns:
+        The memory of the process, or None where smaps_rollup isn't available (not Linux, or the process is gone)
+    """
+    try:
+        lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return None
+    kib: Dict[str, int] = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        fields = value.split()
+        if fields and fields[0].isdigit():
+            kib[name] = int(fields[0])
+    return {
+        "rss": kib.get("Rss", 0) / 1024,
+        "pss": kib.get("Pss", 0) / 1024,
+        "shared": sum(kib.get(name, 0) for name in _SHARED_FIELDS) / 1024,
+        "private": sum(kib.get(name, 0) for name in _PRIVATE_FIELDS) / 1024,
+    }
+
+
+def memory_report(processes: Iterable[Tuple[str, int]], title: str) -> str:
+    """
+    Format the memory of processes as a table, with their total PSS.
+
+    Args:
+        processes: (label, pid) of each process
+        title: Title of the report
+    """
+    lines: List[str] = [title, f"{'process':<16}{'pid':>8}{'rss':>10}{'pss':>10}{'shared':>10}{'private':>10}  (MiB)"]
+    total_pss = 0.0
+    for label, pid in processes:
+        memory = process_memory(pid)
+        if memory is None:
+            lines.append(f"{label:<16}{pid:>8}  unavailable")
+            continue
+        total_pss += memory["pss"]
+        lines.append(
+            f"{label:<16}{pid:>8}{memory['rss']:>10.1f}{memory['pss']:>10.1f}"
+            f"{memory['shared']:>10.1f}{memory['private']:>10.1f}"
+        )
+    lines.append(f"{'total pss':<24}{total_pss:>20.1f}")
+    return "\n".join(lines)
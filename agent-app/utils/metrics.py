@@ -0,0 +1,212 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Bucket upper bounds in seconds, for durations from a few milliseconds to minutes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0, 300.0)
+# Bucket upper bounds in output tokens per second
+RATE_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0, 80.0, 100.0, 150.0, 200.0, 400.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# The agent or team a unit of work is done for, used to label measurements that can't see it directly
+current_target: ContextVar[Tuple[str, str]] = ContextVar("current_target", default=("", ""))
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets. Observing a value is a bisect and two additions."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Process-wide registry of histograms and gauges, keyed by metric name and labels.
+
+    Exposed in the Prometheus text format by `render`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        """Declare a histogram"""
+        self._histograms[name] = {}
+        self._buckets[name] = buckets
+        self._help[name] = help
+
+    def gauge(self, name: str, help: str) -> None:
+        """Declare a gauge"""
+        self._gauges[name] = {}
+        self._help[name] = help
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def add(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._gauges[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def get(self, name: str, **labels: str) -> Optional[Any]:
+        """Returns the histogram or gauge value of a series, mostly for tests"""
+        key = tuple(sorted(labels.items()))
+        if name in self._histograms:
+            return self._histograms[name].get(key)
+        return self._gauges[name].get(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for series in list(self._histograms.values()) + list(self._gauges.values()):
+                series.clear()
+
+    def render(self) -> str:
+        """Render all series in the Prometheus text exposition format"""
+
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(labels, (('le', repr(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{fmt(labels)} {histogram.count}")
+            for name, values in self._gauges.items():
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in values.items():
+                    lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.histogram("run_duration_seconds", "Duration of agent and team runs")
+metrics.histogram("run_time_to_first_token_seconds", "Time from the start of a run to its first content")
+metrics.histogram("run_output_tokens_per_second", "Output tokens per second of model calls", RATE_BUCKETS)
+metrics.histogram("tool_call_duration_seconds", "Duration of tool calls")
+metrics.histogram("model_call_duration_seconds", "Duration of model calls")
+metrics.histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a database connection")
+metrics.gauge("runs_in_flight", "Agent and team runs executing")
+
+
+def _record_response(kind: str, target: str, response: Any) -> None:
+    """Record the model calls and tool calls of a run response and of its member responses"""
+    for message in getattr(response, "messages", None) or []:
+        if message.role != "assistant" or message.from_history or message.metrics.time is None:
+            continue
+        labels = {"kind": kind, "id": target, "provider": response.model_provider or "", "model": response.model or ""}
+        metrics.observe("model_call_duration_seconds", message.metrics.time, **labels)
+        if message.metrics.output_tokens and message.metrics.time > 0:
+            metrics.observe(
+                "run_output_tokens_per_second",
+                message.metrics.output_tokens / message.metrics.time,
+                kind=kind,
+                id=target,
+            )
+    for tool in getattr(response, "tools", None) or []:
+        if tool.metrics is not None and tool.metrics.time is not None:
+            metrics.observe("tool_call_duration_seconds", tool.metrics.time, kind=kind, id=target, tool=tool.tool_name)
+    for member_response in getattr(response, "member_responses", None) or []:
+        _record_response(kind, target, member_response)
+
+
+class RunTracker:
+    """
+    Measures one run of an agent or team: in-flight count, duration, time to first token, and the model and tool
+    calls found in its response.
+
+    Args:
+        kind: "agent" or "team"
+        target: The agent or team id
+    """
+
+    def __init__(self, kind: str, target: str):
+        self.kind = kind
+        self.target = target
+        self.started = perf_counter()
+        self.first_token: Optional[float] = None
+        self.finished = False
+        current_target.set((kind, target))
+        metrics.add("runs_in_flight", 1, kind=kind, id=target)
+
+    def token(self) -> None:
+        """Mark that content was produced, the first call records the time to first token"""
+        if self.first_token is None:
+            self.first_token = perf_counter() - self.started
+            metrics.observe("run_time_to_first_token_seconds", self.first_token, kind=self.kind, id=self.target)
+
+    def finish(self, runner: Any = None) -> None:
+        """Record the run as done. Idempotent."""
+        if self.finished:
+            return
+        self.finished = True
+        metrics.add("runs_in_flight", -1, kind=self.kind, id=self.target)
+        metrics.observe("run_duration_seconds", perf_counter() - self.started, kind=self.kind, id=self.target)
+        response = getattr(runner, "run_response", None)
+        if response is not None:
+            try:
+                _record_response(self.kind, self.target, response)
+            except Exception:
+                # Metrics never fail a run
+                pass
+
+
+_db_pools_instrumented = False
+
+
+def instrument_db_pools() -> None:
+    """Measure the wait for a connection of every SQLAlchemy pool, including the ones of agno storages"""
+    global _db_pools_instrumented
+    if _db_pools_instrumented:
+        return
+    _db_pools_instrumented = True
+
+    from sqlalchemy.pool import Pool
+
+    connect = Pool.connect
+
+    @wraps(connect)
+    def timed_connect(self: Pool) -> Any:
+        start = perf_counter()
+        try:
+            return connect(self)
+        finally:
+            kind, target = current_target.get()
+            metrics.observe("db_pool_checkout_wait_seconds", perf_counter() - start, kind=kind, id=target)
+
+    Pool.connect = timed_connect  # type: ignore
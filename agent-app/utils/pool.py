@@ -0,0 +1,157 @@
+from copy import copy
+from dataclasses import dataclass
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, Generic, Hashable, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class PoolStats:
+    """Counters collected by an InstancePool."""
+
+    hits: int = 0
+    misses: int = 0
+    rebinds: int = 0
+    discarded: int = 0
+    construction_seconds: float = 0.0
+
+
+class InstancePool(Generic[T]):
+    """
+    Process-wide pool of reusable instances, keyed by a hashable key.
+
+    Instances are lent out exclusively: `acquire` pops an idle instance for the key (or builds one
+    with the factory on a miss), restores its per-session attributes to the values they had right
+    after construction, applies the request bindings and returns it. `release` hands it back.
+    An instance is never shared between two concurrent callers.
+
+    Args:
+        name: Name of the pool, used in stats
+        reset_attributes: Attributes restored to their post-construction values on every acquire
+        max_idle_per_key: Maximum number of idle instances kept per key
+    """
+
+    def __init__(self, name: str, reset_attributes: Sequence[str] = (), max_idle_per_key: int = 4):
+        self.name = name
+        self.reset_attributes = tuple(reset_attributes)
+        self.max_idle_per_key = max_idle_per_key
+
+        self._lock = Lock()
+        self._idle: Dict[Hashable, List[T]] = {}
+        self._leased: Dict[int, Tuple[Hashable, Dict[str, Any]]] = {}
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self._stats = PoolStats()
+
+    def acquire(self, key: Hashable, factory: Callable[[], T], **bindings: Any) -> T:
+        """
+        Lend an instance for the given key.
+
+        Args:
+            key: Pool key, e.g. (agent type, model id)
+            factory: Builds a new instance on a pool miss
+            **bindings: Attributes set on the instance for this lease, e.g. user_id and session_id
+
+        Returns:
+            T: An instance bound to the given attributes
+        """
+        instance = None
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                instance = idle.pop()
+                snapshot = self._snapshots.pop(id(instance))
+                self._stats.hits += 1
+
+        if instance is None:
+            start = perf_counter()
+            instance = factory()
+            elapsed = perf_counter() - start
+            snapshot = {attr: getattr(instance, attr) for attr in self.reset_attributes if hasattr(instance, attr)}
+            with self._lock:
+                self._stats.misses += 1
+                self._stats.construction_seconds += elapsed
+
+        self._bind(instance, snapshot, bindings)
+        with self._lock:
+            self._leased[id(instance)] = (key, snapshot)
+        return instance
+
+    def rebind(self, instance: T, **bindings: Any) -> T:
+        """
+        Bind a leased instance to new attributes without returning it to the pool.
+
+        This resets the per-session attributes exactly like a fresh `acquire`, so a caller running many
+        requests in a row can keep its instance.
+
+        Args:
+            instance: An instance previously returned by `acquire`
+            **bindings: Attributes set on the instance, e.g. user_id and session_id
+
+        Returns:
+            T: The same instance, bound to the given attributes
+        """
+        with self._lock:
+            _, snapshot = self._leased[id(instance)]
+            self._stats.rebinds += 1
+        self._bind(instance, snapshot, bindings)
+        return instance
+
+    @staticmethod
+    def _bind(instance: T, snapshot: Dict[str, Any], bindings: Dict[str, Any]) -> None:
+        for attr, value in snapshot.items():
+            setattr(instance, attr, copy(value))
+        for attr, value in bindings.items():
+            setattr(instance, attr, value)
+
+    def release(self, instance: T) -> None:
+        """
+        Return a leased instance to the pool. Instances beyond `max_idle_per_key` are dropped.
+
+        Args:
+            instance: An instance previously returned by `acquire`
+        """
+        with self._lock:
+            leased = self._leased.pop(id(instance), None)
+            if leased is None:
+                return
+            key, snapshot = leased
+            idle = self._idle.setdefault(key, [])
+            if len(idle) >= self.max_idle_per_key:
+                self._stats.discarded += 1
+                return
+            idle.append(instance)
+            self._snapshots[id(instance)] = snapshot
+
+    def clear(self) -> None:
+        """Drop all idle instances and reset the stats."""
+        with self._lock:
+            self._idle.clear()
+            self._snapshots.clear()
+            self._stats = PoolStats()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the pool counters as a dict."""
+        with self._lock:
+            lookups = self._stats.hits + self._stats.misses
+            return {
+                "name": self.name,
+                "hits": self._stats.hits,
+                "misses": self._stats.misses,
+                "hit_rate": self._stats.hits / lookups if lookups else 0.0,
+                "rebinds": self._stats.rebinds,
+                "discarded": self._stats.discarded,
+                "in_use": len(self._leased),
+                "idle": sum(len(v) for v in self._idle.values()),
+                "construction_seconds_total": self._stats.construction_seconds,
+                "construction_ms_avg": (
+                    self._stats.construction_seconds / self._stats.misses * 1000 if self._stats.misses else 0.0
+                ),
+                # Time that would have been spent constructing instances that were served from the pool
+                "construction_seconds_saved": (
+                    self._stats.construction_seconds / self._stats.misses * (self._stats.hits + self._stats.rebinds)
+                    if self._stats.misses
+                    else 0.0
+                ),
+            }
@@ -0,0 +1,160 @@
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from agno.agent import Agent
+from agno.playground import Playground, PlaygroundSettings
+from agno.team import Team
+
+from utils.log import logger
+
+
+class LazyInstance:
+    """
+    Stands in for an agent or team that is built on first use.
+
+    The id and name are known up front, so looking an instance up by id doesn't build anything. Any other attribute
+    access builds the instance once, thread-safely, and is forwarded to it. Agno's catalogue routes,
+    GET /playground/agents and /playground/teams, report the tools and model of every instance, so the first listing
+    builds them all; the playground_warmup setting builds them at startup instead.
+
+    Args:
+        id_attribute: "agent_id" or "team_id"
+        id: The id of the agent or team
+        name: The display name of the agent or team
+        factory: Builds the instance
+    """
+
+    __slots__ = ("_id_attribute", "_id", "_name", "_factory", "_on_build", "_instance", "_lock", "_build_seconds")
+
+    def __init__(self, id_attribute: str, id: str, name: str, factory: Callable[[], Any]):
+        object.__setattr__(self, "_id_attribute", id_attribute)
+        object.__setattr__(self, "_id", id)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_on_build", None)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", Lock())
+        object.__setattr__(self, "_build_seconds", None)
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        """Returns the instance, building it on the first call"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = perf_counter()
+                    instance = self._factory()
+                    if self._on_build is not None:
+                        self._on_build(instance)
+                    object.__setattr__(self, "_build_seconds", perf_counter() - start)
+                    object.__setattr__(self, "_instance", instance)
+                    logger.debug(f"Built {self._id} in {self._build_seconds:.3f}s")
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes not found on the proxy itself
+        if self._instance is None:
+            if name == self._id_attribute:
+                return self._id
+            if name == "name":
+                return self._name
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.get(), name, value)
+
+    def __repr__(self) -> str:
+        return f"LazyInstance({self._id_attribute}={self._id!r}, built={self.built})"
+
+
+def registry_stats(instances: Iterable[LazyInstance]) -> Dict[str, Optional[float]]:
+    """Build time in seconds of every instance, None for the ones not built yet"""
+    return {instance._id: instance._build_seconds for instance in instances}
+
+
+def warm_up(instances: Iterable[LazyInstance], background: bool = True) -> Optional[Thread]:
+    """
+    Build the given instances ahead of their first use.
+
+    Args:
+        instances: The instances to build
+        background: Build in a daemon thread and return it, instead of blocking the caller
+
+    Returns:
+        The warmup thread when building in the background
+    """
+    instances = list(instances)
+
+    def build_all() -> None:
+        for instance in instances:
+            try:
+                instance.get()
+            except Exception as e:
+                # A failed warmup is retried on first use
+                logger.warning(f"Warmup of {instance._id} failed: {e}")
+
+    if not background:
+        build_all()
+        return None
+    thread = Thread(target=build_all, name="registry-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class LazyPlayground(Playground):
+    """
+    Playground over lazily built agents and teams.
+
+    Agno's Playground initializes every agent and team in its constructor, so that constructor isn't called: the
+    attributes it sets are set here, and the initialization is done when an instance is built instead, so the
+    playground router is available right away.
+    """
+
+    def __init__(
+        self,
+        agents: List[LazyInstance],
+        teams: List[LazyInstance],
+        settings: Optional[PlaygroundSettings] = None,
+        app_id: Optional[str] = None,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        monitoring: bool = True,
+    ):
+        if not agents and not teams:
+            raise ValueError("Either agents or teams must be provided.")
+        self.agents = agents  # type: ignore
+        self.teams = teams  # type: ignore
+        self.workflows = None
+        self.settings = settings or PlaygroundSettings()
+        self.api_app = None
+        self.router = None
+        self.endpoints_created = None
+        self.app_id = app_id
+        self.name = name
+        self.description = description
+        self.monitoring = monitoring
+        self.set_app_id()
+        for agent in agents:
+            object.__setattr__(agent, "_on_build", self.initialize_agent)
+        for team in teams:
+            object.__setattr__(team, "_on_build", self.initialize_team)
+
+    def initialize_agent(self, agent: Agent) -> None:
+        if not agent.app_id:
+            agent.app_id = self.app_id
+        agent.initialize_agent()
+
+    def initialize_team(self, team: Team) -> None:
+        if not team.app_id:
+            team.app_id = self.app_id
+        team.initialize_team()
+        for member in team.members:
+            if isinstance(member, Agent):
+                member.team_id = None
+                self.initialize_agent(member)
+            elif isinstance(member, Team):
+                member.initialize_team()
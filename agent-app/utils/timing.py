@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from random import random
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.log import logger
+
+# Timeline of the request being served in the current context
+current_timeline: ContextVar[Optional["PhaseTimeline"]] = ContextVar("current_timeline", default=None)
+
+
+class PhaseTimeline:
+    """
+    Durations of the phases of one request: admission, agent construction, session load, model calls, tool calls
+    and the storage write. Time not attributed to a phase is reported as `other`.
+
+    Creating a timeline makes it the timeline of the current context, so instrumented code records into it.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.total: Optional[float] = None
+        current_timeline.set(self)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as a phase"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def add_response(self, response: Any) -> None:
+        """Add the model calls and tool calls of a run response, including the ones of team members"""
+        for message in getattr(response, "messages", None) or []:
+            if message.role == "assistant" and not message.from_history and message.metrics.time is not None:
+                self.add("model", message.metrics.time)
+        for tool in getattr(response, "tools", None) or []:
+            if tool.metrics is not None and tool.metrics.time is not None:
+                self.add(f"tool.{tool.tool_name}", tool.metrics.time)
+        for member_response in getattr(response, "member_responses", None) or []:
+            self.add_response(member_response)
+
+    def finish(self, runner: Any = None) -> "PhaseTimeline":
+        """Stop the clock and add the calls found in the response of the runner. Idempotent."""
+        if self.total is None:
+            self.total = perf_counter() - self.started
+            response = getattr(runner, "run_response", None)
+            if response is not None:
+                self.add_response(response)
+        return self
+
+    def summary(self) -> Dict[str, float]:
+        """Milliseconds per phase, summed over repeated phases, with `other` and `total`"""
+        total = self.total if self.total is not None else perf_counter() - self.started
+        durations: Dict[str, float] = {}
+        for name, seconds in self.phases:
+            durations[name] = durations.get(name, 0.0) + seconds
+        # Tool calls run within model turns of the run, but not within the model calls themselves
+        attributed = sum(durations.values())
+        durations["other"] = max(0.0, total - attributed)
+        durations["total"] = total
+        return {name: round(seconds * 1000, 2) for name, seconds in durations.items()}
+
+    def server_timing(self) -> str:
+        """Format the summary as a Server-Timing header value"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.summary().items())
+
+    def log(self, label: str, sample_rate: float) -> None:
+        """Log the summary on one line for a `sample_rate` fraction of the calls"""
+        if sample_rate > 0 and random() < sample_rate:
+            logger.info(f"Run timing {label} " + " ".join(f"{name}={ms}ms" for name, ms in self.summary().items()))
+
+
+_runners_instrumented = False
+
+
+def instrument_runners() -> None:
+    """Time the session reads and writes of agents and teams in the timeline of the current request"""
+    global _runners_instrumented
+    if _runners_instrumented:
+        return
+    _runners_instrumented = True
+
+    from agno.agent import Agent
+    from agno.team import Team
+
+    def timed(method: Any, name: str) -> Any:
+        @wraps(method)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            timeline = current_timeline.get()
+            if timeline is None:
+                return method(*args, **kwargs)
+            with timeline.phase(name):
+                return method(*args, **kwargs)
+
+        return wrapper
+
+    for cls in (Agent, Team):
+        cls.read_from_storage = timed(cls.read_from_storage, "session_load")  # type: ignore
+        cls.write_to_storage = timed(cls.write_to_storage, "storage_write")  # type: ignore
@@ -12,6 +12,7 @@ from agno.workflow import RunEvent, RunResponse, Workflow
 from pydantic import BaseModel, Field
 
 from db.session import db_url
+from utils.deadline import expired
 from workflows.settings import workflow_settings
 
 
@@ -203,6 +204,14 @@ class BlogPostGenerator(Workflow):
 
         # Scrape the search results
         scraped_articles: Dict[str, ScrapedArticle] = self.scrape_articles(topic, search_results, use_scrape_cache)
+        # Out of time for writing the post, the articles found are the best answer there is
+        if expired():
+            logger.warning("Deadline exceeded, returning the articles found")
+            yield RunResponse(
+                event=RunEvent.workflow_completed,
+                content="\n".join(f"- [{article.title}]({article.url})" for article in search_results.articles),
+            )
+            return
 
         # Prepare the input for the writer
         writer_input = {
@@ -269,6 +278,9 @@ class BlogPostGenerator(Workflow):
 
         # If there are no cached search_results, use the searcher to find the latest articles
         for attempt in range(num_attempts):
+            if attempt > 0 and expired():
+                logger.warning("Deadline exceeded, no more search attempts")
+                break
             try:
                 searcher_response: RunResponse = self.searcher.run(topic)
                 if (
@@ -307,6 +319,10 @@ class BlogPostGenerator(Workflow):
 
         # Scrape the articles that are not in the cache
         for article in search_results.articles:
+            # Stop scraping once the deadline passed, the caller answers with the articles found
+            if expired():
+                logger.warning(f"Deadline exceeded, scraped {len(scraped_articles)} articles")
+                break
             if article.url in scraped_articles:
                 logger.info(f"Found scraped article in cache: {article.url}")
                 continue
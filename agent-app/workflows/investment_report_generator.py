@@ -9,6 +9,7 @@ from agno.utils.log import logger
 from agno.workflow import Workflow
 
 from db.session import db_url
+from utils.deadline import expired
 from workflows.settings import workflow_settings
 
 
@@ -130,12 +131,21 @@ class InvestmentReportGenerator(Workflow):
                 content="Sorry, could not get the stock analyst report.",
             )
             return
+        # Out of time for the next stages, the report so far is the best answer there is
+        if expired():
+            logger.warning("Deadline exceeded, returning the stock analyst report")
+            yield RunResponse(run_id=self.run_id, content=initial_report.content)
+            return
 
         logger.info("Ranking companies based on investment potential.")
         ranked_companies: RunResponse = self.research_analyst.run(initial_report.content)
         if ranked_companies is None or not ranked_companies.content:
             yield RunResponse(run_id=self.run_id, content="Sorry, could not get the ranked companies.")
             return
+        if expired():
+            logger.warning("Deadline exceeded, returning the ranked companies")
+            yield RunResponse(run_id=self.run_id, content=ranked_companies.content)
+            return
 
         logger.info("Reviewing the research report and producing an investment proposal.")
         yield from self.investment_lead.run(ranked_companies.content, stream=True)
@@ -218,7 +218,7 @@ prd_fastapi = FastApi(
     name=f"{ws_settings.prd_key}-api",
     group="api",
     image=prd_image,
-    command="uvicorn api.main:app --workers 2",
+    command="python -m api.serve --workers 2",
     port_number=8000,
     ecs_task_cpu="1024",
     ecs_task_memory="2048",